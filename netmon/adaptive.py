@@ -0,0 +1,133 @@
+import math
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional
+
+
+class AdaptiveCadence:
+    """Picks the next interval of a health-check job from its last outcome.
+
+    A failure (or latency anomaly) drops straight to ``minimum`` so a broken
+    service is watched closely. Each healthy run after that doubles the
+    interval back towards ``base``, and once ``calm_runs`` healthy runs in a
+    row have happened at ``base`` or above, the interval keeps growing by
+    ``backoff`` up to ``maximum``.
+    """
+
+    def __init__(self, base: float, minimum: float, maximum: float,
+                 backoff: float = 1.5, calm_runs: int = 3):
+        self.base = base
+        self.minimum = min(minimum, base)
+        self.maximum = max(maximum, base)
+        self.backoff = backoff
+        self.calm_runs = calm_runs
+        self.interval = base
+        self.healthy_streak = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.interval < self.base:
+            return 'degraded' if self.healthy_streak == 0 else 'recovering'
+        return 'backoff' if self.interval > self.base else 'normal'
+
+    def observe(self, healthy: bool) -> float:
+        with self._lock:
+            if not healthy:
+                self.healthy_streak = 0
+                self.interval = self.minimum
+            elif self.interval < self.base:
+                self.healthy_streak += 1
+                self.interval = min(self.base, self.interval * 2)
+            else:
+                self.healthy_streak += 1
+                if self.healthy_streak >= self.calm_runs:
+                    self.interval = min(self.maximum, self.interval * self.backoff)
+            return self.interval
+
+
+class LatencyBaseline:
+    """Flags latencies far above a check's usual level.
+
+    Keeps an exponentially weighted mean and variance per key; a sample is
+    anomalous when it exceeds the mean by ``threshold`` standard deviations
+    and by at least ``floor`` in absolute terms (so a 2 ms service going to
+    3 ms is not an incident). Anomalies are not folded into the baseline.
+    """
+
+    def __init__(self, alpha: float = 0.1, threshold: float = 4.0, floor: float = 50.0,
+                 warmup: int = 10):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.floor = floor
+        self.warmup = warmup
+        self._stats: Dict[Hashable, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key: Hashable, value: float) -> bool:
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                self._stats[key] = [1, value, 0.0]
+                return False
+            count, mean, variance = stats
+            deviation = value - mean
+            if (count >= self.warmup and deviation > self.floor
+                    and deviation > self.threshold * math.sqrt(variance)):
+                return True
+            mean += self.alpha * deviation
+            variance = (1 - self.alpha) * (variance + self.alpha * deviation * deviation)
+            self._stats[key] = [count + 1, mean, variance]
+            return False
+
+
+class TokenBucket:
+    """Allows ``capacity`` runs in a burst, refilled one every ``refill`` seconds."""
+
+    def __init__(self, capacity: float, refill: float, clock: Callable[[], float] = time.monotonic):
+        # A bucket that never refills would answer wait_time() with 0 forever
+        if refill <= 0:
+            raise ValueError(f'refill must be positive, not {refill}')
+        self.capacity = capacity
+        self.refill = refill
+        self.tokens = capacity
+        self.clock = clock
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _update(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.refill)
+        self.updated = now
+
+    def take(self) -> bool:
+        with self._lock:
+            self._update()
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def wait_time(self) -> float:
+        """Seconds until the next token is available."""
+        with self._lock:
+            self._update()
+            return max(0.0, (1 - self.tokens) * self.refill)
+
+
+class Cooldown:
+    """Remembers when each key last ran and refuses it again within ``period``."""
+
+    def __init__(self, period: float):
+        self.period = period
+        self._last: Dict[Hashable, float] = {}
+        self._lock = threading.Lock()
+
+    def ready(self, key: Hashable, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and now - last < self.period:
+                return False
+            self._last[key] = now
+            return True
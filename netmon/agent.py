@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Probe agent: runs netmon's scans and service probes from another vantage point.
+
+The agent asks the netmon app for work (POST /api/agents/<id>/lease), scans
+its share of the network with the built-in scanner or runs the service
+probes, and sends the results back in gzip-compressed batches. While agents
+are connected the app splits every network scan into subnets that they
+pull one at a time, so N agents finish a sweep in about 1/N of the time.
+Start as many as needed, on other hosts or side by side on one:
+
+    NETMON_AGENT_TOKEN=secret python3 agent.py http://netmon:5000 --id site-b
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from scanner import Scanner
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts')
+KINDS = ('scan', 'probes')
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_BATCH_INTERVAL = 2.0
+HEARTBEAT_INTERVAL = 15.0   # keep well under the app's NETMON_AGENT_LEASE
+LEASE_WAIT = 20.0           # the app holds a lease request this long when idle
+MAX_PENDING_RESULTS = 1000
+MAX_BACKOFF = 60.0
+REPORT_FIELDS = ('target', 'full', 'changed', 'diffs', 'scanned_hosts', 'port_scanned_hosts',
+                 'fingerprinted_ports', 'duration')
+
+
+class ResultUploader:
+    """Sends results to the app in batches from a background thread.
+
+    A batch goes out once ``batch_size`` results are waiting or ``interval``
+    seconds after the oldest of them arrived. With nothing to send, an empty
+    batch every ``heartbeat`` seconds keeps the agent's leases alive while it
+    works on a long unit. Batches that could not be delivered are retried
+    with backoff; at most ``max_pending`` results are kept meanwhile.
+    """
+
+    def __init__(self, send: Callable[[List[Dict]], None], batch_size: int = DEFAULT_BATCH_SIZE,
+                 interval: float = DEFAULT_BATCH_INTERVAL, heartbeat: float = HEARTBEAT_INTERVAL,
+                 max_pending: int = MAX_PENDING_RESULTS):
+        self.send = send
+        self.batch_size = batch_size
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.max_pending = max_pending
+        self.pending: List[Dict] = []
+        self._queue: 'queue.Queue[Dict]' = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name='uploader', daemon=True)
+        self._thread.start()
+
+    def put(self, result: Dict) -> None:
+        self._queue.put(result)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Send what is left (one attempt) and stop."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        last_sent = time.monotonic()
+        oldest: Optional[float] = None
+        backoff = 0.0
+        while True:
+            now = time.monotonic()
+            if self.pending:
+                timeout = oldest + self.interval - now
+            else:
+                timeout = last_sent + self.heartbeat - now
+            try:
+                self.pending.append(self._queue.get(timeout=0.5 if self._stopped.is_set()
+                                                    else max(0.0, min(timeout, 1.0))))
+                while len(self.pending) < self.batch_size:
+                    self.pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            now = time.monotonic()
+            if self.pending and oldest is None:
+                oldest = now
+            stopping = self._stopped.is_set() and self._queue.empty()
+            due = (len(self.pending) >= self.batch_size or stopping
+                   or (self.pending and now - oldest >= self.interval)
+                   or (not self.pending and now - last_sent >= self.heartbeat))
+            if not due:
+                continue
+            batch = self.pending[:self.batch_size]
+            try:
+                self.send(batch)
+            except requests.RequestException as e:
+                if stopping:
+                    logging.warning(f"Dropping {len(self.pending)} unsent results on shutdown: {e}")
+                    return
+                backoff = min(MAX_BACKOFF, max(1.0, backoff * 2))
+                logging.warning(f"Could not send results ({e}), retrying in {backoff:.0f}s")
+                if len(self.pending) > self.max_pending:
+                    logging.warning(f"Dropping {len(self.pending) - self.max_pending} oldest results")
+                    del self.pending[:len(self.pending) - self.max_pending]
+                self._stopped.wait(backoff)
+                continue
+            backoff = 0.0
+            del self.pending[:len(batch)]
+            last_sent = now
+            oldest = now if self.pending else None
+            if stopping and not self.pending:
+                return
+
+
+class Agent:
+    def __init__(self, server: str, agent_id: str, token: Optional[str] = None,
+                 kinds=KINDS, services: Optional[List[str]] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE, batch_interval: float = DEFAULT_BATCH_INTERVAL):
+        self.server = server.rstrip('/')
+        self.id = agent_id
+        self.kinds = list(kinds)
+        self.services = services
+        self.session = requests.Session()
+        if token:
+            self.session.headers['Authorization'] = f'Bearer {token}'
+        self.scanner = Scanner()
+        self._tester = None
+        self.uploader = ResultUploader(self.send_results, batch_size, batch_interval)
+        self._stopped = threading.Event()
+
+    @property
+    def tester(self):
+        # Probe dependencies (dnspython, psycopg2) only load on scan-and-probe agents
+        if self._tester is None:
+            if SCRIPTS_DIR not in sys.path:
+                sys.path.append(SCRIPTS_DIR)
+            from service_tests import ServiceTester
+            self._tester = ServiceTester()
+        return self._tester
+
+    def url(self, action: str) -> str:
+        return f'{self.server}/api/agents/{self.id}/{action}'
+
+    def lease(self) -> List[Dict]:
+        response = self.session.post(self.url('lease'), json={
+            'kinds': self.kinds, 'services': self.services, 'wait': LEASE_WAIT}, timeout=LEASE_WAIT + 10)
+        response.raise_for_status()
+        return response.json()['assignments']
+
+    def send_results(self, results: List[Dict]) -> None:
+        body = gzip.compress(json.dumps({'results': results}).encode())
+        response = self.session.post(self.url('results'), data=body, timeout=30, headers={
+            'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+        if response.status_code == 400:
+            # The app stored what it could use and queued the rejected units
+            # again; sending this batch once more would not help
+            logging.error(f"The app rejected results: {response.text[:500]}")
+            return
+        response.raise_for_status()
+        stale = response.json().get('stale')
+        if stale:
+            logging.info(f"{len(stale)} results were already reported by another agent")
+
+    def run_unit(self, unit: Dict) -> Dict:
+        params = unit['params']
+        started = time.monotonic()
+        try:
+            if unit['kind'] == 'scan':
+                # The app sends the last known state of the subnet, so the
+                # scan is incremental whichever agent did the previous one
+                self.scanner.load_previous(params.get('previous') or [])
+                report = self.scanner.run(params['target'], full=params.get('full'))
+                # Unchanged hosts are already known to the app
+                result = {'unit': unit['id'], 'report': {key: report[key] for key in REPORT_FIELDS}}
+            elif unit['kind'] == 'probes':
+                self.tester.results = []
+                result = {'unit': unit['id'], 'results': self.tester.run_all_tests(params.get('services'))}
+            else:
+                raise ValueError(f"unknown kind of work: {unit['kind']}")
+        except Exception as e:
+            logging.exception(f"Unit {unit['id']} failed")
+            return {'unit': unit['id'], 'error': str(e) or type(e).__name__}
+        logging.info(f"Unit {unit['id']} done in {time.monotonic() - started:.1f}s")
+        return result
+
+    def run(self) -> None:
+        self.uploader.start()
+        backoff = 0.0
+        try:
+            while not self._stopped.is_set():
+                try:
+                    units = self.lease()
+                except requests.RequestException as e:
+                    backoff = min(MAX_BACKOFF, max(1.0, backoff * 2))
+                    logging.warning(f"Could not reach {self.server} ({e}), retrying in {backoff:.0f}s")
+                    self._stopped.wait(backoff)
+                    continue
+                backoff = 0.0
+                for unit in units:
+                    self.uploader.put(self.run_unit(unit))
+        finally:
+            self.uploader.stop()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run netmon scans and probes for a remote netmon app')
+    parser.add_argument('server', nargs='?', default=os.getenv('NETMON_AGENT_SERVER', 'http://localhost:5000'))
+    parser.add_argument('--id', default=os.getenv('NETMON_AGENT_ID') or f'{socket.gethostname()}-{os.getpid()}',
+                        help='name of this agent (default: host name and process id)')
+    parser.add_argument('--kinds', default=','.join(KINDS), help='work to accept: scan, probes or both')
+    parser.add_argument('--services', help='probe only these services (comma separated)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--batch-interval', type=float, default=DEFAULT_BATCH_INTERVAL)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    token = os.getenv('NETMON_AGENT_TOKEN')
+    if not token:
+        parser.error('set NETMON_AGENT_TOKEN to the token the app was started with')
+    kinds = [kind for kind in args.kinds.split(',') if kind]
+    if not kinds or set(kinds) - set(KINDS):
+        parser.error(f'--kinds must be a comma separated list of {", ".join(KINDS)}')
+    agent = Agent(args.server, args.id, token, kinds,
+                  args.services.split(',') if args.services else None, args.batch_size, args.batch_interval)
+    signal.signal(signal.SIGTERM, lambda *_: agent.stop())
+    logging.info(f"Agent {agent.id} working for {agent.server} ({', '.join(kinds)})")
+    try:
+        agent.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
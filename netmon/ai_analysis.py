@@ -0,0 +1,130 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+AI_API_URL = os.getenv('NETMON_AI_API_URL', 'https://api.deepseek.com/v1/chat/completions')
+AI_MODEL = os.getenv('NETMON_AI_MODEL', 'deepseek-chat')
+AI_TIMEOUT = float(os.getenv('NETMON_AI_TIMEOUT', '30'))
+AI_WORKERS = int(os.getenv('NETMON_AI_WORKERS', '2'))
+AI_CACHE_TTL = float(os.getenv('NETMON_AI_CACHE_TTL', '21600'))
+# Failed analyses are remembered only this long, so a flapping service does
+# not trigger one API call per failure but a recovered API is retried soon.
+AI_DEDUP_WINDOW = float(os.getenv('NETMON_AI_DEDUP_WINDOW', '300'))
+CACHE_MAX_ENTRIES = 1024
+
+FAILURE_PREFIX = 'AI analysis failed: '
+
+NORMALIZERS = (
+    (re.compile(r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b'), '<uuid>'),
+    (re.compile(r'\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b'), '<ip>'),
+    (re.compile(r'\b0x[0-9a-f]+\b'), '<hex>'),
+    (re.compile(r'\b\d{4}-\d{2}-\d{2}[t ]\d{2}:\d{2}:\d{2}(?:\.\d+)?z?\b'), '<time>'),
+    (re.compile(r'\d+(?:\.\d+)?'), '<n>'),
+    (re.compile(r'\s+'), ' '),
+)
+
+
+def normalize(description: str) -> str:
+    """Strip the parts of an error message that vary between occurrences."""
+    text = description.strip().lower()
+    for pattern, replacement in NORMALIZERS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def fingerprint(error_type: str, description: str) -> str:
+    return hashlib.sha1(f'{error_type}\0{normalize(description)}'.encode()).hexdigest()
+
+
+_session = threading.local()
+
+
+def request_analysis(error_type: str, description: str) -> str:
+    if not hasattr(_session, 'value'):
+        import requests  # only needed once an error actually gets analysed
+        _session.value = requests.Session()
+    api_key = os.getenv('DEEPSEEK_API_KEY')
+    prompt = f"Analyze this network error and suggest solutions:\nType: {error_type}\nDescription: {description}"
+    response = _session.value.post(
+        AI_API_URL,
+        headers={'Authorization': f'Bearer {api_key}'} if api_key else {},
+        json={
+            'model': AI_MODEL,
+            'messages': [{'role': 'user', 'content': prompt}]
+        },
+        timeout=AI_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json()['choices'][0]['message']['content']
+
+
+class AIAnalyzer:
+    """Runs AI analyses on a small worker pool, off the caller's thread.
+
+    Analyses are cached by a fingerprint of the normalised error, and an
+    error that is already being analysed is not sent again: its callback
+    joins the in-flight request and receives the same result.
+    """
+
+    def __init__(self, analyze: Callable[[str, str], str] = request_analysis,
+                 workers: int = AI_WORKERS, cache_ttl: float = AI_CACHE_TTL,
+                 dedup_window: float = AI_DEDUP_WINDOW):
+        self.analyze = analyze
+        self.cache_ttl = cache_ttl
+        self.dedup_window = dedup_window
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ai-analysis')
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Tuple[float, str]] = {}
+        self._inflight: Dict[str, List[Callable[[str], None]]] = {}
+
+    def cached(self, key: str) -> Optional[str]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires, analysis = entry
+        if expires < time.monotonic():
+            del self._cache[key]
+            return None
+        return analysis
+
+    def submit(self, error_type: str, description: str, callback: Callable[[str], None]) -> None:
+        key = fingerprint(error_type, description)
+        with self._lock:
+            analysis = self.cached(key)
+            if analysis is None and key in self._inflight:
+                self._inflight[key].append(callback)
+                return
+            if analysis is None:
+                self._inflight[key] = [callback]
+        if analysis is not None:
+            callback(analysis)
+            return
+        self._executor.submit(self._run, key, error_type, description)
+
+    def _run(self, key: str, error_type: str, description: str) -> None:
+        try:
+            analysis = self.analyze(error_type, description)
+            ttl = self.cache_ttl
+        except Exception as e:
+            analysis = f'{FAILURE_PREFIX}{str(e)}'
+            ttl = self.dedup_window
+        with self._lock:
+            now = time.monotonic()
+            if len(self._cache) >= CACHE_MAX_ENTRIES:
+                self._cache = {k: v for k, v in self._cache.items() if v[0] >= now}
+            self._cache[key] = (now + ttl, analysis)
+            callbacks = self._inflight.pop(key, [])
+        for callback in callbacks:
+            try:
+                callback(analysis)
+            except Exception:
+                logging.exception('AI analysis callback failed')
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(callbacks) for callbacks in self._inflight.values())
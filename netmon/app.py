@@ -1,163 +1,1449 @@
-from flask import Flask, render_template, jsonify
+from flask import Flask, render_template, jsonify, request, Response, abort, g
 from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO
 from flask_cors import CORS
-from datetime import datetime
-import schedule
-import threading
-import time
+import click
+from sqlalchemy import insert
+from datetime import datetime, timedelta, timezone
 import os
+import sys
 import json
-import subprocess
-import requests
+import calendar
+import contextlib
+import itertools
+import time
+import gzip
+import hmac
+import zlib
+import ipaddress
+import socket
+import threading
 from dotenv import load_dotenv
+from scanner import Scanner
+from scan_parser import GrepableParser, parse_nmap_text, summarize, diff_host
+from storage import WriteQueue, ensure_indexes
+from cooperative import ASYNC_MODE, run_blocking
+from http_cache import ResponseCache, track_changes
+import retention
+import search
+import export
+import latency_store
+from latency_store import LatencyStore, Sketch
+from ai_analysis import AIAnalyzer, request_analysis
+import metrics
+from event_bus import EventBus
+from scheduler import (Job, JobScheduler, JobSkipped, current_context, remaining as job_time_remaining,
+                       stream_command)
+from adaptive import AdaptiveCadence, Cooldown, LatencyBaseline, TokenBucket
+from changes import ChangeDetector, check_events, check_state, host_changed, host_events
+from coordinator import DEFAULT_LEASE, DEFAULT_SHARD_PREFIX, Coordinator, shard_index, shard_network
+import system_checks
 
 load_dotenv()
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///network_monitor.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('NETMON_DATABASE_URI', 'sqlite:///network_monitor.db')
 app.config['SECRET_KEY'] = os.urandom(24)
-CORS(app, resources={r"/*": {"origins": "*"}})
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=['X-Next-Cursor'])
 db = SQLAlchemy(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+# With several server processes, Socket.IO events go through a shared queue
+# (e.g. redis://redis:6379/0) so every dashboard sees every emit
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE,
+                    message_queue=os.getenv('NETMON_MESSAGE_QUEUE') or None)
+
+# Metrics exposed on /metrics
+JOB_SECONDS = metrics.REGISTRY.histogram('netmon_job_duration_seconds', 'Scheduled job run time',
+                                         ['job', 'outcome'])
+HTTP_SECONDS = metrics.REGISTRY.histogram('netmon_http_request_duration_seconds', 'API request handling time',
+                                          ['route', 'method', 'status'])
+DB_WRITE_SECONDS = metrics.REGISTRY.histogram('netmon_db_write_duration_seconds', 'Write queue batch commit time',
+                                              ['outcome'])
+DB_WRITE_ROWS = metrics.REGISTRY.histogram('netmon_db_write_batch_size', 'Writes per committed batch',
+                                           buckets=(1, 2, 5, 10, 25, 50, 100, 200))
+EMIT_SECONDS = metrics.REGISTRY.histogram('netmon_socket_emit_duration_seconds', 'Socket.IO emit time')
+PROBE_SECONDS = metrics.REGISTRY.histogram('netmon_probe_duration_seconds', 'Service probe time by phase',
+                                           ['service', 'check', 'phase'])
+PROBE_FAILURES = metrics.REGISTRY.counter('netmon_probe_failures', 'Failed service probes', ['service', 'check'])
+AI_SECONDS = metrics.REGISTRY.histogram('netmon_ai_analysis_duration_seconds', 'AI analysis API call time')
+ERRORS = metrics.REGISTRY.counter('netmon_errors', 'Errors logged', ['error_type'])
+
+def observe_write(size, seconds, ok):
+    DB_WRITE_SECONDS.observe(seconds, outcome='success' if ok else 'error')
+    DB_WRITE_ROWS.observe(size)
+
+def timed_emit(*args, **kwargs):
+    with EMIT_SECONDS.time():
+        socketio.emit(*args, **kwargs)
+
+def timed_analysis(error_type, description):
+    with AI_SECONDS.time():
+        return request_analysis(error_type, description)
+
+writer = WriteQueue(app, db, on_batch=observe_write)
+bus = EventBus(timed_emit, start_background_task=socketio.start_background_task, sleep=socketio.sleep)
+analyzer = AIAnalyzer(analyze=timed_analysis)
+latency = LatencyStore()
 
 # Database Models
 class NetworkScan(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     scan_type = db.Column(db.String(50), nullable=False)
     target = db.Column(db.String(100), nullable=False)
     result = db.Column(db.Text, nullable=False)
 
-class SpeedTest(db.Model):
+class ScanHost(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    scan_id = db.Column(db.Integer, db.ForeignKey('network_scan.id'), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    host = db.Column(db.String(45), nullable=False)
+    state = db.Column(db.String(10), nullable=False)
+    hostname = db.Column(db.String(255))
+    ports = db.relationship('ScanPort', backref='scan_host', lazy='selectin')
+    __table_args__ = (
+        db.Index('ix_scan_host_timestamp_host', 'timestamp', 'host'),
+        db.Index('ix_scan_host_host_timestamp', 'host', 'timestamp'),
+    )
+
+class ScanPort(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    host_id = db.Column(db.Integer, db.ForeignKey('scan_host.id'), nullable=False)
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    host = db.Column(db.String(45), nullable=False)
+    port = db.Column(db.Integer, nullable=False)
+    protocol = db.Column(db.String(10), nullable=False, default='tcp')
+    state = db.Column(db.String(20), nullable=False)
+    service = db.Column(db.String(100))
+    version = db.Column(db.String(255))
+    __table_args__ = (
+        db.Index('ix_scan_port_host_port', 'host', 'port'),
+        db.Index('ix_scan_port_port_host', 'port', 'host'),
+        db.Index('ix_scan_port_timestamp', 'timestamp'),
+    )
+
+class ScanOutput(db.Model):
+    # Raw tool output, gzip-compressed, fetched only on demand
+    scan_id = db.Column(db.Integer, db.ForeignKey('network_scan.id'), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+class SpeedTest(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     download_speed = db.Column(db.Float)
     upload_speed = db.Column(db.Float)
     ping = db.Column(db.Float)
     jitter = db.Column(db.Float)
 
+class SpeedTestRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    resolution = db.Column(db.String(4), nullable=False)
+    bucket = db.Column(db.DateTime, nullable=False)
+    samples = db.Column(db.Integer, nullable=False)
+    download_speed_min = db.Column(db.Float)
+    download_speed_max = db.Column(db.Float)
+    download_speed_mean = db.Column(db.Float)
+    download_speed_p95 = db.Column(db.Float)
+    upload_speed_min = db.Column(db.Float)
+    upload_speed_max = db.Column(db.Float)
+    upload_speed_mean = db.Column(db.Float)
+    upload_speed_p95 = db.Column(db.Float)
+    ping_min = db.Column(db.Float)
+    ping_max = db.Column(db.Float)
+    ping_mean = db.Column(db.Float)
+    ping_p95 = db.Column(db.Float)
+    jitter_min = db.Column(db.Float)
+    jitter_max = db.Column(db.Float)
+    jitter_mean = db.Column(db.Float)
+    jitter_p95 = db.Column(db.Float)
+    __table_args__ = (
+        db.UniqueConstraint('resolution', 'bucket', name='uq_speed_test_rollup_bucket'),
+        db.Index('ix_speed_test_rollup_bucket', 'bucket'),
+    )
+
+class JobRun(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(50), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    duration = db.Column(db.Float, nullable=False)
+    outcome = db.Column(db.String(10), nullable=False)
+    detail = db.Column(db.Text)
+    __table_args__ = (
+        db.Index('ix_job_run_job_started_at', 'job', 'started_at'),
+        db.Index('ix_job_run_started_at', 'started_at'),
+    )
+
 class ErrorLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     error_type = db.Column(db.String(50), nullable=False)
     description = db.Column(db.Text, nullable=False)
     ai_analysis = db.Column(db.Text)
 
+class ChangeLog(db.Model):
+    # Typed changes found between consecutive results (see changes.py)
+    id = db.Column(db.Integer, primary_key=True)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    type = db.Column(db.String(30), nullable=False)
+    target = db.Column(db.String(255), nullable=False)
+    severity = db.Column(db.String(10), nullable=False)
+    detail = db.Column(db.Text, nullable=False)
+    __table_args__ = (
+        db.Index('ix_change_log_target_timestamp', 'target', 'timestamp'),
+    )
+
+class ProbeLatency(db.Model):
+    # Per-minute latency sketches of one service check (see latency_store)
+    id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.DateTime, nullable=False)
+    service = db.Column(db.String(50), nullable=False)
+    test_name = db.Column(db.String(50), nullable=False)
+    samples = db.Column(db.Integer, nullable=False)
+    failures = db.Column(db.Integer, nullable=False)
+    sketches = db.Column(db.Text, nullable=False)
+    __table_args__ = (
+        db.Index('ix_probe_latency_bucket_service', 'bucket', 'service'),
+    )
+
+class TableVersion(db.Model):
+    # Bumped in every transaction that writes the table; validates cached API responses
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+track_changes(TableVersion)
+cache = ResponseCache(db.session, TableVersion)
+
 # Network scanning functions
+def store_scan_hosts(scan, hosts):
+    # Two parameterized executemany inserts per call instead of one per row
+    if not hosts:
+        return
+    host_ids = db.session.scalars(
+        insert(ScanHost).returning(ScanHost.id, sort_by_parameter_order=True),
+        [{'scan_id': scan.id, 'timestamp': scan.timestamp, 'host': host['host'], 'state': host['state'],
+          'hostname': host.get('hostname') or None} for host in hosts]).all()
+    ports = [{'host_id': host_id, 'timestamp': scan.timestamp, 'host': host['host'], 'port': port['port'],
+              'protocol': port['protocol'], 'state': port['state'], 'service': port.get('service'),
+              'version': port.get('version')}
+             for host_id, host in zip(host_ids, hosts) for port in host['ports']]
+    if ports:
+        db.session.execute(insert(ScanPort), ports)
+
+def host_payload(row):
+    return {
+        'host': row.host,
+        'state': row.state,
+        'hostname': row.hostname or '',
+        'ports': [{
+            'port': port.port,
+            'protocol': port.protocol,
+            'state': port.state,
+            'service': port.service,
+            'version': port.version
+        } for port in sorted(row.ports, key=lambda p: p.port)]
+    }
+
+def scan_payload(scan):
+    return {
+        'id': scan.id,
+        'timestamp': scan.timestamp.isoformat(),
+        'scan_type': scan.scan_type,
+        'target': scan.target,
+        'result': scan.result
+    }
+
+def scan_event(scan, diff=None):
+    # Dashboards get a one-line summary and what changed, never the full output
+    summary = scan.result.splitlines()[0] if scan.result else ''
+    return {
+        'id': scan.id,
+        'timestamp': scan.timestamp.isoformat(),
+        'scan_type': scan.scan_type,
+        'target': scan.target,
+        'summary': summary[:200],
+        'diff': diff
+    }
+
+def speed_test_payload(test):
+    return {
+        'id': test.id,
+        'timestamp': test.timestamp.isoformat(),
+        'download_speed': test.download_speed,
+        'upload_speed': test.upload_speed,
+        'ping': test.ping,
+        'jitter': test.jitter
+    }
+
+def error_payload(error):
+    return {
+        'id': error.id,
+        'timestamp': error.timestamp.isoformat(),
+        'error_type': error.error_type,
+        'description': error.description,
+        'ai_analysis': error.ai_analysis
+    }
+
+def change_payload(change):
+    return {
+        'id': change.id,
+        'timestamp': change.timestamp.isoformat(),
+        'type': change.type,
+        'target': change.target,
+        'severity': change.severity,
+        'detail': json.loads(change.detail)
+    }
+
+def result_state(scan_type, result):
+    # System check output varies run to run; only its meaning is compared
+    if scan_type in system_checks.TARGETS:
+        return check_state(scan_type, result)
+    return {'result': result}
+
+def load_result_state(key):
+    # The last result that was really stored: not a scan still running (or
+    # left 'running' by a restart), nor a scan that failed, which are no
+    # baseline and no checkpoint
+    scan_type, target = key
+    query = NetworkScan.query.filter_by(scan_type=scan_type, target=target).filter(NetworkScan.result != 'running')
+    if scan_type not in system_checks.TARGETS:
+        query = query.filter(~NetworkScan.result.startswith('failed:'))
+    row = query.order_by(NetworkScan.id.desc()).first()
+    return (result_state(scan_type, row.result), row.timestamp) if row else None
+
+# Results are stored when they change, plus a checkpoint now and then
+detector = ChangeDetector(load=load_result_state)
+
+def record_changes(events):
+    # Stored, pushed to dashboards as 'change' events; alerts also go to the error log
+    if not events:
+        return
+    rows = [ChangeLog(type=event.type, target=event.target, severity=event.severity,
+                      detail=json.dumps(event.detail)) for event in events]
+
+    def emit(rows):
+        for row, event in zip(rows, events):
+            bus.publish('change', change_payload(row))
+            if event.severity == 'warning':
+                log_error(event.type, event.describe())
+
+    writer.submit(lambda session: session.add_all(rows) or rows, emit)
+
+SCAN_BATCH_HOSTS = 32       # hosts per streamed write and progress event
+SCAN_BATCH_SECONDS = 2.0    # ...or whatever arrived within this long
+SCAN_OUTPUT_LIMIT = int(os.getenv('NETMON_SCAN_OUTPUT_LIMIT', str(16 * 1024 * 1024)))
+
+class OutputArchive:
+    # Raw tool output, gzip-compressed as it streams in, up to a size limit
+    def __init__(self, limit=SCAN_OUTPUT_LIMIT):
+        self.limit = limit
+        self.size = 0
+        self.compressor = zlib.compressobj(wbits=31)
+        self.chunks = []
+
+    def add(self, line):
+        data = (line + '\n').encode()
+        if self.size >= self.limit:
+            return
+        if self.size + len(data) > self.limit:
+            data = data[:self.limit - self.size] + b'\n[output truncated]\n'
+        self.size += len(data)
+        self.chunks.append(self.compressor.compress(data))
+
+    def finish(self):
+        self.chunks.append(self.compressor.flush())
+        return b''.join(self.chunks)
+
 def run_nmap_scan(target):
+    """nmap -sV with grepable output, stored and published host by host.
+
+    Hosts are written in small batches while nmap is still running and each
+    batch goes to the dashboard as a ``scan_progress`` event; the finished
+    scan is published as ``new_scan`` with every change found. Only hosts
+    that changed are stored, except for a periodic checkpoint run that
+    stores them all; a run that found no change leaves no scan behind.
+    """
+    scan_id = None
     try:
-        result = subprocess.run(['nmap', '-sV', target], capture_output=True, text=True)
-        scan = NetworkScan(scan_type='nmap', target=target, result=result.stdout)
-        db.session.add(scan)
-        db.session.commit()
-        socketio.emit('new_scan', {
-            'timestamp': scan.timestamp.isoformat(),
-            'scan_type': scan.scan_type,
-            'target': scan.target,
-            'result': scan.result
-        })
+        previous = latest_host_states()
+        network = ipaddress.ip_network(target, strict=False)
+        checkpoint = detector.due(('nmap', target))
+        # The scan row comes first so host batches can reference it
+        scan = NetworkScan(scan_type='nmap', target=target, result='running')
+        writer.submit(lambda session: session.add(scan)).result()
+        scan_id = scan.id
+        parser = GrepableParser()
+        archive = OutputArchive()
+        seen = set()
+        diffs = []
+        counts = {'up': 0, 'open': 0}
+        batch = []
+        flushed = time.monotonic()
+
+        def flush():
+            nonlocal batch, flushed
+            if not batch:
+                return
+            hosts, batch, flushed = batch, [], time.monotonic()
+            changed = [(h, d) for h, d in ((h, diff_host(previous.get(h['host']), h)) for h in hosts)
+                       if host_changed(d)]
+            diffs.extend(d for _, d in changed)
+            stored = hosts if checkpoint else [h for h, _ in changed]
+            changed = [d for _, d in changed]
+            writer.submit(lambda session: store_scan_hosts(scan, stored),
+                          lambda _: bus.publish('scan_progress', {
+                              'id': scan.id, 'target': target, 'hosts': len(seen),
+                              'summary': f"{counts['up']} hosts up, {counts['open']} open ports",
+                              'diff': changed}))
+
+        def add(hosts):
+            for host in hosts:
+                seen.add(host['host'])
+                if host['state'] == 'up':
+                    counts['up'] += 1
+                    counts['open'] += sum(1 for port in host['ports'] if port['state'] == 'open')
+                batch.append(host)
+            if len(batch) >= SCAN_BATCH_HOSTS or time.monotonic() - flushed >= SCAN_BATCH_SECONDS:
+                flush()
+
+        with stream_command(['nmap', '-sV', '-oG', '-', target]) as command:
+            for line in command:
+                archive.add(line)
+                add(parser.feed(line))
+        add(parser.finish())
+        if command.returncode:
+            raise RuntimeError(f'nmap exited with {command.returncode}: {command.stderr}')
+
+        gone = [dict(before, state='down', ports=[]) for address, before in previous.items()
+                if address not in seen and before['state'] == 'up'
+                and ipaddress.ip_address(address) in network]
+        batch.extend(gone)
+        flush()
+        summary = f"{counts['up']} hosts up, {counts['open']} open ports"
+        record_changes([event for diff in diffs for event in host_events(diff)])
+        if not diffs and not checkpoint:
+            def discard(session):
+                session.delete(session.get(NetworkScan, scan_id))
+
+            writer.submit(discard, lambda _: bus.publish('scan_unchanged', {
+                'id': scan_id, 'target': target, 'summary': summary}))
+            return
+        def finish(session):
+            stored = session.get(NetworkScan, scan_id)
+            stored.result = summary
+            session.add(ScanOutput(scan_id=scan_id, data=archive.finish()))
+            return stored
+
+        def emit(stored):
+            # Only a committed scan counts as the last stored one
+            detector.stored(('nmap', target), result_state('nmap', summary))
+            bus.publish('new_scan', scan_event(stored, diffs))
+
+        writer.submit(finish, emit)
     except Exception as e:
+        if scan_id is not None:
+            # ``e`` is gone once the except block ends, before the writer runs this
+            message = f'failed: {e}'[:1000]
+
+            def fail(session):
+                stored = session.get(NetworkScan, scan_id)
+                stored.result = message
+            writer.submit(fail)
         log_error('nmap_scan', str(e))
+        raise
+
+def backfill_scan_tables(batch_size=100):
+    # Move raw nmap blobs written before structured storage into scan_host/scan_port
+    while True:
+        scans = NetworkScan.query.filter(
+            NetworkScan.scan_type.in_(['nmap', 'nmap_scan']),
+            ~NetworkScan.id.in_(db.session.query(ScanOutput.scan_id))
+        ).limit(batch_size).all()
+        if not scans:
+            break
+        for scan in scans:
+            hosts = parse_nmap_text(scan.result)
+            store_scan_hosts(scan, hosts)
+            db.session.add(ScanOutput(scan_id=scan.id, data=gzip.compress(scan.result.encode())))
+            scan.result = summarize(hosts)
+        db.session.commit()
+
+scanner = Scanner()
+
+def latest_host_states():
+    # Latest snapshot of every host the scanners have seen
+    latest = db.session.query(db.func.max(ScanHost.id)).group_by(ScanHost.host)
+    rows = ScanHost.query.filter(ScanHost.id.in_(latest)).all()
+    return {row.host: host_payload(row) for row in rows}
+
+def load_scanner_state():
+    scanner.load_previous(latest_host_states().values())
+
+def store_scan_report(report):
+    # Only hosts whose liveness or port set changed get a new row, plus a
+    # periodic checkpoint of the whole target (as for nmap) that gives
+    # unchanged hosts a dated row too
+    key = ('tcp_sweep', report['target'])
+    checkpoint = detector.due(key)
+    if checkpoint:
+        network = ipaddress.ip_network(report['target'], strict=False)
+        # The scanner's view includes what agents reported for their shards
+        hosts = sorted((host for address, host in scanner.known().items()
+                        if host.get('state') == 'up' and ipaddress.ip_address(address) in network),
+                       key=lambda host: ipaddress.ip_address(host['host']))
+        summary = f"{len(hosts)} hosts up, {sum(len(host['ports']) for host in hosts)} open ports"
+
+    def store(session):
+        scans = [NetworkScan(scan_type='tcp_sweep', target=host['host'], result=json.dumps(host))
+                 for host in report['changed']]
+        if checkpoint:
+            scans.append(NetworkScan(scan_type='tcp_sweep', target=report['target'], result=summary))
+        session.add_all(scans)
+        session.flush()
+        for scan, host in zip(scans, report['changed']):
+            store_scan_hosts(scan, [host])
+        if checkpoint:
+            store_scan_hosts(scans[-1], hosts)
+        return scans
+
+    def emit(scans):
+        for scan, diff in zip(scans, report['diffs']):
+            bus.publish('new_scan', scan_event(scan, [diff]))
+        if checkpoint:
+            detector.stored(key, result_state('tcp_sweep', summary))
+            bus.publish('new_scan', scan_event(scans[-1], []))
+
+    writer.submit(store, emit)
+    record_changes([event for diff in report['diffs'] for event in host_events(diff)])
+
+def run_builtin_scan(target, full=None):
+    try:
+        if not scanner.previous:
+            load_scanner_state()
+        # The asyncio sweep gets its own OS thread so it cannot stall the server
+        report = run_blocking(scanner.run, target, timeout=job_time_remaining(), full=full)
+        store_scan_report(report)
+    except Exception as e:
+        log_error('tcp_sweep', str(e))
+        raise
+
+# Remote probe agents (agent.py) take shards of the scan and probe sweeps
+AGENT_TOKEN = os.getenv('NETMON_AGENT_TOKEN')
+AGENT_SHARD_PREFIX = int(os.getenv('NETMON_AGENT_SHARD_PREFIX', str(DEFAULT_SHARD_PREFIX)))
+coordinator = Coordinator(lease=float(os.getenv('NETMON_AGENT_LEASE', str(DEFAULT_LEASE))))
+# The coordinator only lives in this process: with several server workers
+# (serve.py) the primary plans the work, so only it serves the agent API
+PRIMARY_WORKER = int(os.getenv('NETMON_WORKER_INDEX', '0')) == 0
+
+def run_distributed_scan(target):
+    """Split ``target`` into subnets and let the live agents scan them.
+
+    Each shard carries the last known state of its hosts, so agents scan
+    incrementally just like the local scanner; reports are stored as they
+    come in (see ``agent_results``).
+    """
+    try:
+        if not scanner.previous:
+            load_scanner_state()
+        network = ipaddress.ip_network(target, strict=False)
+        shards = shard_network(target, AGENT_SHARD_PREFIX)
+        previous = [[] for _ in shards]
+        for address, host in scanner.known().items():
+            index = shard_index(network, AGENT_SHARD_PREFIX, address)
+            if index is not None and host.get('state') == 'up':
+                previous[index].append(host)
+        full = scanner.rotate()
+        round_id = coordinator.plan('scan', [{'target': str(shard), 'full': full, 'previous': hosts}
+                                             for shard, hosts in zip(shards, previous)])
+        if not coordinator.wait(round_id, job_time_remaining()):
+            raise RuntimeError(f'{coordinator.cancel(round_id)} of {len(shards)} subnets '
+                               f'were not scanned in time')
+    except Exception as e:
+        log_error('tcp_sweep', str(e))
+        raise
+
+def merge_scan_report(report):
+    # Agents only send hosts that changed, and keep the local scanner current
+    scanner.remember(report['changed'])
+    store_scan_report(report)
+
+def daily_budget(variable, default, burst):
+    per_day = float(os.getenv(variable, default))
+    if per_day <= 0:
+        raise ValueError(f'{variable} must be a positive number of runs per day, not {per_day:g}')
+    return TokenBucket(burst, 86400 / per_day)
+
+# Expensive jobs draw from a daily budget, so manual triggers and targeted
+# scans cannot pile up runs on top of the schedule. Every network scan counts,
+# whichever scanner runs it; targeted scans of single hosts have their own
+# budget so they cannot starve the regular sweep
+SPEED_TEST_BUDGET = daily_budget('NETMON_SPEEDTEST_MAX_PER_DAY', '48', burst=2)
+SCAN_BUDGET = daily_budget('NETMON_SCAN_MAX_PER_DAY', os.getenv('NETMON_NMAP_MAX_PER_DAY', '24'), burst=2)
+TARGETED_SCAN_BUDGET = daily_budget('NETMON_TARGETED_SCAN_MAX_PER_DAY', '96', burst=4)
+
+def take_budget(budget, name):
+    if not budget.take():
+        raise JobSkipped(f'{name} budget exhausted, next run allowed in {budget.wait_time():.0f}s')
+
+def run_network_scan(target):
+    take_budget(SCAN_BUDGET, 'network scan')
+    if os.getenv('NETMON_SCANNER', 'builtin') == 'nmap':
+        run_nmap_scan(target)
+    elif coordinator.live_agents():
+        run_distributed_scan(target)
+    else:
+        run_builtin_scan(target)
+
+def update_rollups(session, timestamps):
+    # Recompute only the hourly and daily buckets the new samples fall into
+    for resolution, width in retention.RESOLUTIONS.items():
+        for bucket in {retention.bucket_start(ts, resolution) for ts in timestamps}:
+            samples = SpeedTest.query.filter(SpeedTest.timestamp >= bucket,
+                                             SpeedTest.timestamp < bucket + width).all()
+            rollup = SpeedTestRollup.query.filter_by(resolution=resolution, bucket=bucket).first()
+            if rollup is None:
+                rollup = SpeedTestRollup(resolution=resolution, bucket=bucket)
+                session.add(rollup)
+            for column, value in retention.aggregate(samples).items():
+                setattr(rollup, column, value)
+
+def store_speed_tests(session, tests):
+    session.add_all(tests)
+    session.flush()
+    update_rollups(session, [test.timestamp for test in tests])
+    return tests
+
+def backfill_rollups():
+    # Hours of speed tests recorded before rollups existed
+    covered = {bucket for bucket, in db.session.query(SpeedTestRollup.bucket).filter_by(resolution='1h')}
+    hours = sorted({retention.bucket_start(ts, '1h')
+                    for ts, in SpeedTest.query.with_entities(SpeedTest.timestamp)} - covered)
+    for start in range(0, len(hours), 500):
+        update_rollups(db.session, hours[start:start + 500])
+        db.session.commit()
+
+def prune_history():
+    now = datetime.utcnow()
+
+    def prune(session):
+        raw = SpeedTest.query.filter(
+            SpeedTest.timestamp < now - timedelta(days=retention.RAW_RETENTION_DAYS)
+        ).delete(synchronize_session=False)
+        hourly = SpeedTestRollup.query.filter(
+            SpeedTestRollup.resolution == '1h',
+            SpeedTestRollup.bucket < now - timedelta(days=retention.HOURLY_RETENTION_DAYS)
+        ).delete(synchronize_session=False)
+        probes = ProbeLatency.query.filter(
+            ProbeLatency.bucket < now - timedelta(days=retention.PROBE_RETENTION_DAYS)
+        ).delete(synchronize_session=False)
+        return raw, hourly, probes
+
+    writer.submit(prune)
+
+# speedtest-cli --simple prints one line per phase as soon as it is measured
+SPEED_TEST_LINES = {'Ping': 'ping', 'Download': 'download_speed', 'Upload': 'upload_speed'}
 
 def run_speed_test():
+    take_budget(SPEED_TEST_BUDGET, 'speed test')
     try:
-        result = subprocess.run(['speedtest-cli', '--json'], capture_output=True, text=True)
-        data = json.loads(result.stdout)
+        data = {}
+        # Unbuffered so each phase reaches us when it is printed, not at exit
+        with stream_command(['speedtest-cli', '--simple'], env=dict(os.environ, PYTHONUNBUFFERED='1')) as command:
+            for line in command:
+                label, _, value = line.partition(':')
+                if label in SPEED_TEST_LINES and value.split():
+                    data[SPEED_TEST_LINES[label]] = float(value.split()[0])  # ms or Mbit/s
+                    bus.publish('speed_test_progress', dict(data))
+        if len(data) < len(SPEED_TEST_LINES):
+            raise RuntimeError(f'speedtest-cli exited with {command.returncode}: {command.stderr}')
         test = SpeedTest(
-            download_speed=data['download'] / 1_000_000,  # Convert to Mbps
-            upload_speed=data['upload'] / 1_000_000,
+            download_speed=data['download_speed'],
+            upload_speed=data['upload_speed'],
             ping=data['ping'],
-            jitter=data.get('jitter', 0)
+            jitter=0  # speedtest-cli does not measure jitter
         )
-        db.session.add(test)
-        db.session.commit()
-        socketio.emit('new_speed_test', {
-            'timestamp': test.timestamp.isoformat(),
-            'download_speed': test.download_speed,
-            'upload_speed': test.upload_speed,
-            'ping': test.ping,
-            'jitter': test.jitter
-        })
+        writer.submit(lambda session: store_speed_tests(session, [test])[0],
+                      lambda test: bus.publish('new_speed_test', speed_test_payload(test)))
     except Exception as e:
         log_error('speed_test', str(e))
+        raise
 
-def analyze_error_with_ai(error_type, description):
-    try:
-        api_key = os.getenv('DEEPSEEK_API_KEY')
-        prompt = f"Analyze this network error and suggest solutions:\nType: {error_type}\nDescription: {description}"
-        
-        response = requests.post(
-            'https://api.deepseek.com/v1/chat/completions',
-            headers={'Authorization': f'Bearer {api_key}'},
-            json={
-                'model': 'deepseek-chat',
-                'messages': [{'role': 'user', 'content': prompt}]
-            }
-        )
-        return response.json()['choices'][0]['message']['content']
-    except Exception as e:
-        return f"AI analysis failed: {str(e)}"
+def store_ai_analysis(error_id, analysis):
+    def store(session):
+        error = session.get(ErrorLog, error_id)
+        if error is not None:
+            error.ai_analysis = analysis
+        return error
+
+    def emit(error):
+        if error is not None:
+            bus.publish('error_analysis', {'id': error.id, 'ai_analysis': error.ai_analysis})
+
+    writer.submit(store, emit)
+
+def analyze_logged_error(error):
+    # Runs after the row is committed; the analysis follows as its own event
+    ERRORS.inc(error_type=error.error_type)
+    bus.publish('new_error', error_payload(error))
+    if not error.ai_analysis:
+        error_id = error.id
+        analyzer.submit(error.error_type, error.description,
+                        lambda analysis: store_ai_analysis(error_id, analysis))
 
 def log_error(error_type, description):
-    ai_analysis = analyze_error_with_ai(error_type, description)
-    error = ErrorLog(error_type=error_type, description=description, ai_analysis=ai_analysis)
-    db.session.add(error)
-    db.session.commit()
-    socketio.emit('new_error', {
-        'timestamp': error.timestamp.isoformat(),
-        'error_type': error.error_type,
-        'description': error.description,
-        'ai_analysis': error.ai_analysis
-    })
+    error = ErrorLog(error_type=error_type, description=description)
+    writer.submit(lambda session: session.add(error) or error, analyze_logged_error)
 
-# Schedule tasks
-def schedule_tasks():
-    schedule.every(1).hour.do(run_nmap_scan, '172.20.0.0/16')
-    schedule.every(30).minutes.do(run_speed_test)
-    
+# Cheap checks run at a calm pace while healthy and speed up when one fails
+CHECK_CADENCE = AdaptiveCadence(float(os.getenv('NETMON_CHECK_INTERVAL', '600')),
+                                float(os.getenv('NETMON_CHECK_MIN_INTERVAL', '60')),
+                                float(os.getenv('NETMON_CHECK_MAX_INTERVAL', '3600')))
+
+def run_system_checks():
+    results = system_checks.run_all()
+    failed = [r for r in results if not r['result'].startswith('success')]
+    scheduler.jobs['system_checks'].set_interval(CHECK_CADENCE.observe(not failed))
+    for r in failed:
+        queue_targeted_scan(system_checks.HOSTS.get(r['scan_type']))
+
+    changed, events = [], []
+    for r in results:
+        state = result_state(r['scan_type'], r['result'])
+        decision, before = detector.decide((r['scan_type'], 'system'), state)
+        if decision != 'unchanged':
+            changed.append(r)
+        # Failures reach the error log once, as check_failed, not on every run
+        events += check_events(system_checks.TARGETS[r['scan_type']], before, state, r['result'])
+
+    def store(session):
+        scans = [NetworkScan(scan_type=r['scan_type'], target='system', result=r['result']) for r in changed]
+        session.add_all(scans)
+        return scans
+
+    def emit(scans):
+        for scan in scans:
+            detector.stored((scan.scan_type, 'system'), result_state(scan.scan_type, scan.result))
+            bus.publish('new_scan', scan_event(scan))
+
+    if changed:
+        writer.submit(store, emit)
+    record_changes(events)
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts')
+PROBE_INTERVAL = float(os.getenv('NETMON_PROBE_INTERVAL', '60'))
+PROBE_CADENCE = AdaptiveCadence(PROBE_INTERVAL, float(os.getenv('NETMON_PROBE_MIN_INTERVAL', '15')),
+                                float(os.getenv('NETMON_PROBE_MAX_INTERVAL', str(PROBE_INTERVAL * 5))))
+baseline = LatencyBaseline()
+_service_tester = None
+
+def service_tester():
+    # One long-lived tester, so its pooled connections survive between sweeps
+    global _service_tester
+    if _service_tester is None:
+        if SCRIPTS_DIR not in sys.path:
+            sys.path.append(SCRIPTS_DIR)  # the probe scripts import their siblings by name
+        from service_tests import ServiceTester
+        _service_tester = ServiceTester(sweep_timeout=max(1.0, PROBE_INTERVAL - 10))
+    return _service_tester
+
+def record_probe_results(results, vantage=None):
+    # Returns the services that failed or answered unusually slowly
+    affected = set()
+    for result in results:
+        ok = result['status'] == 'PASS'
+        # Results from an agent are kept apart per vantage point
+        test_name = result['test_name'] if vantage is None else f"{result['test_name']}@{vantage}"
+        latency.record(result['service'], test_name, ok, result)
+        # Only the service's own response time counts; connection setup
+        # varies with pool reuse
+        if not ok or baseline.observe((result['service'], test_name), result.get('ttfb_ms', 0.0)):
+            affected.add(result['service'])
+        for phase in latency_store.PHASES:
+            if phase in result:
+                PROBE_SECONDS.observe(result[phase] / 1000, service=result['service'],
+                                      check=test_name, phase=phase[:-3])
+        if not ok:
+            PROBE_FAILURES.inc(service=result['service'], check=test_name)
+    return affected
+
+def plan_agent_probes():
+    # Every agent probes from where it stands; one sweep at a time per agent
+    for agent, state in coordinator.live_agents().items():
+        if 'probes' in state.get('kinds', ()) and not coordinator.pending(agent, 'probes'):
+            coordinator.plan('probes', [{'services': state.get('services')}], agent=agent)
+
+def run_service_probes():
+    tester = service_tester()
+    tester.results = []
+    plan_agent_probes()
+    affected = record_probe_results(tester.run_all_tests())
+    scheduler.jobs['service_probes'].set_interval(PROBE_CADENCE.observe(not affected))
+    for service in affected:
+        queue_targeted_scan(SERVICE_HOSTS.get(service))
+    persist_latency()
+
+def persist_latency(now=None):
+    # Closed minutes go to ProbeLatency; agents' results are recorded in the
+    # primary worker too (agent_request), so this job sees every sample
+    closed = latency.drain(now)
+    if closed:
+        return writer.submit(lambda session: session.add_all([ProbeLatency(
+            bucket=datetime.utcfromtimestamp(start),
+            service=service,
+            test_name=test_name,
+            samples=bucket.samples,
+            failures=bucket.failures,
+            sketches=json.dumps({phase: sketch.to_dict() for phase, sketch in bucket.sketches.items()
+                                 if sketch.count})
+        ) for service, test_name, start, bucket in closed]))
+
+SERVICE_HOSTS = dict(item.split('=', 1) for item in os.getenv(
+    'NETMON_SERVICE_HOSTS',
+    'traefik=traefik,bind9=172.20.0.10,nginx=nginx,pihole=172.20.0.20,postgresql=postgres'
+).split(',') if '=' in item)
+targeted_cooldown = Cooldown(float(os.getenv('NETMON_TARGETED_SCAN_COOLDOWN', '600')))
+_targeted_hosts = set()
+_targeted_lock = threading.Lock()
+
+def queue_targeted_scan(host):
+    # Each host is scanned at most once per cooldown however often it fails
+    if not host or not targeted_cooldown.ready(host):
+        return
+    with _targeted_lock:
+        _targeted_hosts.add(host)
+    scheduler.trigger('targeted_scan')
+
+def run_targeted_scans():
+    network = ipaddress.ip_network(SCAN_TARGET, strict=False)
     while True:
-        schedule.run_pending()
-        time.sleep(60)
+        with _targeted_lock:
+            if not _targeted_hosts:
+                return
+            host = _targeted_hosts.pop()
+        try:
+            address = socket.gethostbyname(host)
+        except OSError as e:
+            log_error('targeted_scan', f'{host}: {e}')
+            continue
+        if ipaddress.ip_address(address) not in network:
+            continue  # never port-scan hosts outside the monitored network
+        if not TARGETED_SCAN_BUDGET.take():
+            with _targeted_lock:
+                _targeted_hosts.add(host)  # scanned once the budget allows
+            raise JobSkipped(f'targeted scan budget exhausted, next run allowed in '
+                             f'{TARGETED_SCAN_BUDGET.wait_time():.0f}s')
+        if os.getenv('NETMON_SCANNER', 'builtin') == 'nmap':
+            run_nmap_scan(address)
+        else:
+            run_builtin_scan(f'{address}/32', full=True)
+
+def record_job_run(run):
+    if run['outcome'] != 'skipped':
+        JOB_SECONDS.observe(run['duration'], job=run['job'], outcome=run['outcome'])
+    writer.submit(lambda session: session.add(JobRun(**run)))
+
+# Schedule tasks
+SCAN_TARGET = os.getenv('NETMON_SCAN_TARGET', '172.20.0.0/16')
+
+@contextlib.contextmanager
+def job_context():
+    with app.app_context(), metrics.profiler.span('job', {'job': current_context().name}):
+        yield
+
+scheduler = JobScheduler(context_factory=job_context, on_finish=record_job_run)
+scheduler.add(Job('network_scan', lambda: run_network_scan(SCAN_TARGET),
+                  interval=3600, max_runtime=3000, jitter=60, run_on_start=True))
+scheduler.add(Job('speed_test', run_speed_test, interval=1800, max_runtime=300, jitter=60))
+scheduler.add(Job('system_checks', run_system_checks, interval=CHECK_CADENCE.base, max_runtime=120,
+                  jitter=30, run_on_start=True))
+scheduler.add(Job('service_probes', run_service_probes, interval=PROBE_INTERVAL,
+                  max_runtime=PROBE_INTERVAL - 5, jitter=5, run_on_start=True))
+scheduler.add(Job('targeted_scan', run_targeted_scans, interval=300, max_runtime=600))
+scheduler.add(Job('prune_history', prune_history, interval=86400, max_runtime=600, jitter=300))
+
+metrics.REGISTRY.gauge('netmon_scheduler_lag_seconds', 'How late the last scheduled run of a job started',
+                       ['job'], collect=lambda: {(job.name,): job.lag for job in scheduler.jobs.values()})
+metrics.REGISTRY.gauge('netmon_job_running', 'Whether a job is running', ['job'],
+                       collect=lambda: {(job.name,): float(job.running) for job in scheduler.jobs.values()})
+metrics.REGISTRY.gauge('netmon_queue_depth', 'Items waiting in internal queues', ['queue'],
+                       collect=lambda: {('db_writer',): writer.depth(), ('ai_analysis',): analyzer.pending()})
+metrics.REGISTRY.gauge('netmon_agents', 'Probe agents that checked in recently', [],
+                       collect=lambda: {(): len(coordinator.live_agents())})
+metrics.REGISTRY.gauge('netmon_agent_units', 'Work units waiting for or held by agents', ['state'],
+                       collect=lambda: {(state,): count for state, count in coordinator.status()['units'].items()})
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.request_profile = contextlib.ExitStack()
+    g.request_profile.enter_context(metrics.profiler.span('request', {'route': g.route}))
+
+@app.teardown_request
+def stop_request_profile(exc):
+    profile = g.pop('request_profile', None)
+    if profile is not None:
+        profile.close()
+
+@app.after_request
+def observe_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        HTTP_SECONDS.observe(time.perf_counter() - started, route=g.route,
+                             method=request.method, status=response.status_code)
+    return response
+
+# The app sits behind a public router: endpoints that change what it
+# stores or does are switched off (403) until their token is configured
+ADMIN_TOKEN = os.getenv('NETMON_ADMIN_TOKEN')
+
+def require_token(token):
+    if not token:
+        abort(403)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
 
 # Routes
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def rollup_payload(rollup):
+    return dict({
+        'timestamp': rollup.bucket.isoformat(),
+        'resolution': rollup.resolution,
+        'samples': rollup.samples,
+        'stats': {metric: {stat: getattr(rollup, f'{metric}_{stat}') for stat in ('min', 'max', 'mean', 'p95')}
+                  for metric in retention.METRICS}
+    }, **{metric: getattr(rollup, f'{metric}_mean') for metric in retention.METRICS})
+
+MAX_PAGE_SIZE = 500
+
+def keyset_page(query, model, default_limit):
+    """Apply ``since``/``cursor`` pagination on the primary key.
+
+    ``since=<id>`` returns rows newer than ``id``, oldest first, so a client
+    can poll for just the new rows; ``cursor=<id>`` pages back through rows
+    older than ``id``. Without either the newest rows come first, as before.
+    Also returns the id to pass next (for ``X-Next-Cursor``), or None.
+    """
+    limit = max(1, min(request.args.get('limit', default_limit, type=int), MAX_PAGE_SIZE))
+    since = request.args.get('since', type=int)
+    if since is not None:
+        rows = query.filter(model.id > since).order_by(model.id).limit(limit).all()
+        return rows, rows[-1].id if rows else since
+    cursor = request.args.get('cursor', type=int)
+    if cursor is not None:
+        query = query.filter(model.id < cursor)
+    rows = query.order_by(model.id.desc()).limit(limit + 1).all()
+    return rows[:limit], rows[limit - 1].id if len(rows) > limit else None
+
+def page_response(items, next_cursor):
+    response = jsonify(items)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    return response
+
 @app.route('/api/speed-tests')
+@cache.cached('speed_test', 'speed_test_rollup', ttl=60)
 def get_speed_tests():
-    tests = SpeedTest.query.order_by(SpeedTest.timestamp.desc()).limit(24).all()
-    return jsonify([{
-        'timestamp': test.timestamp.isoformat(),
-        'download_speed': test.download_speed,
-        'upload_speed': test.upload_speed,
-        'ping': test.ping,
-        'jitter': test.jitter
-    } for test in tests])
+    if 'range' not in request.args and 'resolution' not in request.args:
+        tests, next_cursor = keyset_page(SpeedTest.query, SpeedTest, 24)
+        return page_response([speed_test_payload(test) for test in tests], next_cursor)
+
+    try:
+        span = retention.parse_range(request.args.get('range', '24h'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    resolution = request.args.get('resolution') or retention.default_resolution(span)
+    if resolution != 'raw' and resolution not in retention.RESOLUTIONS:
+        return jsonify({'error': f'unknown resolution: {resolution}'}), 400
+
+    since = datetime.utcnow() - span
+    if resolution == 'raw':
+        tests = SpeedTest.query.filter(SpeedTest.timestamp >= since).order_by(SpeedTest.timestamp).all()
+        return jsonify([speed_test_payload(test) for test in tests])
+    rollups = SpeedTestRollup.query.filter(
+        SpeedTestRollup.resolution == resolution,
+        SpeedTestRollup.bucket >= retention.bucket_start(since, resolution)
+    ).order_by(SpeedTestRollup.bucket).all()
+    return jsonify([rollup_payload(rollup) for rollup in rollups])
 
 @app.route('/api/network-scans')
+@cache.cached('network_scan', 'scan_output')
 def get_network_scans():
-    scans = NetworkScan.query.order_by(NetworkScan.timestamp.desc()).limit(10).all()
+    # Like the snapshot: a scan still running arrives through its events
+    scans, next_cursor = keyset_page(NetworkScan.query.filter(NetworkScan.result != 'running'), NetworkScan, 10)
+    ids = [scan.id for scan in scans]
+    with_raw = {row.scan_id for row in db.session.query(ScanOutput.scan_id).filter(ScanOutput.scan_id.in_(ids))}
+    return page_response([dict(scan_payload(scan),
+                               raw_url=f'/api/network-scans/{scan.id}/raw' if scan.id in with_raw else None)
+                          for scan in scans], next_cursor)
+
+@app.route('/api/snapshot')
+def get_snapshot():
+    # A reconnecting client passes its last sequence number and gets only
+    # what it missed; anyone else (or anyone too far behind) gets a snapshot
+    since = request.args.get('since', type=int)
+    if since is not None and request.args.get('epoch') == bus.epoch:
+        events = bus.since(since)
+        if events is not None:
+            return jsonify({'epoch': bus.epoch, 'seq': events[-1]['seq'] if events else since,
+                            'events': events})
+    seq = bus.seq
+    # A scan still running shows up through its scan_progress/new_scan events
+    scans = (NetworkScan.query.filter(NetworkScan.result != 'running')
+             .order_by(NetworkScan.timestamp.desc()).limit(10).all())
+    tests = SpeedTest.query.order_by(SpeedTest.timestamp.desc()).limit(24).all()
+    errors = ErrorLog.query.order_by(ErrorLog.timestamp.desc()).limit(10).all()
+    return jsonify({
+        'epoch': bus.epoch,
+        'seq': seq,
+        'snapshot': {
+            'speed_tests': [speed_test_payload(test) for test in reversed(tests)],
+            'network_scans': [scan_event(scan) for scan in reversed(scans)],
+            'error_logs': [error_payload(error) for error in reversed(errors)]
+        }
+    })
+
+@app.route('/api/network-scans/<int:scan_id>/raw')
+def get_network_scan_raw(scan_id):
+    output = db.session.get(ScanOutput, scan_id) or abort(404)
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        return Response(output.data, mimetype='text/plain',
+                        headers={'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'})
+    return Response(gzip.decompress(output.data), mimetype='text/plain')
+
+@app.route('/api/hosts/<host>/changes')
+@cache.cached('scan_host', 'scan_port')
+def get_host_changes(host):
+    limit = min(request.args.get('limit', 20, type=int), 200)
+    rows = ScanHost.query.filter_by(host=host).order_by(ScanHost.timestamp.desc()).limit(limit + 1).all()
+    changes = []
+    for current, previous in zip(rows, rows[1:] + [None]):
+        now = {p.port for p in current.ports if p.state == 'open'}
+        before = {p.port for p in previous.ports if p.state == 'open'} if previous else set()
+        changes.append({
+            'timestamp': current.timestamp.isoformat(),
+            'scan_id': current.scan_id,
+            'state': current.state,
+            'previous_state': previous.state if previous else None,
+            'opened_ports': sorted(now - before),
+            'closed_ports': sorted(before - now)
+        })
+    return jsonify({'host': host, 'changes': changes[:limit]})
+
+@app.route('/api/ports/<int:port>/hosts')
+@cache.cached('scan_host', 'scan_port')
+def get_port_hosts(port):
+    # Only the most recent snapshot of each host counts as "currently exposed"
+    latest = db.session.query(db.func.max(ScanHost.id)).group_by(ScanHost.host)
+    rows = ScanPort.query.filter(ScanPort.port == port, ScanPort.state == 'open',
+                                 ScanPort.host_id.in_(latest)).order_by(ScanPort.host).all()
     return jsonify([{
-        'timestamp': scan.timestamp.isoformat(),
-        'scan_type': scan.scan_type,
-        'target': scan.target,
-        'result': scan.result
-    } for scan in scans])
+        'host': row.host,
+        'hostname': row.scan_host.hostname or '',
+        'port': row.port,
+        'protocol': row.protocol,
+        'service': row.service,
+        'version': row.version,
+        'timestamp': row.timestamp.isoformat()
+    } for row in rows])
 
 @app.route('/api/error-logs')
+@cache.cached('error_log')
 def get_error_logs():
-    errors = ErrorLog.query.order_by(ErrorLog.timestamp.desc()).limit(10).all()
-    return jsonify([{
-        'timestamp': error.timestamp.isoformat(),
-        'error_type': error.error_type,
-        'description': error.description,
-        'ai_analysis': error.ai_analysis
-    } for error in errors])
+    errors, next_cursor = keyset_page(ErrorLog.query, ErrorLog, 10)
+    return page_response([error_payload(error) for error in errors], next_cursor)
+
+def time_window(args):
+    """``from``/``to`` (ISO times) and ``range`` (e.g. 30d, back from ``to``
+    or now) as naive UTC, like the stored timestamps."""
+    def moment(name):
+        if not args.get(name):
+            return None
+        value = datetime.fromisoformat(args[name])
+        return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+    start, end = moment('from'), moment('to')
+    if args.get('range'):
+        start = (end or datetime.utcnow()) - retention.parse_range(args['range'])
+    return start, end
+
+@app.route('/api/search')
+@cache.cached(*search.SOURCES)
+def search_history():
+    # ?q=timeout "172.20.0.5"&source=error_log&type=connection_error&range=30d (or from=/to= ISO times)
+    try:
+        sources = [name for name in request.args.get('source', '').split(',') if name] or None
+        unknown = set(sources or ()) - set(search.SOURCES)
+        if unknown:
+            raise ValueError(f"unknown source: {', '.join(sorted(unknown))}")
+        start, end = time_window(request.args)
+        limit = max(1, min(request.args.get('limit', 20, type=int), MAX_PAGE_SIZE))
+        offset = max(0, request.args.get('offset', 0, type=int))
+        started = time.perf_counter()
+        results, truncated = search.search(db.session, request.args.get('q', ''), sources,
+                                           request.args.get('type'), start, end, limit, offset)
+    except search.SearchUnavailable as e:
+        return jsonify({'error': str(e)}), 503
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # truncated: only the newest matches were ranked; a narrower range reaches older ones
+    return jsonify({'query': request.args.get('q', ''), 'results': results, 'truncated': truncated,
+                    'took_ms': round((time.perf_counter() - started) * 1000, 2)})
+
+@app.route('/api/export')
+def export_history():
+    # ?table=speed_test&format=csv|parquet|arrow&range=365d (or from=/to=), streamed chunk by chunk
+    table = request.args.get('table', 'speed_test')
+    format = request.args.get('format', 'csv')
+    try:
+        if table not in export.TIME_COLUMNS:
+            raise ValueError(f"unknown table: {table} (one of {', '.join(export.TIME_COLUMNS)})")
+        start, end = time_window(request.args)
+        body = export.stream(db.engine, db.metadata.tables[table], format, start, end)
+        # A bad format or missing pyarrow fails here, before the response starts
+        first = next(body)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 501
+    return Response(itertools.chain([first], body), mimetype=export.FORMATS[format][0], headers={
+        'Content-Disposition': f'attachment; filename={export.filename(table, format, start, end)}'})
+
+@app.route('/api/changes')
+@cache.cached('change_log')
+def get_changes():
+    # ?type=port_opened&target=172.20.0.5&severity=warning, newest first
+    query = ChangeLog.query
+    for field in ('type', 'target', 'severity'):
+        if request.args.get(field):
+            query = query.filter(getattr(ChangeLog, field) == request.args[field])
+    changes, next_cursor = keyset_page(query, ChangeLog, 50)
+    return page_response([change_payload(change) for change in changes], next_cursor)
+
+@app.route('/api/probes/latency')
+def get_probe_latency():
+    try:
+        span = retention.parse_range(request.args.get('range', '1h'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    service = request.args.get('service')
+    since = datetime.utcnow() - span
+
+    query = ProbeLatency.query.filter(ProbeLatency.bucket >= since)
+    if service:
+        query = query.filter_by(service=service)
+    rows = [(row.service, row.test_name, row.samples, row.failures,
+             {phase: Sketch.from_dict(data) for phase, data in json.loads(row.sketches).items()})
+            for row in query]
+    # The current minute has not been persisted yet
+    cutoff = calendar.timegm(since.timetuple())
+    rows += [(svc, test_name, bucket.samples, bucket.failures, bucket.sketches)
+             for svc, test_name, start, bucket in latency.pending()
+             if start >= cutoff and (not service or svc == service)]
+
+    services = {}
+    for svc, test_name, samples, failures, sketches in rows:
+        services.setdefault(svc, {}).setdefault(test_name, []).append((samples, failures, sketches))
+    return jsonify({
+        'range': request.args.get('range', '1h'),
+        'services': {svc: dict(latency_store.summarize(row for check in checks.values() for row in check),
+                               checks={name: latency_store.summarize(check) for name, check in checks.items()})
+                     for svc, checks in services.items()}
+    })
+
+@app.route('/api/probes/<service>/samples')
+def get_probe_samples(service):
+    # Raw recent samples from this process's ring buffers
+    limit = min(request.args.get('limit', 200, type=int), latency_store.RING_CAPACITY)
+    return jsonify(latency.samples(service, request.args.get('test'), limit=limit))
+
+@app.route('/metrics')
+def get_metrics():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/profiling', methods=['GET', 'POST'])
+def profiling():
+    # POST {"enabled": true, "duration": 60} to profile every instrumented span for a minute;
+    # the report shows code paths and timings, so reading it needs the token too
+    require_token(ADMIN_TOKEN)
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        if data.get('reset'):
+            metrics.profiler.reset()
+        if data.get('enabled'):
+            metrics.profiler.start(data.get('duration'))
+        elif 'enabled' in data:
+            metrics.profiler.stop()
+    limit = min(request.args.get('limit', 20, type=int), 200)
+    try:
+        spans = metrics.profiler.report(limit, request.args.get('sort', 'cumulative'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'enabled': metrics.profiler.active(), 'spans': spans})
+
+def job_run_payload(run):
+    return {
+        'job': run.job,
+        'started_at': run.started_at.isoformat(),
+        'duration': run.duration,
+        'outcome': run.outcome,
+        'detail': run.detail
+    }
+
+@app.route('/api/jobs')
+def get_jobs():
+    return jsonify(scheduler.status())
+
+@app.route('/api/jobs/<name>/runs')
+@cache.cached('job_run')
+def get_job_runs(name):
+    runs, next_cursor = keyset_page(JobRun.query.filter_by(job=name), JobRun, 20)
+    return page_response([job_run_payload(run) for run in runs], next_cursor)
+
+@app.route('/api/jobs/<name>/run', methods=['POST'])
+def trigger_job(name):
+    # Jobs start nmap and speed test runs
+    require_token(ADMIN_TOKEN)
+    if name not in scheduler.jobs:
+        abort(404)
+    if not scheduler.started:
+        return jsonify({'job': name, 'status': 'jobs do not run in this server process'}), 503
+    if not scheduler.trigger(name):
+        return jsonify({'job': name, 'status': 'already running'}), 409
+    return jsonify({'job': name, 'status': 'triggered'}), 202
+
+# Columns the shell-side monitors may write through /api/ingest
+INGEST_MODELS = {
+    'network_scan': (NetworkScan, ('scan_type', 'target', 'result')),
+    'speed_test': (SpeedTest, ('download_speed', 'upload_speed', 'ping', 'jitter')),
+    'error_log': (ErrorLog, ('error_type', 'description', 'ai_analysis')),
+}
+
+INGEST_EVENTS = {
+    'network_scan': ('new_scan', scan_event),
+    'speed_test': ('new_speed_test', speed_test_payload),
+}
+
+@app.route('/api/ingest/<kind>', methods=['POST'])
+def ingest(kind):
+    require_token(ADMIN_TOKEN)
+    if kind not in INGEST_MODELS:
+        abort(404)
+    model, fields = INGEST_MODELS[kind]
+    payload = request.get_json(silent=True)
+    items = payload if isinstance(payload, list) else [payload]
+    if not items or not all(isinstance(item, dict) for item in items):
+        return jsonify({'error': 'expected a JSON object or a list of objects'}), 400
+    required = [column.name for column in model.__table__.columns
+                if column.name in fields and not column.nullable]
+    if any(item.get(field) is None for item in items for field in required):
+        return jsonify({'error': f'missing required fields: {", ".join(required)}'}), 400
+    received = len(items)
+    if model is NetworkScan:
+        # Identical results reported again are only counted, not stored; the
+        # detector learns about the others once they are committed (emit)
+        kept, batch = [], {}
+        for item in items:
+            key = (item['scan_type'], item['target'])
+            state = result_state(item['scan_type'], item['result'])
+            # Later items of the batch compare against the earlier ones
+            unchanged = batch[key] == state if key in batch else detector.decide(key, state)[0] == 'unchanged'
+            if not unchanged:
+                batch[key] = state
+                kept.append(item)
+        items = kept
+    rows = [model(**{field: item[field] for field in fields if field in item}) for item in items]
+    event, to_payload = INGEST_EVENTS.get(kind, (None, None))
+
+    def store(session):
+        if model is SpeedTest:
+            return store_speed_tests(session, rows)
+        session.add_all(rows)
+        return rows
+
+    def emit(rows):
+        for row in rows:
+            if model is ErrorLog:
+                analyze_logged_error(row)
+                continue
+            if model is NetworkScan:
+                detector.stored((row.scan_type, row.target), result_state(row.scan_type, row.result))
+            bus.publish(event, to_payload(row))
+
+    if rows:
+        writer.submit(store, emit)
+    return jsonify({'queued': len(rows), 'unchanged': received - len(rows)}), 202
+
+def agent_request():
+    # Agents authenticate with a shared token and may gzip what they send
+    require_token(AGENT_TOKEN)
+    if not PRIMARY_WORKER:
+        abort(503, description='agents are served by the primary worker only')
+    data = request.get_data()
+    try:
+        if request.headers.get('Content-Encoding') == 'gzip':
+            data = gzip.decompress(data)
+        payload = json.loads(data or b'{}')
+    except (OSError, ValueError):
+        abort(400)
+    if not isinstance(payload, dict):
+        abort(400)
+    return payload
+
+@app.route('/api/agents')
+def get_agents():
+    return jsonify(coordinator.status())
+
+@app.route('/api/agents/<agent_id>/lease', methods=['POST'])
+def lease_agent_work(agent_id):
+    data = agent_request()
+    info = {'kinds': data.get('kinds') or ['scan', 'probes'], 'services': data.get('services'),
+            'address': request.remote_addr}
+    try:
+        capacity = max(1, int(data.get('capacity', 1)))
+        wait = max(0.0, float(data.get('wait', 0)))
+    except (TypeError, ValueError):
+        abort(400)
+    # With nothing to do the request is held open until work is planned
+    assignments = coordinator.lease(agent_id, capacity, info['kinds'], info, wait)
+    return jsonify({'assignments': assignments, 'lease': coordinator.lease_time})
+
+def _is_port(port):
+    return (isinstance(port, dict) and isinstance(port.get('port'), int)
+            and isinstance(port.get('protocol'), str) and isinstance(port.get('state'), str))
+
+def _is_host(host):
+    if not (isinstance(host, dict) and isinstance(host.get('host'), str) and isinstance(host.get('state'), str)
+            and isinstance(host.get('ports'), list) and all(_is_port(port) for port in host['ports'])):
+        return False
+    try:
+        ipaddress.ip_address(host['host'])
+    except ValueError:
+        return False
+    return True
+
+def _is_diff(diff):
+    return (isinstance(diff, dict) and isinstance(diff.get('host'), str) and isinstance(diff.get('state'), str)
+            and 'previous_state' in diff and isinstance(diff.get('opened_ports'), list)
+            and isinstance(diff.get('closed_ports'), list))
+
+def _is_probe(result):
+    return (isinstance(result, dict)
+            and all(isinstance(result.get(field), str) for field in ('service', 'test_name', 'status'))
+            and all(isinstance(result[phase], (int, float)) for phase in latency_store.PHASES if phase in result))
+
+def agent_result_problem(kind, result):
+    """Why an agent's result for a unit of ``kind`` cannot be stored, or None."""
+    if kind == 'scan':
+        report = result.get('report')
+        if not isinstance(report, dict):
+            return 'scan result without a report'
+        try:
+            ipaddress.ip_network(report.get('target'), strict=False)
+        except (TypeError, ValueError):
+            return 'scan report without a valid target'
+        changed, diffs = report.get('changed'), report.get('diffs')
+        if not isinstance(changed, list) or not isinstance(diffs, list) or len(changed) != len(diffs):
+            return 'scan report needs changed and diffs lists of the same length'
+        if not all(_is_host(host) for host in changed) or not all(_is_diff(diff) for diff in diffs):
+            return 'malformed host in scan report'
+    elif kind == 'probes':
+        results = result.get('results')
+        if not isinstance(results, list) or not all(_is_probe(probe) for probe in results):
+            return 'probe result needs a list of results with service, test_name and status'
+    return None
+
+@app.route('/api/agents/<agent_id>/results', methods=['POST'])
+def agent_results(agent_id):
+    # Also the agents' heartbeat: an empty batch renews their leases
+    data = agent_request()
+    results = data.get('results') or []
+    if not isinstance(results, list) or not all(isinstance(result, dict) and isinstance(result.get('unit'), str)
+                                                for result in results):
+        return jsonify({'error': 'results must be a list of objects with a unit id'}), 400
+    coordinator.heartbeat(agent_id)
+    accepted, stale, rejected = [], [], []
+    for result in results:
+        unit_id = result['unit']
+        error = result.get('error')
+        if not error:
+            # Checked before the unit is completed: a malformed result puts
+            # it back in the queue instead of losing it
+            unit = coordinator.get(unit_id)
+            error = unit and agent_result_problem(unit.kind, result)
+            if error:
+                rejected.append(unit_id)
+        if error:
+            unit = coordinator.fail(agent_id, unit_id)
+            if unit is not None:
+                log_error(f'agent_{unit.kind}', f"{agent_id} gave up on {unit_id}: {error}")
+            if unit_id not in rejected:
+                accepted.append(unit_id)
+            continue
+        unit = coordinator.complete(agent_id, unit_id)
+        if unit is None:
+            stale.append(unit_id)
+        elif unit.kind == 'scan':
+            merge_scan_report(result['report'])
+            accepted.append(unit_id)
+        elif unit.kind == 'probes':
+            record_probe_results(result['results'], vantage=agent_id)
+            accepted.append(unit_id)
+    if rejected:
+        return jsonify({'error': 'malformed results', 'accepted': accepted, 'stale': stale,
+                        'rejected': rejected}), 400
+    return jsonify({'accepted': accepted, 'stale': stale})
+
+def bootstrap():
+    # The one place the schema is created; serve.py, the dev server and
+    # `flask init-db` all go through here
+    db.create_all()
+    ensure_indexes(db)
+    search.ensure_index(db.engine)
+    backfill_scan_tables()
+    backfill_rollups()
+
+@app.cli.command('init-db')
+def init_db():
+    """Create the netmon database tables and indexes."""
+    bootstrap()
+
+@app.cli.command('export')
+@click.argument('tables', nargs=-1)
+@click.option('--format', 'format', type=click.Choice(list(export.FORMATS)), default='csv', show_default=True)
+@click.option('--range', 'span', help='how far back, e.g. 365d (from --to or now)')
+@click.option('--from', 'start', help='ISO time to start from')
+@click.option('--to', 'end', help='ISO time to stop at')
+@click.option('--out', default='.', show_default=True, help='directory for the files')
+@click.option('--chunk-rows', type=int, default=export.DEFAULT_CHUNK_ROWS, show_default=True)
+def export_command(tables, format, span, start, end, out, chunk_rows):
+    """Export TABLES (default: all) to one file each, without loading them into memory."""
+    unknown = set(tables) - set(export.TIME_COLUMNS)
+    if unknown:
+        raise click.BadParameter(f"unknown table: {', '.join(sorted(unknown))}", param_hint='TABLES')
+    try:
+        start, end = time_window({'from': start, 'to': end, 'range': span})
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    os.makedirs(out, exist_ok=True)
+    for table in tables or export.TIME_COLUMNS:
+        path = os.path.join(out, export.filename(table, format, start, end))
+        started = time.perf_counter()
+        with open(path, 'wb') as f:
+            for piece in export.stream(db.engine, db.metadata.tables[table], format, start, end, chunk_rows):
+                f.write(piece)
+        click.echo(f'{path}: {os.path.getsize(path) / 2 ** 20:.1f} MiB in {time.perf_counter() - started:.1f}s')
+
+def start_services(run_scheduler=True):
+    writer.start()
+    bus.start()
+    if run_scheduler:
+        scheduler.start()
 
 if __name__ == '__main__':
+    # Development server; production runs through serve.py
     with app.app_context():
-        db.create_all()
-    threading.Thread(target=schedule_tasks, daemon=True).start()
-    socketio.run(app, host='0.0.0.0', port=5000, allow_unsafe_werkzeug=True)
\ No newline at end of file
+        bootstrap()
+    start_services()
+    socketio.run(app, host='0.0.0.0', port=5000, allow_unsafe_werkzeug=True)
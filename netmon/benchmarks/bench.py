@@ -0,0 +1,602 @@
+#!/usr/bin/env python3
+"""Benchmark and load-test suite for netmon.
+
+Everything runs locally against the stand-ins in ``standins.py``. Nothing
+reaches the real services, the network or the AI API. Suites:
+
+- ``probes``: wall time of a probe sweep through ProbeEngine and
+  ProbeContext (HTTP, HTTPS, TLS, DNS, PostgreSQL).
+- ``dns``: queries/s a resolver stand-in sustains under ``dns_bench``'s
+  ramp, with cold (first ask, recursion delay) and warm latency.
+- ``api``: requests/s and latency of the REST API under concurrent
+  dashboard clients, against a real server process (serve.py, no jobs).
+- ``fanout``: Socket.IO events delivered per second to many connected
+  dashboards after ingest, plus error-to-AI-analysis latency.
+- ``db``: write throughput of the write queue and cold read latency of the
+  main API views as scan and speed test history grows.
+- ``startup``: cold import time and memory (see ``startup.py``).
+
+Data is generated from a fixed seed and every parameter is recorded with
+the results, so runs can be compared across releases:
+
+    python3 benchmarks/bench.py --save baseline.json
+    python3 benchmarks/bench.py --compare baseline.json --tolerance 0.15
+
+``--compare`` exits with status 1 when a metric regressed by more than the
+tolerance.
+"""
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+NETMON_DIR = os.path.dirname(BENCH_DIR)
+SCRIPTS_DIR = os.path.join(NETMON_DIR, 'scripts')
+SEED = 20240611
+# The benchmark server's NETMON_ADMIN_TOKEN, for /api/ingest
+ADMIN_TOKEN = 'bench'
+
+SUITES = ('probes', 'dns', 'api', 'fanout', 'db', 'startup')
+DEFAULTS = {
+    'delay': 0.005,        # stand-in service latency, seconds
+    'copies': 4,           # probe checks are repeated this many times per sweep
+    'sweeps': 20,
+    'dns_qps': 500.0,      # last step of the DNS ramp
+    'dns_step_duration': 2.0,
+    'clients': 20,         # concurrent dashboard clients
+    'duration': 10.0,      # seconds of API load
+    'events': 200,         # speed tests ingested for the fan-out test
+    'errors': 10,          # error logs ingested for the AI analysis latency
+    'seed_rows': 50000,    # history in the database behind the api/fanout suites
+    'rows': 1000000,       # history the db suite grows to
+    'step': 250000,        # db suite checkpoint interval
+    'startup_runs': 5,
+}
+
+# Metrics where a larger value is a regression; *_per_s metrics are the other way
+LOWER_IS_BETTER = ('_ms', '_mb', 'errors', 'failures')
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def latency_summary(prefix: str, seconds: List[float]) -> Dict[str, Optional[float]]:
+    return {f'{prefix}_p{int(q * 100)}_ms': None if percentile(seconds, q) is None
+            else round(percentile(seconds, q) * 1000, 2) for q in (0.5, 0.95, 0.99)}
+
+
+# --- probes ----------------------------------------------------------------
+
+def bench_probes(params: Dict, workdir: str) -> Dict:
+    sys.path.insert(0, SCRIPTS_DIR)
+    from probe_context import ProbeContext
+    from probe_engine import Check, ProbeEngine
+    from standins import StandIns
+
+    with StandIns(delay=params['delay']) as standins:
+        context = ProbeContext(timeout=5)
+        # Resolvers are cached per nameserver, so pointing this one at the
+        # stand-in's port covers every DNS check
+        context.resolver('127.0.0.1').port = standins.dns.port
+        verify = True
+        if standins.certfile:
+            verify = standins.certfile + '.crt'
+            context.ssl_context.load_verify_locations(verify)
+
+        def http(url, **kwargs):
+            return context.get(url, **kwargs).status_code in (200, 301)
+
+        def dns():
+            return len(context.resolve('127.0.0.1', 'traefik.terrerov.com')) > 0
+
+        checks = [
+            ('traefik', 'http_redirect', lambda: http(standins.http.url + '/redirect', allow_redirects=False)),
+            ('nginx', 'internal_access', lambda: http(standins.http.url + '/')),
+            ('pihole', 'admin_interface', lambda: http(standins.http.url + '/admin/')),
+            ('bind9', 'internal_resolution', dns),
+            ('pihole', 'external_resolution', dns),
+        ]
+        if standins.https:
+            checks += [
+                ('traefik', 'https_access', lambda: http(standins.https.url + '/', verify=verify)),
+                ('traefik', 'ssl_cert', lambda: bool(context.tls_handshake('localhost', standins.https.port))),
+            ]
+        try:
+            import psycopg2  # noqa: F401
+            checks.append(('postgresql', 'connection', lambda: context.pg_query(
+                'SELECT 1', host='127.0.0.1', port=standins.postgres.port, database='postgres',
+                user='postgres', password='bench')[0] == 1))
+        except ImportError:
+            pass
+        checks = [Check(service, f'{name}_{copy}', context.timed(func))
+                  for copy in range(params['copies']) for service, name, func in checks]
+
+        engine = ProbeEngine(check_timeout=5, sweep_timeout=30)
+        engine.run(checks)  # warm-up: first connections, TLS sessions
+        sweeps, totals, failures = [], [], 0
+        for _ in range(params['sweeps']):
+            started = time.perf_counter()
+            outcomes = engine.run(checks)
+            sweeps.append(time.perf_counter() - started)
+            for outcome in outcomes:
+                if outcome.error is not None or outcome.timed_out or not outcome.value[0]:
+                    failures += 1
+                else:
+                    totals.append(outcome.value[1]['total_ms'] / 1000)
+        context.close()
+
+    result = {'checks': len(checks), 'failures': failures}
+    result.update(latency_summary('sweep', sweeps))
+    result.update(latency_summary('check', totals))
+    # How much of the serial cost the parallel sweep hides
+    result['parallelism'] = round(sum(totals) / max(sum(sweeps), 1e-9), 2)
+    return result
+
+
+# --- dns load ----------------------------------------------------------------
+
+def bench_dns(params: Dict, workdir: str) -> Dict:
+    sys.path.insert(0, SCRIPTS_DIR)
+    import dns_bench
+    from discovery import Discovery
+    from standins import DNSStandIn
+
+    # The query mix of the real configs in this checkout
+    root = os.path.dirname(NETMON_DIR)
+    names = dns_bench.query_names(Discovery(os.path.join(root, 'etc', 'traefik', 'dynamic'),
+                                            os.path.join(root, 'pihole', 'custom.list')),
+                                  zone_dir=workdir)  # no zone files in a checkout
+    # A cache miss costs the stand-in a few times its normal answer time
+    server = DNSStandIn(delay=params['delay'], miss_delay=params['delay'] * 4).start()
+    try:
+        report = dns_bench.run(f'127.0.0.1:{server.port}', names,
+                               dns_bench.qps_ramp(params['dns_qps'] / 5, params['dns_qps'], 5),
+                               params['dns_step_duration'], seed=SEED)
+    finally:
+        server.stop()
+    result = {'names': report['names'], 'sustained_queries_per_s': report['sustained_qps'],
+              'peak_answers_per_s': report['peak_answers_per_s'],
+              'timeout_errors': report['timeouts'], 'failed_errors': report['failed']}
+    for key in ('p50_ms', 'p99_ms', 'cold_p50_ms', 'cold_p99_ms', 'warm_p50_ms', 'warm_p99_ms'):
+        result[key] = report[key]
+    return result
+
+
+# --- database history --------------------------------------------------------
+
+PORTS = (22, 53, 80, 443, 5432, 8080)
+
+
+def grow_history(netmon, rows: int, step: int, rng: random.Random,
+                 on_step: Optional[Callable[[int, float], None]] = None) -> int:
+    """Write scans (hosts and ports) and speed tests through the write queue
+    until about ``rows`` rows exist; ``on_step`` runs every ``step`` rows."""
+    hosts_per_scan = 254
+    minutes = rows // (hosts_per_scan * 4) + 1
+    timestamp = datetime.utcnow() - timedelta(minutes=minutes)
+    written = next_step = 0
+    step_started = time.perf_counter()
+    futures = []
+    while written < rows:
+        hosts = [{'host': f'172.20.{rng.randrange(4)}.{i}', 'state': 'up' if rng.random() < 0.9 else 'down',
+                  'hostname': '', 'ports': [{'port': port, 'protocol': 'tcp', 'state': 'open', 'service': '',
+                                             'version': ''} for port in rng.sample(PORTS, rng.randrange(4))]}
+                 for i in range(1, hosts_per_scan + 1)]
+        scan = netmon.NetworkScan(scan_type='bench', target='172.20.0.0/22', result='bench', timestamp=timestamp)
+        test = netmon.SpeedTest(timestamp=timestamp, download_speed=rng.uniform(50, 100),
+                                upload_speed=rng.uniform(5, 20), ping=rng.uniform(5, 30), jitter=0)
+
+        def store(session, scan=scan, test=test, hosts=hosts):
+            session.add(scan)
+            session.flush()
+            netmon.store_scan_hosts(scan, hosts)
+            netmon.store_speed_tests(session, [test])
+
+        futures.append(netmon.writer.submit(store))
+        written += 2 + sum(1 + len(host['ports']) for host in hosts)
+        timestamp += timedelta(minutes=1)
+        if written >= next_step + step or written >= rows:
+            for future in futures:
+                future.result()
+            futures = []
+            if on_step is not None:
+                on_step(written, time.perf_counter() - step_started)
+            next_step = written
+            step_started = time.perf_counter()
+    return written
+
+
+READ_PATHS = ('/api/snapshot', '/api/speed-tests', '/api/speed-tests?range=7d', '/api/network-scans',
+              '/api/hosts/172.20.0.7/changes', '/api/ports/22/hosts', '/api/search?q=bench')
+READ_ATTEMPTS = 5
+
+
+def child_db(params: Dict) -> Dict:
+    import app as netmon
+    with netmon.app.app_context():
+        netmon.bootstrap()
+        database = netmon.db.engine.url.database
+    netmon.writer.start()
+    client = netmon.app.test_client()
+    checkpoints = []
+
+    def checkpoint(written, elapsed):
+        reads = {}
+        for path in READ_PATHS:
+            timings = []
+            for attempt in range(READ_ATTEMPTS):
+                # A query argument of its own keeps each read out of the response cache
+                separator = '&' if '?' in path else '?'
+                started = time.perf_counter()
+                client.get(f'{path}{separator}bench={written}-{attempt}')
+                timings.append(time.perf_counter() - started)
+            reads[path] = round(statistics.median(timings) * 1000, 2)
+        previous = checkpoints[-1]['rows'] if checkpoints else 0
+        checkpoints.append({'rows': written, 'rows_per_s': round((written - previous) / elapsed),
+                            'db_size_mib': round(sum(os.path.getsize(path) for path in (database, database + '-wal')
+                                               if os.path.exists(path)) / 2 ** 20, 1),
+                            'write_s': elapsed, 'read_ms': reads})
+
+    written = grow_history(netmon, params['rows'], params['step'], random.Random(SEED), checkpoint)
+    last = checkpoints[-1]
+    result = {'rows': written, 'rows_per_s': round(written / sum(point.pop('write_s') for point in checkpoints)),
+              'first_step_rows_per_s': checkpoints[0]['rows_per_s'], 'last_step_rows_per_s': last['rows_per_s'],
+              'db_size_mib': last['db_size_mib']}
+    for path, ms in last['read_ms'].items():
+        result[f'read {path}_ms'] = ms
+    result['checkpoints'] = checkpoints
+    return result
+
+
+def child_seed(params: Dict) -> Dict:
+    import app as netmon
+    with netmon.app.app_context():
+        netmon.bootstrap()
+    netmon.writer.start()
+    return {'rows': grow_history(netmon, params['seed_rows'], params['seed_rows'], random.Random(SEED))}
+
+
+CHILDREN = {'db': child_db, 'seed': child_seed}
+
+
+def run_child(name: str, params: Dict, database: str) -> Dict:
+    # A fresh interpreter per database: the app binds its URI at import
+    env = dict(os.environ, NETMON_DATABASE_URI=f'sqlite:///{database}',
+               PYTHONPATH=os.pathsep.join(filter(None, [NETMON_DIR, os.getenv('PYTHONPATH')])))
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', name,
+                                '--params', json.dumps(params)],
+                               cwd=NETMON_DIR, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f'{name} failed: {completed.stderr.strip()[-2000:]}')
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def bench_db(params: Dict, workdir: str) -> Dict:
+    return run_child('db', params, os.path.join(workdir, 'db.sqlite'))
+
+
+# --- server-backed suites ------------------------------------------------------
+
+class Server:
+    """serve.py in a subprocess on a seeded database, with jobs switched off."""
+
+    def __init__(self, database: str, ai_url: str, workdir: str):
+        from standins import free_port
+        self.port = free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        env = dict(os.environ, NETMON_HOST='127.0.0.1', NETMON_PORT=str(self.port),
+                   NETMON_DATABASE_URI=f'sqlite:///{database}', NETMON_RUN_JOBS='false',
+                   NETMON_AI_API_URL=ai_url, DEEPSEEK_API_KEY='bench', NETMON_ADMIN_TOKEN=ADMIN_TOKEN)
+        self.log = open(os.path.join(workdir, f'server-{self.port}.log'), 'w')
+        self.process = subprocess.Popen([sys.executable, 'serve.py'], cwd=NETMON_DIR, env=env,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+
+    def __enter__(self) -> 'Server':
+        import requests
+        deadline = time.monotonic() + 120
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'server exited with {self.process.returncode}, see {self.log.name}')
+            try:
+                requests.get(self.url + '/api/jobs', timeout=1)
+                return self
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise RuntimeError('server did not start')
+
+    def __exit__(self, *exc) -> None:
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+
+def seeded_database(params: Dict, workdir: str) -> str:
+    template = os.path.join(workdir, 'seed.sqlite')
+    if not os.path.exists(template):
+        run_child('seed', params, template)
+    # Every suite starts from the same history
+    database = os.path.join(workdir, f'server-{len(os.listdir(workdir))}.sqlite')
+    shutil.copyfile(template, database)
+    return database
+
+
+def bench_api(params: Dict, workdir: str) -> Dict:
+    import requests
+    from standins import AIStandIn
+
+    ai = AIStandIn().start()
+    try:
+        with Server(seeded_database(params, workdir), ai.url, workdir) as server:
+            paths = list(READ_PATHS) + ['/api/error-logs', '/api/jobs', '/metrics']
+            deadline = time.monotonic() + params['duration']
+            latencies: List[float] = []
+            counts = {'requests': 0, 'not_modified': 0, 'errors': 0}
+            lock = threading.Lock()
+
+            def client(index):
+                rng = random.Random(SEED + index)
+                session = requests.Session()
+                etags = {}
+                mine, statuses = [], []
+                while time.monotonic() < deadline:
+                    path = rng.choice(paths)
+                    # Dashboards revalidate what they already have
+                    headers = {'If-None-Match': etags[path]} if path in etags else {}
+                    started = time.perf_counter()
+                    try:
+                        response = session.get(server.url + path, headers=headers, timeout=10)
+                        status = response.status_code
+                    except requests.RequestException:
+                        status = 0
+                    mine.append(time.perf_counter() - started)
+                    statuses.append(status)
+                    if status == 200 and response.headers.get('ETag'):
+                        etags[path] = response.headers['ETag']
+                with lock:
+                    latencies.extend(mine)
+                    counts['requests'] += len(statuses)
+                    counts['not_modified'] += statuses.count(304)
+                    counts['errors'] += sum(1 for status in statuses if status not in (200, 304))
+
+            started = time.perf_counter()
+            threads = [threading.Thread(target=client, args=(i,)) for i in range(params['clients'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+    finally:
+        ai.stop()
+
+    result = {'clients': params['clients'], 'requests_per_s': round(counts['requests'] / elapsed, 1),
+              'not_modified_ratio': round(counts['not_modified'] / max(counts['requests'], 1), 3),
+              'errors': counts['errors']}
+    result.update(latency_summary('request', latencies))
+    return result
+
+
+def bench_fanout(params: Dict, workdir: str) -> Dict:
+    import requests
+    import socketio
+    from standins import AIStandIn
+
+    try:
+        import websocket  # noqa: F401  (websocket-client enables the websocket transport)
+        transports = ['websocket']
+    except ImportError:
+        transports = ['polling']
+
+    ai = AIStandIn().start()
+    try:
+        with Server(seeded_database(params, workdir), ai.url, workdir) as server:
+            total = params['events']
+            sent: Dict[int, float] = {}
+            received: List[List[float]] = []
+            analyses: Dict[str, float] = {}
+            done = threading.Event()
+            lock = threading.Lock()
+            clients = []
+
+            for index in range(params['clients']):
+                mine: List[float] = []
+                received.append(mine)
+                client = socketio.Client(reconnection=False)
+
+                def on_events(frame, mine=mine, first=index == 0):
+                    now = time.perf_counter()
+                    for item in frame['events']:
+                        data = item['data']
+                        if item['event'] == 'new_speed_test' and data.get('jitter', 0) >= 1000:
+                            # The jitter field carries the sequence number of the ingest
+                            marker = int(data['jitter']) - 1000
+                            if marker in sent:
+                                mine.append(now - sent[marker])
+                        elif item['event'] == 'error_analysis' and first:
+                            analyses[str(data['id'])] = now
+                    with lock:
+                        if all(len(r) >= total for r in received):
+                            done.set()
+
+                client.on('events', on_events)
+                client.connect(server.url, transports=transports)
+                clients.append(client)
+
+            session = requests.Session()
+            session.headers['Authorization'] = f'Bearer {ADMIN_TOKEN}'
+            started = time.perf_counter()
+            batch = 10
+            for offset in range(0, total, batch):
+                items = [{'download_speed': 90.0, 'upload_speed': 10.0, 'ping': 10.0, 'jitter': 1000 + n}
+                         for n in range(offset, min(total, offset + batch))]
+                now = time.perf_counter()
+                for n in range(offset, offset + len(items)):
+                    sent[n] = now
+                session.post(server.url + '/api/ingest/speed_test', json=items, timeout=10)
+            done.wait(60)
+            elapsed = time.perf_counter() - started
+
+            # Error logs are analysed by the stand-in AI and the result pushed out
+            error_sent = {}
+            for n in range(params['errors']):
+                error_sent[n] = time.perf_counter()
+                session.post(server.url + '/api/ingest/error_log', json={
+                    'error_type': 'bench', 'description': f'benchmark error {n} {"x" * n}'}, timeout=10)
+            deadline = time.monotonic() + 30
+            while len(analyses) < params['errors'] and time.monotonic() < deadline:
+                time.sleep(0.05)
+            for client in clients:
+                client.disconnect()
+    finally:
+        ai.stop()
+
+    latencies = [value for r in received for value in r]
+    delivered = len(latencies)
+    result = {'clients': params['clients'], 'transport': transports[0],
+              'delivered': delivered, 'expected': total * params['clients'],
+              'deliveries_per_s': round(delivered / elapsed, 1)}
+    result.update(latency_summary('delivery', latencies))
+    # Error ids are assigned by the database, so match them up by arrival order
+    analysis_times = sorted(analyses.values())
+    waits = [arrived - sent_at for sent_at, arrived in zip(sorted(error_sent.values()), analysis_times)]
+    result.update(latency_summary('ai_analysis', waits))
+    return result
+
+
+def bench_startup(params: Dict, workdir: str) -> Dict:
+    import startup
+    result = {}
+    for name, values in startup.run(sorted(startup.TARGETS), params['startup_runs']).items():
+        for key, value in values.items():
+            result[f'{name} {key}'] = value
+    return result
+
+
+BENCHMARKS = {'probes': bench_probes, 'dns': bench_dns, 'api': bench_api, 'fanout': bench_fanout, 'db': bench_db,
+              'startup': bench_startup}
+
+
+# --- baselines --------------------------------------------------------------------
+
+def metadata(params: Dict) -> Dict:
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=NETMON_DIR,
+                                  capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        revision = None
+    return {'timestamp': datetime.utcnow().isoformat(), 'revision': revision,
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'seed': SEED, 'params': params}
+
+
+def comparable(results: Dict) -> Dict[str, float]:
+    flat = {}
+    for suite, metrics in results.items():
+        for name, value in metrics.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                flat[f'{suite}.{name}'] = value
+    return flat
+
+
+def direction(metric: str) -> int:
+    """+1 if bigger is better, -1 if smaller is better, 0 if informational."""
+    if metric.endswith('_per_s'):
+        return 1
+    if metric.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    regressions = []
+    now, before = comparable(current['results']), comparable(baseline['results'])
+    for key in sorted(set(now) & set(before)):
+        sign = direction(key)
+        old, new = before[key], now[key]
+        change = (new - old) / old if old else 0.0
+        worse = sign != 0 and -sign * change > tolerance
+        marker = 'REGRESSED' if worse else ''
+        print(f'{key:<56} {old:>12g} {new:>12g} {change:>+8.1%} {marker}')
+        if worse:
+            regressions.append(key)
+    if baseline['meta'].get('params') != current['meta']['params']:
+        print('note: parameters differ from the baseline run; numbers are not directly comparable')
+    if (baseline['meta'].get('cpus'), baseline['meta'].get('python')) != \
+            (current['meta']['cpus'], current['meta']['python']):
+        print('note: baseline was recorded on a different machine or Python version')
+    return regressions
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark netmon against local stand-ins')
+    parser.add_argument('suites', nargs='*', help=f'any of {", ".join(SUITES)} (default: all)')
+    for name, value in DEFAULTS.items():
+        parser.add_argument(f'--{name.replace("_", "-")}', type=type(value), default=value)
+    parser.add_argument('--save', metavar='FILE', help='write the results as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='allowed relative regression before --compare fails (default 0.10)')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--params', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(CHILDREN[args.child](json.loads(args.params))))
+        return 0
+
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error(f'unknown suite(s): {", ".join(sorted(unknown))}')
+    params = {name: getattr(args, name) for name in DEFAULTS}
+    workdir = tempfile.mkdtemp(prefix='netmon-bench-')
+    results = {}
+    try:
+        for suite in args.suites or SUITES:
+            print(f'running {suite}...', file=sys.stderr)
+            try:
+                results[suite] = BENCHMARKS[suite](params, workdir)
+            except Exception as e:
+                results[suite] = {'error': str(e)}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'meta': metadata(params), 'results': results}
+    for suite, metrics in results.items():
+        print(f'[{suite}]')
+        for name, value in metrics.items():
+            if name != 'checkpoints':
+                print(f'  {name:<44} {value}')
+        for point in metrics.get('checkpoints', []):
+            reads = ' '.join(f'{ms:g}' for ms in point['read_ms'].values())
+            print(f'  {point["rows"]:>10} rows {point["rows_per_s"]:>8} rows/s {point["db_size_mib"]:>8} MiB  reads ms: {reads}')
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f'\n{"metric":<56} {"baseline":>12} {"current":>12} {"change":>8}')
+        if compare(report, baseline, args.tolerance):
+            return 1
+    return 1 if any('error' in metrics for metrics in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
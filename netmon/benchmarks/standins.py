@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""Local stand-ins for the services netmon probes.
+
+Each stand-in listens on 127.0.0.1 on a free port and answers just enough
+of its protocol for the probes to succeed, after an optional fixed delay
+that plays the part of the service's own latency:
+
+- ``HTTPStandIn``: Traefik/Nginx/Pi-hole admin; plain HTTP or HTTPS with a
+  throwaway self-signed certificate (needs the ``openssl`` CLI). ``/redirect``
+  answers 301 to https, everything else 200.
+- ``DNSStandIn``: Bind9/Pi-hole; answers every A query with one address.
+- ``PostgresStandIn``: speaks the PostgreSQL wire protocol far enough for
+  ``pg_isready`` and a psycopg2 ``SELECT 1`` (trust auth, no TLS).
+- ``AIStandIn``: an OpenAI-style chat completions endpoint.
+
+``StandIns`` starts all of them and stops them on exit.
+"""
+import json
+import os
+import shutil
+import socket
+import socketserver
+import ssl
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class _Server:
+    # Serves in a daemon thread; subclasses create self.server
+    server: socketserver.BaseServer
+
+    def start(self) -> '_Server':
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+
+class _ThreadingHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def self_signed_cert(directory: str) -> Optional[str]:
+    """Write cert+key for localhost into one PEM file; None without openssl."""
+    if shutil.which('openssl') is None:
+        return None
+    path = os.path.join(directory, 'standin.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1',
+                    '-keyout', path, '-out', path + '.crt'],
+                   check=True, capture_output=True)
+    with open(path, 'a') as pem, open(path + '.crt') as crt:
+        pem.write(crt.read())
+    return path
+
+
+class HTTPStandIn(_Server):
+    def __init__(self, delay: float = 0.0, certfile: Optional[str] = None):
+        self.delay = delay
+        self.certfile = certfile
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real services
+
+            def do_GET(self):
+                time.sleep(stand_in.delay)
+                if self.path.startswith('/redirect'):
+                    self.send_response(301)
+                    self.send_header('Location', f'https://localhost:{stand_in.port}/')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = b'<html><body>ok</body></html>'
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_HEAD = do_GET
+
+            def log_message(self, *args):
+                pass
+
+        self.server = _ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile)
+            self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+
+    @property
+    def url(self) -> str:
+        return f'{"https" if self.certfile else "http"}://localhost:{self.port}'
+
+
+class AIStandIn(_Server):
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.requests = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                stand_in.requests += 1
+                time.sleep(stand_in.delay)
+                prompt = (payload.get('messages') or [{}])[-1].get('content', '')
+                body = json.dumps({'choices': [{'message': {
+                    'role': 'assistant', 'content': f'Stand-in analysis ({len(prompt)} chars)'}}]}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = _ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.port}/v1/chat/completions'
+
+
+class DNSStandIn(_Server):
+    def __init__(self, address: str = '172.20.0.10', delay: float = 0.0, miss_delay: float = 0.0):
+        import dns.message
+        import dns.rdatatype
+        import dns.rrset
+        self.address = address
+        self.delay = delay
+        # Extra time for a name asked for the first time, like a resolver
+        # that has to recurse before it can cache the answer
+        self.miss_delay = miss_delay
+        self.cached = set()
+        stand_in = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                data, sock = self.request
+                query = dns.message.from_wire(data)
+                response = dns.message.make_response(query)
+                for question in query.question:
+                    if question.rdtype == dns.rdatatype.A:
+                        response.answer.append(dns.rrset.from_text(question.name, 60, 'IN', 'A', stand_in.address))
+                names = {question.name for question in query.question}
+                miss = bool(names - stand_in.cached)
+                stand_in.cached |= names
+                time.sleep(stand_in.delay + (stand_in.miss_delay if miss else 0.0))
+                sock.sendto(response.to_wire(), self.client_address)
+
+        self.server = socketserver.ThreadingUDPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+
+
+class PostgresStandIn(_Server):
+    SSL_REQUEST = 80877103
+    GSSENC_REQUEST = 80877104
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        stand_in = self
+
+        def message(kind: bytes, body: bytes = b'') -> bytes:
+            return kind + struct.pack('!i', len(body) + 4) + body
+
+        class Handler(socketserver.BaseRequestHandler):
+            def recv(self, size: int) -> bytes:
+                data = b''
+                while len(data) < size:
+                    chunk = self.request.recv(size - len(data))
+                    if not chunk:
+                        raise ConnectionError('client went away')
+                    data += chunk
+                return data
+
+            def handle(self):
+                try:
+                    self.serve()
+                except ConnectionError:
+                    pass
+
+            def serve(self):
+                while True:
+                    length, code = struct.unpack('!ii', self.recv(8))
+                    self.recv(length - 8)
+                    if code in (PostgresStandIn.SSL_REQUEST, PostgresStandIn.GSSENC_REQUEST):
+                        self.request.sendall(b'N')  # no TLS, carry on in plain text
+                        continue
+                    break
+                reply = message(b'R', struct.pack('!i', 0))  # AuthenticationOk
+                for name, value in (('server_version', '15.0'), ('server_encoding', 'UTF8'),
+                                    ('client_encoding', 'UTF8'), ('DateStyle', 'ISO, MDY'),
+                                    ('integer_datetimes', 'on'), ('standard_conforming_strings', 'on')):
+                    reply += message(b'S', name.encode() + b'\0' + value.encode() + b'\0')
+                reply += message(b'K', struct.pack('!ii', os.getpid(), 0))
+                reply += message(b'Z', b'I')
+                self.request.sendall(reply)
+                while True:
+                    kind = self.recv(1)
+                    (length,) = struct.unpack('!i', self.recv(4))
+                    body = self.recv(length - 4)
+                    if kind == b'X':
+                        return
+                    if kind != b'Q':
+                        continue
+                    time.sleep(stand_in.delay)
+                    query = body.rstrip(b'\0').strip()
+                    command = (query.split() or [b'SELECT'])[0].upper()
+                    if command == b'SELECT':
+                        reply = message(b'T', struct.pack('!h', 1) + b'?column?\0'
+                                        + struct.pack('!ihihih', 0, 0, 23, 4, -1, 0))
+                        reply += message(b'D', struct.pack('!hi', 1, 1) + b'1')
+                        reply += message(b'C', b'SELECT 1\0')
+                    else:
+                        reply = message(b'C', command + b'\0')
+                    self.request.sendall(reply + message(b'Z', b'I'))
+
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+
+
+class StandIns:
+    """Every stand-in at once: ``with StandIns(delay=0.005) as s: s.http.url``."""
+
+    def __init__(self, delay: float = 0.0, ai_delay: float = 0.05):
+        self.delay = delay
+        self.ai_delay = ai_delay
+        self.directory = tempfile.mkdtemp(prefix='netmon-standins-')
+        self.certfile: Optional[str] = None
+        self.servers = []
+
+    def __enter__(self) -> 'StandIns':
+        self.certfile = self_signed_cert(self.directory)
+        self.http = self._add(HTTPStandIn(self.delay))
+        self.https = self._add(HTTPStandIn(self.delay, self.certfile)) if self.certfile else None
+        self.dns = self._add(DNSStandIn(delay=self.delay))
+        self.postgres = self._add(PostgresStandIn(self.delay))
+        self.ai = self._add(AIStandIn(self.ai_delay))
+        return self
+
+    def _add(self, server: _Server) -> _Server:
+        self.servers.append(server.start())
+        return server
+
+    def __exit__(self, *exc) -> None:
+        for server in self.servers:
+            server.stop()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+if __name__ == '__main__':
+    # Keep the stand-ins up for manual testing
+    with StandIns() as standins:
+        print(f'http      {standins.http.url}')
+        if standins.https:
+            print(f'https     {standins.https.url}  (CA: {standins.certfile}.crt)')
+        print(f'dns       127.0.0.1:{standins.dns.port}')
+        print(f'postgres  127.0.0.1:{standins.postgres.port}')
+        print(f'ai        {standins.ai.url}')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Cold-start benchmark for the netmon app and the probe scripts.
+
+Each target is imported (and its tester constructed) in a fresh interpreter
+so nothing is shared between runs; the median import time and peak memory
+over ``--runs`` runs are reported. Run from the netmon directory:
+
+    python3 benchmarks/startup.py --runs 5
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+NETMON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(NETMON_DIR, 'scripts')
+
+TARGETS = {
+    'app': 'import app',
+    'service_tests': 'import service_tests; service_tests.ServiceTester()',
+    'enhanced_service_tests': 'import enhanced_service_tests; enhanced_service_tests.ServiceTester()',
+}
+
+# Runs in the child: time the target, then report peak RSS and module count
+PROBE = '''
+import json, resource, sys, time
+started = time.perf_counter()
+exec(sys.argv[1])
+elapsed = time.perf_counter() - started
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'seconds': elapsed, 'max_rss_kb': rss, 'modules': len(sys.modules)}))
+'''
+
+
+def measure(code: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [NETMON_DIR, SCRIPTS_DIR] + [p for p in [os.getenv('PYTHONPATH')] if p]))
+    completed = subprocess.run([sys.executable, '-c', PROBE, code], cwd=NETMON_DIR, env=env,
+                               capture_output=True, text=True, timeout=120)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else 'failed')
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run(targets, runs: int) -> dict:
+    report = {}
+    for name in targets:
+        try:
+            samples = [measure(TARGETS[name]) for _ in range(runs)]
+        except Exception as e:
+            report[name] = {'error': str(e)}
+            continue
+        report[name] = {
+            'import_ms': round(statistics.median(s['seconds'] for s in samples) * 1000, 1),
+            'max_rss_mb': round(statistics.median(s['max_rss_kb'] for s in samples) / 1024, 1),
+            'modules': samples[-1]['modules'],
+        }
+    return report
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Measure netmon cold start time and memory')
+    parser.add_argument('targets', nargs='*', help=f'any of {", ".join(sorted(TARGETS))} (default: all)')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='print the raw report as JSON')
+    args = parser.parse_args()
+    unknown = set(args.targets) - set(TARGETS)
+    if unknown:
+        parser.error(f'unknown target(s): {", ".join(sorted(unknown))}')
+
+    report = run(args.targets or sorted(TARGETS), args.runs)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for name, result in report.items():
+        if 'error' in result:
+            print(f'{name:<24} error: {result["error"]}')
+        else:
+            print(f'{name:<24} {result["import_ms"]:>8.1f} ms {result["max_rss_mb"]:>7.1f} MB '
+                  f'{result["modules"]:>6} modules')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
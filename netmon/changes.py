@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+# Unchanged results are stored again only this often, as checkpoints
+CHECKPOINT_INTERVAL = timedelta(seconds=float(os.getenv('NETMON_CHECKPOINT_INTERVAL', '86400')))
+
+# Change types that also go to the error log (and its AI analysis)
+ALERTS = {'host_down', 'port_opened', 'check_failed', 'dns_changed'}
+
+
+class ChangeEvent(NamedTuple):
+    type: str     # new_host, host_up, host_down, port_opened, port_closed, service_changed,
+                  # check_failed, check_recovered, dns_changed, http_changed
+    target: str
+    detail: Dict
+
+    @property
+    def severity(self) -> str:
+        return 'warning' if self.type in ALERTS else 'info'
+
+    def describe(self) -> str:
+        detail = self.detail
+        if self.type in ('port_opened', 'port_closed'):
+            return f"{self.target}: port {detail['port']} {self.type[5:]}"
+        if self.type == 'service_changed':
+            return f"{self.target}: port {detail['port']} now runs {detail['service']} {detail['version']}".rstrip()
+        if self.type == 'dns_changed':
+            return f"{self.target}: answer changed from {', '.join(detail['before']) or 'nothing'} " \
+                   f"to {', '.join(detail['after']) or 'nothing'}"
+        if self.type == 'http_changed':
+            return f"{self.target}: response changed from {detail['before']!r} to {detail['after']!r}"
+        if self.type == 'check_failed':
+            return f"{self.target}: {detail['result']}"
+        return f"{self.target}: {self.type.replace('_', ' ')}"
+
+
+def fingerprint(state: Any) -> str:
+    return hashlib.sha1(json.dumps(state, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _dns_answers(output: str) -> List[str]:
+    # nslookup prints the server first; the answer follows the first "Name:"
+    answers, in_answer = [], False
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith('Name:'):
+            in_answer = True
+        elif in_answer and line.startswith('Address:'):
+            answers.append(line.split(':', 1)[1].strip())
+        elif 'canonical name =' in line:
+            answers.append(line.split('=', 1)[1].strip().rstrip('.'))
+    return sorted(set(answers))
+
+
+def check_state(scan_type: str, result: str) -> Dict:
+    """What a system check result means, without the parts that vary from
+    run to run (timings, server banners, dates)."""
+    status, _, detail = result.partition(':')
+    status = status.strip()
+    if status != 'success':
+        # "failed: connection error - <tool output>" -> "connection error"
+        return {'status': status, 'reason': detail.split(' - ', 1)[0].strip()}
+    if scan_type == 'dns_test':
+        return {'status': status, 'answers': _dns_answers(detail)}
+    if scan_type == 'web_test':
+        return {'status': status, 'response': detail.strip()}
+    return {'status': status}
+
+
+def check_events(target: str, before: Optional[Dict], after: Dict, result: str) -> List[ChangeEvent]:
+    failed = after['status'] != 'success'
+    if failed:
+        # A new way of failing is worth reporting too
+        if before is None or before != after:
+            return [ChangeEvent('check_failed', target, {'reason': after.get('reason', ''), 'result': result[:500]})]
+        return []
+    if before is None:
+        return []
+    if before['status'] != 'success':
+        return [ChangeEvent('check_recovered', target, {'previous_reason': before.get('reason', '')})]
+    if 'answers' in after and before.get('answers') != after['answers']:
+        return [ChangeEvent('dns_changed', target, {'before': before.get('answers') or [],
+                                                    'after': after['answers']})]
+    if 'response' in after and before.get('response') != after['response']:
+        return [ChangeEvent('http_changed', target, {'before': before.get('response', ''),
+                                                     'after': after['response']})]
+    return []
+
+
+def host_changed(diff: Dict) -> bool:
+    return bool(diff['opened_ports'] or diff['closed_ports'] or diff.get('changed_services')
+                or diff['state'] != diff['previous_state'])
+
+
+def host_events(diff: Dict) -> List[ChangeEvent]:
+    """Typed events for one host from :func:`scan_parser.diff_host`."""
+    host = diff['host']
+    if diff['previous_state'] is None:
+        if diff['state'] != 'up':
+            return []
+        # One event for a new host rather than one per port it has open
+        return [ChangeEvent('new_host', host, {'hostname': diff.get('hostname', ''),
+                                               'ports': diff['opened_ports']})]
+    events = []
+    if diff['state'] != diff['previous_state']:
+        events.append(ChangeEvent('host_up' if diff['state'] == 'up' else 'host_down', host,
+                                  {'hostname': diff.get('hostname', '')}))
+    events += [ChangeEvent('port_opened', host, {'port': port}) for port in diff['opened_ports']]
+    events += [ChangeEvent('port_closed', host, {'port': port}) for port in diff['closed_ports']]
+    events += [ChangeEvent('service_changed', host, service) for service in diff.get('changed_services', [])]
+    return events
+
+
+class ChangeDetector:
+    """Decides whether a new result is worth storing.
+
+    Keeps the fingerprint of the last stored state per key. A result is
+    stored when the key is new, when its state changed, or when the last
+    stored copy is older than ``checkpoint_interval`` (a checkpoint that
+    shows the thing was still checked). ``load`` fetches the last stored
+    state of a key from the database after a restart.
+    """
+
+    def __init__(self, checkpoint_interval: timedelta = CHECKPOINT_INTERVAL,
+                 load: Optional[Callable[[Hashable], Optional[Tuple[Any, datetime]]]] = None):
+        self.checkpoint_interval = checkpoint_interval
+        self.load = load
+        self._last: Dict[Hashable, Tuple[str, Any, datetime]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: Hashable) -> Optional[Tuple[str, Any, datetime]]:
+        if key not in self._last and self.load is not None:
+            loaded = self.load(key)
+            if loaded is not None:
+                state, stored_at = loaded
+                self._last[key] = (fingerprint(state), state, stored_at)
+        return self._last.get(key)
+
+    def due(self, key: Hashable, now: Optional[datetime] = None) -> bool:
+        """Whether a checkpoint of ``key`` should be stored now."""
+        now = now or datetime.utcnow()
+        with self._lock:
+            last = self._get(key)
+            return last is None or now - last[2] >= self.checkpoint_interval
+
+    def stored(self, key: Hashable, state: Any, now: Optional[datetime] = None) -> None:
+        with self._lock:
+            self._last[key] = (fingerprint(state), state, now or datetime.utcnow())
+
+    def decide(self, key: Hashable, state: Any, now: Optional[datetime] = None) -> Tuple[str, Any]:
+        """Returns the decision (``new``, ``changed``, ``checkpoint`` or
+        ``unchanged``) and the previously stored state, without recording
+        anything: call :meth:`stored` once the state has been committed."""
+        now = now or datetime.utcnow()
+        digest = fingerprint(state)
+        with self._lock:
+            last = self._get(key)
+            if last is None:
+                return 'new', None
+            if last[0] != digest:
+                return 'changed', last[1]
+            if now - last[2] >= self.checkpoint_interval:
+                return 'checkpoint', last[1]
+            return 'unchanged', last[1]
@@ -0,0 +1,22 @@
+import os
+from typing import Any, Callable
+
+# Set by serve.py before the app is imported; plain threads otherwise
+ASYNC_MODE = os.getenv('NETMON_ASYNC_MODE', 'threading')
+
+
+def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Run a call that would block the event loop on a native OS thread.
+
+    Under gevent or eventlet, C-level blocking work (SQLite commits, an
+    asyncio scan loop) would freeze every greenlet, so it is handed to the
+    hub's thread pool and only the calling greenlet waits. In threading mode
+    the call simply runs inline.
+    """
+    if ASYNC_MODE == 'gevent':
+        import gevent
+        return gevent.get_hub().threadpool.apply(func, args, kwargs)
+    if ASYNC_MODE == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(func, *args, **kwargs)
+    return func(*args, **kwargs)
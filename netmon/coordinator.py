@@ -0,0 +1,221 @@
+import ipaddress
+import itertools
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+DEFAULT_LEASE = 60.0          # seconds an agent holds a unit without checking in
+DEFAULT_MAX_ATTEMPTS = 3      # a unit that failed this often is given up
+DEFAULT_SHARD_PREFIX = 24
+MAX_LEASE_WAIT = 25.0         # longest an agent's lease request is held open
+
+
+def shard_network(target: str, prefix: int = DEFAULT_SHARD_PREFIX) -> List[ipaddress._BaseNetwork]:
+    """Split ``target`` into subnets of ``prefix`` (or keep it whole if smaller)."""
+    network = ipaddress.ip_network(target, strict=False)
+    if network.prefixlen >= prefix:
+        return [network]
+    return list(network.subnets(new_prefix=prefix))
+
+
+def shard_index(network: ipaddress._BaseNetwork, prefix: int, address: str) -> Optional[int]:
+    """Position of the shard of ``network`` that ``address`` falls into."""
+    ip = ipaddress.ip_address(address)
+    if ip.version != network.version or ip not in network:
+        return None
+    return (int(ip) - int(network.network_address)) >> (network.max_prefixlen - max(prefix, network.prefixlen))
+
+
+class Unit:
+    """One piece of work: a subnet to scan or a set of services to probe."""
+
+    def __init__(self, unit_id: str, round_id: str, kind: str, params: Dict, agent: Optional[str] = None):
+        self.id = unit_id
+        self.round = round_id
+        self.kind = kind
+        self.params = params
+        self.agent = agent  # only this agent may take it (probes measure from a vantage point)
+        self.leased_to: Optional[str] = None
+        self.expires = 0.0
+        self.attempts = 0
+
+    def payload(self) -> Dict:
+        return {'id': self.id, 'kind': self.kind, 'params': self.params}
+
+
+class Coordinator:
+    """Hands out work units to remote probe agents.
+
+    Work is planned in rounds (one network scan, one probe sweep) split into
+    units. Agents pull units whenever they have capacity, so a faster or
+    less loaded agent simply takes more of them and a round finishes in
+    about 1/N of the time with N agents. A leased unit goes back to the queue
+    if its agent stops checking in before the lease runs out, and the first
+    agent to report a unit completes it; a duplicate report is stale.
+    """
+
+    def __init__(self, lease: float = DEFAULT_LEASE, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.lease_time = lease
+        # An agent that missed more than one lease worth of check-ins is gone
+        self.agent_ttl = lease * 1.5
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self.units: Dict[str, Unit] = {}
+        self.rounds: Dict[str, Dict] = {}
+        self.agents: Dict[str, Dict] = {}
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+
+    def _seen(self, agent: str, info: Optional[Dict], now: float) -> None:
+        state = self.agents.get(agent)
+        if state is None:
+            state = self.agents[agent] = {'first_seen': now, 'completed': 0, 'failed': 0}
+        state['last_seen'] = now
+        if info:
+            state.update(info)
+        # Checking in renews every lease the agent holds
+        for unit in self.units.values():
+            if unit.leased_to == agent:
+                unit.expires = now + self.lease_time
+
+    def _expire(self, now: float) -> None:
+        for agent in [a for a, state in self.agents.items() if now - state['last_seen'] > self.agent_ttl]:
+            del self.agents[agent]
+        for unit in list(self.units.values()):
+            if unit.agent is not None and unit.agent not in self.agents:
+                self._drop(unit)
+            elif unit.leased_to is not None and unit.expires <= now:
+                unit.leased_to = None
+
+    def _drop(self, unit: Unit) -> None:
+        del self.units[unit.id]
+        state = self.rounds.get(unit.round)
+        if state is not None:
+            state['remaining'].discard(unit.id)
+            if not state['remaining']:
+                del self.rounds[unit.round]
+        self._cond.notify_all()
+
+    def heartbeat(self, agent: str, info: Optional[Dict] = None) -> None:
+        with self._cond:
+            self._seen(agent, info, self.clock())
+
+    def live_agents(self) -> Dict[str, Dict]:
+        with self._cond:
+            self._expire(self.clock())
+            return {agent: dict(state) for agent, state in self.agents.items()}
+
+    def plan(self, kind: str, params: Iterable[Dict], agent: Optional[str] = None) -> str:
+        """Queue one unit per item of ``params`` as a new round; returns its id."""
+        with self._cond:
+            round_id = f'{kind}-{next(self._ids)}'
+            units = [Unit(f'{round_id}.{i}', round_id, kind, p, agent) for i, p in enumerate(params)]
+            if units:
+                self.rounds[round_id] = {'kind': kind, 'started': self.clock(), 'total': len(units),
+                                         'remaining': {unit.id for unit in units}}
+                self.units.update((unit.id, unit) for unit in units)
+                self._cond.notify_all()
+            return round_id
+
+    def pending(self, agent: str, kind: str) -> bool:
+        with self._cond:
+            return any(unit.agent == agent and unit.kind == kind for unit in self.units.values())
+
+    def lease(self, agent: str, capacity: int = 1, kinds: Optional[Iterable[str]] = None,
+              info: Optional[Dict] = None, wait: float = 0.0) -> List[Dict]:
+        """Give ``agent`` up to ``capacity`` units, waiting up to ``wait``
+        seconds for work to be planned if there is none."""
+        kinds = set(kinds) if kinds else None
+        deadline = self.clock() + min(wait, MAX_LEASE_WAIT)
+        with self._cond:
+            while True:
+                now = self.clock()
+                self._seen(agent, info, now)
+                self._expire(now)
+                leased = []
+                for unit in self.units.values():
+                    if len(leased) >= capacity:
+                        break
+                    if (unit.leased_to is None and unit.agent in (None, agent)
+                            and (kinds is None or unit.kind in kinds)):
+                        unit.leased_to = agent
+                        unit.expires = now + self.lease_time
+                        unit.attempts += 1
+                        leased.append(unit.payload())
+                if leased or now >= deadline:
+                    return leased
+                self._cond.wait(deadline - now)
+
+    def get(self, unit_id: str) -> Optional[Unit]:
+        """The unit if it is still outstanding."""
+        with self._cond:
+            return self.units.get(unit_id)
+
+    def complete(self, agent: str, unit_id: str) -> Optional[Unit]:
+        """Mark a unit done; None if it is unknown or was already reported."""
+        with self._cond:
+            self._seen(agent, None, self.clock())
+            unit = self.units.get(unit_id)
+            if unit is None:
+                return None
+            self._drop(unit)
+            self.agents[agent]['completed'] += 1
+            return unit
+
+    def fail(self, agent: str, unit_id: str) -> Optional[Unit]:
+        """Put a failed unit back in the queue; returns it once it has used
+        up its attempts and was given up."""
+        with self._cond:
+            self._seen(agent, None, self.clock())
+            unit = self.units.get(unit_id)
+            if unit is None:
+                return None
+            self.agents[agent]['failed'] += 1
+            if unit.attempts >= self.max_attempts:
+                self._drop(unit)
+                return unit
+            unit.leased_to = None
+            self._cond.notify_all()
+            return None
+
+    def wait(self, round_id: str, timeout: Optional[float] = None) -> bool:
+        """Block until every unit of the round is done; False on timeout."""
+        deadline = None if timeout is None else self.clock() + timeout
+        with self._cond:
+            while round_id in self.rounds:
+                # Wake up now and then to notice agents that went away
+                remaining = self.lease_time if deadline is None else deadline - self.clock()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(min(remaining, self.lease_time))
+                self._expire(self.clock())
+            return True
+
+    def cancel(self, round_id: str) -> int:
+        """Drop whatever is left of a round; returns how many units that was."""
+        with self._cond:
+            state = self.rounds.get(round_id)
+            if state is None:
+                return 0
+            left = [self.units[unit_id] for unit_id in state['remaining']]
+            for unit in left:
+                self._drop(unit)
+            return len(left)
+
+    def status(self) -> Dict:
+        with self._cond:
+            now = self.clock()
+            self._expire(now)
+            return {
+                'agents': {agent: dict({k: v for k, v in state.items() if k not in ('first_seen', 'last_seen')},
+                                       last_seen_ago=round(now - state['last_seen'], 1),
+                                       leased=sum(1 for unit in self.units.values() if unit.leased_to == agent))
+                           for agent, state in self.agents.items()},
+                'rounds': {round_id: {'kind': state['kind'], 'total': state['total'],
+                                      'remaining': len(state['remaining']),
+                                      'elapsed': round(now - state['started'], 1)}
+                           for round_id, state in self.rounds.items()},
+                'units': {'pending': sum(1 for unit in self.units.values() if unit.leased_to is None),
+                          'leased': sum(1 for unit in self.units.values() if unit.leased_to is not None)},
+            }
@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+FLUSH_INTERVAL = 0.25  # seconds between batched frames
+HISTORY_SIZE = 2000    # events kept for reconnecting clients
+MAX_FRAME_EVENTS = 500
+
+
+class EventBus:
+    """Coalesces dashboard events into numbered, batched socket frames.
+
+    Every published event gets a sequence number. Pending events are sent as
+    one ``events`` frame per flush interval, so fan-out cost is one emit per
+    interval no matter how many rows were written. The most recent events are
+    kept so a reconnecting client can catch up from its last sequence number
+    instead of reloading everything.
+    """
+
+    def __init__(self, emit: Callable[[str, Dict], None],
+                 start_background_task: Optional[Callable] = None,
+                 sleep: Callable[[float], None] = time.sleep,
+                 flush_interval: float = FLUSH_INTERVAL, history_size: int = HISTORY_SIZE):
+        self.emit = emit
+        self.start_background_task = start_background_task
+        self.sleep = sleep
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._pending: List[Dict] = []
+        self._history: deque = deque(maxlen=history_size)
+        self._started = False
+        # Identifies this process's sequence; it restarts at 1 with every boot
+        self.epoch = f'{int(time.time() * 1000):x}'
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def publish(self, event: str, data: Dict) -> int:
+        with self._lock:
+            self._seq += 1
+            item = {'seq': self._seq, 'event': event, 'data': data}
+            self._pending.append(item)
+            self._history.append(item)
+            seq = self._seq
+        if not self._started:
+            self.flush()
+        return seq
+
+    def since(self, seq: int) -> Optional[List[Dict]]:
+        """Events after ``seq``, or None if they are no longer in history."""
+        with self._lock:
+            if seq >= self._seq:
+                return []
+            if not self._history or self._history[0]['seq'] > seq + 1:
+                return None
+            return [item for item in self._history if item['seq'] > seq]
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for start in range(0, len(pending), MAX_FRAME_EVENTS):
+            events = pending[start:start + MAX_FRAME_EVENTS]
+            self.emit('events', {'epoch': self.epoch, 'from': events[0]['seq'], 'to': events[-1]['seq'],
+                                 'events': events})
+
+    def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        if self.start_background_task is not None:
+            self.start_background_task(self._run)
+        else:
+            threading.Thread(target=self._run, name='event-bus', daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            self.sleep(self.flush_interval)
+            self.flush()
@@ -0,0 +1,184 @@
+"""Bulk export of monitoring history as gzip-compressed CSV, Parquet or
+Arrow IPC.
+
+Rows are read in chunks of ``chunk_rows`` by primary key, each chunk in a
+short read transaction of its own, so an export of any size holds one
+chunk in memory and never keeps a snapshot open that would stop SQLite's
+WAL from being checkpointed or hold up the app's writers.
+"""
+import csv
+import io
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Iterator, List, Optional
+
+from sqlalchemy import Table, func, select
+
+from cooperative import run_blocking
+
+DEFAULT_CHUNK_ROWS = 10000
+
+# Exportable tables and the column their time range applies to; each of
+# these columns needs an index that starts with it (see chunks)
+TIME_COLUMNS = {
+    'speed_test': 'timestamp',
+    'speed_test_rollup': 'bucket',
+    'error_log': 'timestamp',
+    'network_scan': 'timestamp',
+    'scan_host': 'timestamp',
+    'scan_port': 'timestamp',
+    'change_log': 'timestamp',
+    'probe_latency': 'bucket',
+    'job_run': 'started_at',
+}
+
+# format -> (mimetype, file extension)
+FORMATS = {
+    'csv': ('application/gzip', '.csv.gz'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', '.arrows'),
+}
+
+
+def chunks(engine, table: Table, start: Optional[datetime] = None, end: Optional[datetime] = None,
+           chunk_rows: int = DEFAULT_CHUNK_ROWS, run: Callable = run_blocking) -> Iterator[List[Any]]:
+    """Rows of ``table`` with their time in ``[start, end)``, oldest id first."""
+    when = table.c[TIME_COLUMNS[table.name]]
+    window = ([when >= start] if start else []) + ([when < end] if end else [])
+
+    def fetch(statement):
+        with engine.connect() as conn:
+            return conn.execute(statement).all()
+
+    # The time index gives the id range, so chunks never walk the rest of the table
+    low, high = run(fetch, select(func.min(table.c.id), func.max(table.c.id)).where(*window))[0]
+    if low is None:
+        return
+    last = low - 1
+    while True:
+        rows = run(fetch, select(table).where(table.c.id > last, table.c.id <= high, *window)
+                   .order_by(table.c.id).limit(chunk_rows))
+        if not rows:
+            return
+        yield rows
+        last = rows[-1].id
+
+
+class CsvEncoder:
+    def __init__(self, table: Table, level: int = 3):
+        self.columns = [column.name for column in table.columns]
+        # wbits=31: a gzip stream, compressed as it goes
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def _csv(self, rows) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return self._compressor.compress(buffer.getvalue().encode())
+
+    def header(self) -> bytes:
+        return self._csv([self.columns])
+
+    def encode(self, rows) -> bytes:
+        return self._csv([[value.isoformat() if isinstance(value, datetime) else value for value in row]
+                          for row in rows])
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Sink:
+    # Write-only file for pyarrow whose contents are taken out after every chunk
+    closed = False
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def close(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data, self._parts = b''.join(self._parts), []
+        return data
+
+
+def arrow_schema(table: Table):
+    import pyarrow as pa
+    types = {int: pa.int64(), float: pa.float64(), bool: pa.bool_(), datetime: pa.timestamp('us'),
+             bytes: pa.binary()}
+    return pa.schema([pa.field(column.name, types.get(column.type.python_type, pa.string()))
+                      for column in table.columns])
+
+
+class ArrowEncoder:
+    """Parquet (one row group per chunk) or an Arrow IPC stream, zstd-compressed."""
+
+    def __init__(self, table: Table, format: str = 'parquet'):
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise RuntimeError(f'{format} export needs pyarrow (pip install pyarrow)') from e
+        self._pa = pa
+        self.schema = arrow_schema(table)
+        self._sink = _Sink()
+        if format == 'parquet':
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(self._sink, self.schema, compression='zstd')
+        else:
+            self._writer = pa.ipc.new_stream(self._sink, self.schema,
+                                             options=pa.ipc.IpcWriteOptions(compression='zstd'))
+
+    def header(self) -> bytes:
+        return self._sink.drain()
+
+    def encode(self, rows) -> bytes:
+        columns = list(zip(*rows))
+        self._writer.write_batch(self._pa.record_batch(
+            [self._pa.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+            schema=self.schema))
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+def encoder(table: Table, format: str):
+    if format not in FORMATS:
+        raise ValueError(f"unknown format: {format} (one of {', '.join(FORMATS)})")
+    return CsvEncoder(table) if format == 'csv' else ArrowEncoder(table, format)
+
+
+def stream(engine, table: Table, format: str = 'csv', start: Optional[datetime] = None,
+           end: Optional[datetime] = None, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[bytes]:
+    """The export file of ``table`` piece by piece, one piece per chunk."""
+    writer = encoder(table, format)
+    yield writer.header()
+    for rows in chunks(engine, table, start, end, chunk_rows):
+        data = writer.encode(rows)
+        if data:
+            yield data
+    yield writer.finish()
+
+
+def filename(table: str, format: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> str:
+    span = '-'.join(moment.strftime('%Y%m%d') for moment in (start, end) if moment)
+    return f"{table}{'-' + span if span else ''}{FORMATS[format][1]}"
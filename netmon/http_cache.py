@@ -0,0 +1,181 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Dict, Iterable, Optional, Tuple
+
+from flask import Response, make_response, request
+from sqlalchemy import event, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+CACHE_MAX_ENTRIES = int(os.getenv('NETMON_HTTP_CACHE_ENTRIES', '256'))
+COMPRESS_MIN_BYTES = 1024
+# Headers that describe the body as sent rather than the cached content
+TRANSPORT_HEADERS = {'content-length', 'content-encoding', 'etag', 'last-modified', 'vary', 'cache-control'}
+# Databases with INSERT ... ON CONFLICT DO UPDATE; others update, then insert
+UPSERT_DIALECTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+def bump_version(session, table, name: str, now: datetime) -> None:
+    insert = UPSERT_DIALECTS.get(session.get_bind().dialect.name)
+    if insert is not None:
+        session.execute(insert(table).values(name=name, version=1, updated_at=now).on_conflict_do_update(
+            index_elements=['name'], set_={'version': table.c.version + 1, 'updated_at': now}))
+        return
+    result = session.execute(update(table).where(table.c.name == name)
+                             .values(version=table.c.version + 1, updated_at=now))
+    if result.rowcount == 0:
+        session.execute(table.insert().values(name=name, version=1, updated_at=now))
+
+
+def track_changes(model) -> None:
+    """Bump ``model``'s per-table version in every transaction that writes.
+
+    Versions live in the database, so every server process sees writes made
+    by the others. Bulk inserts, ``query.update()`` and ``delete()`` calls
+    are tracked as well as ORM flushes.
+    """
+    version_table = model.__table__.name
+
+    def changed(session):
+        return session.info.setdefault('changed_tables', set())
+
+    @event.listens_for(Session, 'after_flush')
+    def _after_flush(session, flush_context):
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            table = getattr(type(obj), '__table__', None)
+            if table is not None and table.name != version_table:
+                changed(session).add(table.name)
+
+    @event.listens_for(Session, 'do_orm_execute')
+    def _do_orm_execute(state):
+        if (state.is_insert or state.is_update or state.is_delete) and state.bind_mapper is not None:
+            table = state.bind_mapper.local_table.name
+            if table != version_table:
+                changed(state.session).add(table)
+
+    @event.listens_for(Session, 'before_commit')
+    def _before_commit(session):
+        session.flush()
+        tables = session.info.pop('changed_tables', None)
+        if not tables:
+            return
+        now = datetime.utcnow()
+        for name in sorted(tables):
+            bump_version(session, model.__table__, name, now)
+
+    @event.listens_for(Session, 'after_rollback')
+    def _after_rollback(session):
+        session.info.pop('changed_tables', None)
+
+
+class ResponseCache:
+    """In-process cache of rendered API responses.
+
+    Entries are keyed by path and query string and validated against the
+    versions of the tables the view reads, so a write anywhere invalidates
+    exactly the responses built from that table. Clients get a weak ETag and
+    Last-Modified and are answered with 304 while nothing changed; bodies are
+    compressed once per encoding and kept with the entry.
+    """
+
+    def __init__(self, session, model, max_entries: int = CACHE_MAX_ENTRIES):
+        self.session = session
+        self.model = model
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Tuple, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def versions(self, tables: Iterable[str]) -> Tuple[Tuple[int, ...], Optional[datetime]]:
+        tables = tuple(tables)
+        rows = {name: (version, updated_at) for name, version, updated_at in self.session.execute(
+            select(self.model.name, self.model.version, self.model.updated_at)
+            .where(self.model.name.in_(tables)))}
+        versions = tuple(rows.get(name, (0, None))[0] for name in tables)
+        modified = [updated_at for _, updated_at in rows.values() if updated_at is not None]
+        return versions, max(modified) if modified else None
+
+    def cached(self, *tables: str, ttl: Optional[float] = None):
+        """Cache a GET view that reads only ``tables``.
+
+        ``ttl`` is for views whose result also depends on the clock (sliding
+        time windows): their entries and ETags roll over every ``ttl`` seconds.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                versions, modified = self.versions(tables)
+                window = int(time.time() // ttl) if ttl else 0
+                key = (request.path, tuple(sorted(request.args.items(multi=True))))
+                etag = hashlib.sha1(repr((key, versions, window)).encode()).hexdigest()[:20]
+                last_modified = None if ttl else modified
+
+                if request.if_none_match.contains_weak(etag) or (
+                        not request.if_none_match and last_modified and request.if_modified_since
+                        and last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= request.if_modified_since):
+                    return self._headers(Response(status=304), etag, last_modified)
+
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None and entry['etag'] == etag:
+                        self._entries.move_to_end(key)
+                    else:
+                        entry = None
+                if entry is None:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    entry = {
+                        'etag': etag,
+                        'body': response.get_data(),
+                        'mimetype': response.mimetype,
+                        'headers': [(k, v) for k, v in response.headers.items()
+                                    if k.lower() not in TRANSPORT_HEADERS and k.lower() != 'content-type'],
+                        'encoded': {}
+                    }
+                    with self._lock:
+                        self._entries[key] = entry
+                        self._entries.move_to_end(key)
+                        while len(self._entries) > self.max_entries:
+                            self._entries.popitem(last=False)
+                return self._respond(entry, last_modified)
+            return wrapper
+        return decorator
+
+    def _respond(self, entry: Dict, last_modified: Optional[datetime]) -> Response:
+        body, encoding = entry['body'], None
+        if len(body) >= COMPRESS_MIN_BYTES:
+            if brotli is not None and request.accept_encodings['br']:
+                encoding = 'br'
+            elif request.accept_encodings['gzip']:
+                encoding = 'gzip'
+        if encoding:
+            encoded = entry['encoded'].get(encoding)
+            if encoded is None:
+                encoded = brotli.compress(body) if encoding == 'br' else gzip.compress(body, compresslevel=6)
+                entry['encoded'][encoding] = encoded
+            body = encoded
+        response = Response(body, mimetype=entry['mimetype'], headers=entry['headers'])
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return self._headers(response, entry['etag'], last_modified)
+
+    @staticmethod
+    def _headers(response: Response, etag: str, last_modified: Optional[datetime]) -> Response:
+        response.set_etag(etag, weak=True)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        # Always revalidate; an unchanged resource costs one 304
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
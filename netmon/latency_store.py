@@ -0,0 +1,193 @@
+import math
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PHASES = ('dns_ms', 'connect_ms', 'tls_ms', 'ttfb_ms', 'total_ms')
+QUANTILES = (0.5, 0.95, 0.99)
+RELATIVE_ACCURACY = 0.01
+RING_CAPACITY = 2048   # raw samples kept per check
+BUCKET_SECONDS = 60    # sketches are rolled up per minute
+
+
+class Sketch:
+    """Streaming quantile sketch with bounded relative error.
+
+    Values go into logarithmic buckets whose width grows with the value, so
+    any quantile is reported within ``RELATIVE_ACCURACY`` of the true value
+    using a few hundred counters at most. Sketches merge by adding counts,
+    which is how per-minute sketches are combined into any time window.
+    """
+
+    gamma = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+    log_gamma = math.log(gamma)
+
+    def __init__(self, counts: Optional[Dict[int, int]] = None, zeros: int = 0):
+        self.counts: Dict[int, int] = dict(counts or {})
+        self.zeros = zeros
+
+    @property
+    def count(self) -> int:
+        return self.zeros + sum(self.counts.values())
+
+    def add(self, value: float) -> None:
+        if value <= 0:
+            self.zeros += 1
+            return
+        key = math.ceil(math.log(value) / self.log_gamma)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def merge(self, other: 'Sketch') -> 'Sketch':
+        self.zeros += other.zeros
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen > rank:
+                # Midpoint of the bucket (gamma^(key-1), gamma^key]
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.counts) / (self.gamma + 1)
+
+    def to_dict(self) -> Dict:
+        return {'zeros': self.zeros, 'counts': {str(key): count for key, count in self.counts.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Sketch':
+        return cls({int(key): count for key, count in data.get('counts', {}).items()}, data.get('zeros', 0))
+
+
+class RingBuffer:
+    """Fixed-size columnar buffer of the most recent samples of one check."""
+
+    def __init__(self, capacity: int = RING_CAPACITY):
+        self.capacity = capacity
+        self.size = 0
+        self.next = 0
+        self.times = array('d', bytes(8 * capacity))
+        self.ok = array('b', bytes(capacity))
+        self.values = {phase: array('d', bytes(8 * capacity)) for phase in PHASES}
+
+    def append(self, timestamp: float, ok: bool, timing: Dict) -> None:
+        i = self.next
+        self.times[i] = timestamp
+        self.ok[i] = 1 if ok else 0
+        for phase in PHASES:
+            self.values[phase][i] = timing.get(phase) or 0.0
+        self.next = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def samples(self, since: float = 0.0, limit: Optional[int] = None) -> List[Dict]:
+        start = (self.next - self.size) % self.capacity
+        indexes = [(start + n) % self.capacity for n in range(self.size)]
+        indexes = [i for i in indexes if self.times[i] >= since]
+        if limit is not None:
+            indexes = indexes[-limit:]
+        return [dict({'timestamp': self.times[i], 'ok': bool(self.ok[i])},
+                     **{phase: self.values[phase][i] for phase in PHASES}) for i in indexes]
+
+
+class Bucket:
+    # One check's samples for one rollup interval
+    def __init__(self):
+        self.samples = 0
+        self.failures = 0
+        self.sketches = {phase: Sketch() for phase in PHASES}
+
+    def add(self, ok: bool, timing: Dict) -> None:
+        self.samples += 1
+        if not ok:
+            self.failures += 1
+        for phase in PHASES:
+            if phase in timing:
+                self.sketches[phase].add(timing[phase])
+
+    def copy(self) -> 'Bucket':
+        bucket = Bucket()
+        bucket.samples, bucket.failures = self.samples, self.failures
+        bucket.sketches = {phase: Sketch().merge(sketch) for phase, sketch in self.sketches.items()}
+        return bucket
+
+
+class LatencyStore:
+    """In-memory latency time series for service probes.
+
+    Every sample goes into its check's ring buffer (raw recent history) and
+    into the per-minute sketch bucket for that check. Closed minutes are
+    handed out by :meth:`drain` to be persisted; percentiles over a window are
+    computed by merging bucket sketches rather than sorting raw samples.
+    """
+
+    def __init__(self, capacity: int = RING_CAPACITY, bucket_seconds: int = BUCKET_SECONDS):
+        self.capacity = capacity
+        self.bucket_seconds = bucket_seconds
+        self._rings: Dict[Tuple[str, str], RingBuffer] = {}
+        self._buckets: Dict[Tuple[str, str, float], Bucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket_start(self, timestamp: float) -> float:
+        return timestamp - timestamp % self.bucket_seconds
+
+    def record(self, service: str, test_name: str, ok: bool, timing: Dict,
+               timestamp: Optional[float] = None) -> None:
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            ring = self._rings.get((service, test_name))
+            if ring is None:
+                ring = self._rings[(service, test_name)] = RingBuffer(self.capacity)
+            ring.append(timestamp, ok, timing)
+            key = (service, test_name, self.bucket_start(timestamp))
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = Bucket()
+            bucket.add(ok, timing)
+
+    def drain(self, now: Optional[float] = None) -> List[Tuple[str, str, float, Bucket]]:
+        """Remove and return every bucket whose interval has ended."""
+        current = self.bucket_start(time.time() if now is None else now)
+        with self._lock:
+            closed = [key for key in self._buckets if key[2] < current]
+            return [key + (self._buckets.pop(key),) for key in sorted(closed, key=lambda k: k[2])]
+
+    def pending(self) -> List[Tuple[str, str, float, Bucket]]:
+        """Copies of the buckets not drained yet (the current minute)."""
+        with self._lock:
+            return [key + (bucket.copy(),) for key, bucket in self._buckets.items()]
+
+    def samples(self, service: str, test_name: Optional[str] = None, since: float = 0.0,
+                limit: Optional[int] = None) -> Dict[str, List[Dict]]:
+        with self._lock:
+            return {name: ring.samples(since, limit) for (svc, name), ring in self._rings.items()
+                    if svc == service and (test_name is None or name == test_name)}
+
+
+def summarize(buckets: Iterable[Tuple[int, int, Dict[str, Sketch]]]) -> Dict:
+    """Merge ``(samples, failures, sketches)`` rows into percentiles per phase."""
+    samples = failures = 0
+    merged = {phase: Sketch() for phase in PHASES}
+    for count, failed, sketches in buckets:
+        samples += count
+        failures += failed
+        for phase, sketch in sketches.items():
+            if phase in merged:
+                merged[phase].merge(sketch)
+    return {
+        'samples': samples,
+        'failures': failures,
+        'phases': {phase: {f'p{int(q * 100)}': _round(sketch.quantile(q)) for q in QUANTILES}
+                   for phase, sketch in merged.items() if sketch.count}
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 2)
@@ -0,0 +1,257 @@
+import cProfile
+import contextlib
+import io
+import math
+import pstats
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+SORT_KEYS = tuple(key.value for key in pstats.SortKey)  # orders Profiler.report accepts
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}'] + list(self.samples())
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f'{self.name}_total{_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Gauge(Metric):
+    """A gauge that is set directly or read from a callback at scrape time."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.collect = collect
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> Iterator[str]:
+        if self.collect is not None:
+            values = self.collect()
+        else:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in sorted(values.items()):
+            if value is not None:
+                yield f'{self.name}{_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # bucket counts, then sum, then count
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block; profiled too while profiling is on."""
+        started = time.perf_counter()
+        try:
+            with profiler.span(self.name, labels):
+                yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        for key, state in sorted(values.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f'{self.name}_bucket{_labels(self.labelnames, key, le)} {_format_value(cumulative)}'
+            yield f'{self.name}_sum{_labels(self.labelnames, key)} {_format_value(state[-2])}'
+            yield f'{self.name}_count{_labels(self.labelnames, key)} {_format_value(state[-1])}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'metric already registered: {metric.name}')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # A failing gauge callback must not take the whole scrape down
+                lines.append(f'# {metric.name} unavailable: {_escape(e)}')
+        return '\n'.join(lines) + '\n'
+
+
+class Profiler:
+    """cProfile over instrumented spans, switched on at runtime.
+
+    While disabled a span costs one attribute check. While enabled each span
+    (a job run, a request, a DB commit...) runs under its own profiler and
+    the stats are accumulated per span name until the profiler is reset.
+    Profiling switches itself off after ``duration`` seconds.
+
+    A profiler hooks the whole OS thread, and under gevent/eventlet many
+    greenlets share one, so only one span per OS thread is profiled at a
+    time: spans that start while another is active there (nested, or in a
+    greenlet that interleaves with it) are not profiled on their own and
+    their frames count towards the active span.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.until: Optional[float] = None
+        self._stats: Dict[str, pstats.Stats] = {}
+        self._threads: Set[int] = set()  # OS threads with a profile running
+        self._lock = threading.Lock()
+
+    def start(self, duration: Optional[float] = None) -> None:
+        self.until = time.monotonic() + duration if duration else None
+        self.enabled = True
+
+    def stop(self) -> None:
+        self.enabled = False
+        self.until = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+    def active(self) -> bool:
+        if self.enabled and self.until is not None and time.monotonic() >= self.until:
+            self.stop()
+        return self.enabled
+
+    @contextlib.contextmanager
+    def span(self, name: str, labels: Optional[Dict] = None):
+        if not self.active():
+            yield
+            return
+        # The native id, not get_ident(): that one is per greenlet once patched
+        thread = threading.get_native_id()
+        with self._lock:
+            busy = thread in self._threads
+            self._threads.add(thread)
+        if busy:
+            yield
+            return
+        key = name + ''.join(f' {k}={v}' for k, v in sorted((labels or {}).items()))
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                self._threads.discard(thread)
+                stats = self._stats.get(key)
+                if stats is None:
+                    self._stats[key] = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+
+    def report(self, limit: int = 20, sort: str = 'cumulative') -> Dict[str, str]:
+        if sort not in SORT_KEYS:
+            raise ValueError(f"unknown sort order: {sort} (one of {', '.join(SORT_KEYS)})")
+        with self._lock:
+            spans = dict(self._stats)
+        report = {}
+        for key, stats in spans.items():
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats(sort).print_stats(limit)
+            report[key] = out.getvalue()
+        return report
+
+
+REGISTRY = Registry()
+profiler = Profiler()
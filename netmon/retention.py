@@ -0,0 +1,68 @@
+import math
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+METRICS = ('download_speed', 'upload_speed', 'ping', 'jitter')
+RESOLUTIONS = {
+    '1h': timedelta(hours=1),
+    '1d': timedelta(days=1),
+}
+
+# Raw samples must outlive the widest rollup bucket, otherwise daily
+# aggregates would be recomputed from a partial day.
+RAW_RETENTION_DAYS = max(2, int(os.getenv('NETMON_SPEEDTEST_RETENTION_DAYS', '30')))
+HOURLY_RETENTION_DAYS = int(os.getenv('NETMON_ROLLUP_HOURLY_RETENTION_DAYS', '365'))
+PROBE_RETENTION_DAYS = int(os.getenv('NETMON_PROBE_RETENTION_DAYS', '14'))
+
+RANGE_RE = re.compile(r'^(\d+)([hdw])$')
+RANGE_UNITS = {'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+
+def parse_range(value: str) -> timedelta:
+    """Parse a range like ``24h``, ``30d`` or ``12w``."""
+    match = RANGE_RE.match(value or '')
+    if not match:
+        raise ValueError(f'invalid range: {value!r}')
+    return timedelta(**{RANGE_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def default_resolution(span: timedelta) -> str:
+    if span <= timedelta(days=2):
+        return 'raw'
+    if span <= timedelta(days=60):
+        return '1h'
+    return '1d'
+
+
+def bucket_start(timestamp: datetime, resolution: str) -> datetime:
+    if resolution == '1h':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if resolution == '1d':
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f'unknown resolution: {resolution!r}')
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(values)))
+    return values[rank - 1]
+
+
+def aggregate(samples: Iterable) -> Dict[str, Optional[float]]:
+    """min/max/mean/p95 of every metric over ``samples`` (SpeedTest rows).
+
+    Keys are ``<metric>_<stat>``, matching the SpeedTestRollup columns.
+    """
+    samples = list(samples)
+    stats: Dict[str, Optional[float]] = {'samples': len(samples)}
+    for metric in METRICS:
+        values = sorted(v for v in (getattr(s, metric) for s in samples) if v is not None)
+        stats[f'{metric}_min'] = values[0] if values else None
+        stats[f'{metric}_max'] = values[-1] if values else None
+        stats[f'{metric}_mean'] = sum(values) / len(values) if values else None
+        stats[f'{metric}_p95'] = percentile(values, 95)
+    return stats
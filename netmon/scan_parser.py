@@ -0,0 +1,140 @@
+import re
+from typing import Dict, List, Optional
+
+REPORT_RE = re.compile(r'^Nmap scan report for (?:(?P<name>\S+) \((?P<ip>[^)]+)\)|(?P<addr>\S+))$')
+PORT_RE = re.compile(r'^(?P<port>\d+)/(?P<protocol>\w+)\s+(?P<state>\S+)\s+(?P<service>\S+)(?:\s+(?P<version>.*))?$')
+
+
+def parse_nmap_text(output: str) -> List[Dict]:
+    """Parse normal (-oN / stdout) nmap output into per-host dicts.
+
+    The shape matches what the built-in scanner produces:
+    ``{'host', 'state', 'hostname', 'ports': [{'port', 'protocol', 'state',
+    'service', 'version'}]}``.
+    """
+    hosts = []
+    current = None
+    for line in output.splitlines():
+        line = line.rstrip()
+        match = REPORT_RE.match(line)
+        if match:
+            current = {
+                'host': match.group('ip') or match.group('addr'),
+                'state': 'up',
+                'hostname': match.group('name') or '',
+                'ports': [],
+            }
+            hosts.append(current)
+            continue
+        if current is None:
+            continue
+        if line.startswith('Host seems down'):
+            current['state'] = 'down'
+            continue
+        match = PORT_RE.match(line)
+        if match:
+            current['ports'].append({
+                'port': int(match.group('port')),
+                'protocol': match.group('protocol'),
+                'state': match.group('state'),
+                'service': match.group('service'),
+                'version': (match.group('version') or '').strip()[:255],
+            })
+    return hosts
+
+
+GREPABLE_HOST_RE = re.compile(r'^Host: (?P<ip>\S+) \((?P<name>[^)]*)\)\t(?P<fields>.*)$')
+GREPABLE_PORT_SPLIT_RE = re.compile(r',\s(?=\d+/)')
+
+
+def _grepable_ports(field: str) -> List[Dict]:
+    ports = []
+    for entry in GREPABLE_PORT_SPLIT_RE.split(field.strip()):
+        # port/state/protocol/owner/service/rpc info/version/
+        parts = entry.split('/', 6)
+        if len(parts) < 7 or not parts[0].isdigit():
+            continue
+        ports.append({
+            'port': int(parts[0]),
+            'protocol': parts[2] or 'tcp',
+            'state': parts[1],
+            'service': parts[4],
+            'version': parts[6].rstrip('/').replace('|', '/').strip()[:255],
+        })
+    return ports
+
+
+class GrepableParser:
+    """Incremental parser for nmap's grepable output (``-oG -``).
+
+    Feed it one line at a time; it returns the hosts completed by that line
+    in the same shape as :func:`parse_nmap_text`. nmap prints a host's
+    ``Status`` line and then its ``Ports`` line, so a host is complete when
+    its ports arrive or the next host starts; :meth:`finish` returns
+    whatever is still open at the end.
+    """
+
+    def __init__(self):
+        self.pending: Optional[Dict] = None
+
+    def feed(self, line: str) -> List[Dict]:
+        match = GREPABLE_HOST_RE.match(line.rstrip('\r\n'))
+        if not match:
+            return []
+        done = []
+        if self.pending is not None and self.pending['host'] != match.group('ip'):
+            done.append(self.pending)
+            self.pending = None
+        if self.pending is None:
+            self.pending = {'host': match.group('ip'), 'state': 'up',
+                            'hostname': match.group('name'), 'ports': []}
+        host = self.pending
+        for field in match.group('fields').split('\t'):
+            key, _, value = field.partition(': ')
+            if key == 'Status':
+                host['state'] = 'up' if value.strip().lower() == 'up' else 'down'
+            elif key == 'Ports':
+                host['ports'] = _grepable_ports(value)
+                done.append(host)
+                self.pending = None
+        return done
+
+    def finish(self) -> List[Dict]:
+        done = [self.pending] if self.pending is not None else []
+        self.pending = None
+        return done
+
+
+def summarize(hosts: List[Dict]) -> str:
+    up = [host for host in hosts if host['state'] == 'up']
+    count = sum(1 for host in up for port in host['ports'] if port['state'] == 'open')
+    return f'{len(up)} hosts up, {count} open ports'
+
+
+def open_ports(host: Optional[Dict]) -> List[int]:
+    if not host or host['state'] != 'up':
+        return []
+    return sorted(port['port'] for port in host['ports'] if port['state'] == 'open')
+
+
+def _services(host: Optional[Dict]) -> Dict[int, tuple]:
+    if not host or host['state'] != 'up':
+        return {}
+    return {port['port']: (port.get('service') or '', port.get('version') or '')
+            for port in host['ports'] if port['state'] == 'open'}
+
+
+def diff_host(before: Optional[Dict], after: Dict) -> Dict:
+    """What changed for one host between two snapshots."""
+    now, previous = _services(after), _services(before)
+    return {
+        'host': after['host'],
+        'hostname': after.get('hostname', ''),
+        'state': after['state'],
+        'previous_state': before['state'] if before else None,
+        'opened_ports': sorted(set(now) - set(previous)),
+        'closed_ports': sorted(set(previous) - set(now)),
+        # Same port, different software (an upgrade, or something else listening)
+        'changed_services': [{'port': port, 'service': now[port][0], 'version': now[port][1]}
+                             for port in sorted(set(now) & set(previous)) if now[port] != previous[port]],
+    }
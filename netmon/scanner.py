@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+import asyncio
+import ipaddress
+import os
+import socket
+import ssl
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from scan_parser import diff_host
+
+DEFAULT_PORTS = [21, 22, 25, 53, 80, 110, 143, 443, 445, 993, 995,
+                 3306, 5000, 5432, 6379, 8080, 8081, 8443, 9000]
+LIVENESS_PORTS = [80, 443, 22, 53]
+HTTP_PORTS = {80, 5000, 8000, 8080, 8081, 9000}
+TLS_PORTS = {443, 8443, 993, 995}
+
+SCAN_CONCURRENCY = int(os.getenv('NETMON_SCAN_CONCURRENCY', '512'))
+SCAN_TIMEOUT = float(os.getenv('NETMON_SCAN_TIMEOUT', '0.5'))
+SCAN_FULL_EVERY = int(os.getenv('NETMON_SCAN_FULL_EVERY', '6'))
+SCAN_USE_ICMP = os.getenv('NETMON_SCAN_ICMP', 'false').lower() == 'true'
+
+
+def parse_ports(value: Optional[str]) -> List[int]:
+    if not value:
+        return list(DEFAULT_PORTS)
+    ports = set()
+    for part in value.split(','):
+        part = part.strip()
+        if '-' in part:
+            start, end = part.split('-', 1)
+            ports.update(range(int(start), int(end) + 1))
+        elif part:
+            ports.add(int(part))
+    return sorted(ports)
+
+
+async def _bounded(items: Iterable, worker: Callable, concurrency: int) -> None:
+    # A fixed set of workers pulls from one shared iterator, so a /16 never
+    # materialises 65k pending tasks at once.
+    iterator = iter(items)
+
+    async def run():
+        for item in iterator:
+            await worker(item)
+
+    await asyncio.gather(*(run() for _ in range(max(1, concurrency))))
+
+
+class Scanner:
+    """Asyncio TCP-connect scanner with incremental rescans.
+
+    Each run sweeps the target for live hosts, port-scans only hosts that are
+    new or whose known open ports changed, and fingerprints only ports that
+    were not open last time. Every ``full_every`` runs all live hosts get a
+    full port scan so newly opened ports on stable hosts are still found.
+
+    Scans may run at the same time from several threads: each works from a
+    copy of the known hosts and writes its results back under a lock.
+    """
+
+    def __init__(self, ports: Optional[List[int]] = None, concurrency: int = SCAN_CONCURRENCY,
+                 timeout: float = SCAN_TIMEOUT, full_every: int = SCAN_FULL_EVERY,
+                 use_icmp: bool = SCAN_USE_ICMP):
+        self.ports = ports or parse_ports(os.getenv('NETMON_SCAN_PORTS'))
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.full_every = full_every
+        self.use_icmp = use_icmp
+        self.previous: Dict[str, Dict] = {}
+        self.runs = 0
+        self._lock = threading.Lock()
+
+    def load_previous(self, hosts: Iterable[Dict]) -> None:
+        with self._lock:
+            self.previous = {host['host']: host for host in hosts}
+
+    def remember(self, hosts: Iterable[Dict]) -> None:
+        """Record hosts scanned elsewhere (by a probe agent)."""
+        with self._lock:
+            self.previous.update((host['host'], host) for host in hosts)
+
+    def known(self) -> Dict[str, Dict]:
+        """A copy of the last known state of every host."""
+        with self._lock:
+            return dict(self.previous)
+
+    async def _connect(self, host: str, port: int) -> Optional[bool]:
+        """True if the port is open, False if the host answered with a refusal,
+        None if nothing answered in time."""
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), self.timeout)
+        except ConnectionRefusedError:
+            return False
+        except (asyncio.TimeoutError, OSError):
+            return None
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
+
+    async def _ping(self, host: str) -> bool:
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                'ping', '-c', '1', '-W', str(max(1, int(self.timeout + 0.5))), host,
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+            return await proc.wait() == 0
+        except OSError:
+            return False
+
+    async def _is_alive(self, host: str) -> bool:
+        # A refused connection proves the host is up just as well as an open port
+        for port in LIVENESS_PORTS:
+            if await self._connect(host, port) is not None:
+                return True
+        return self.use_icmp and await self._ping(host)
+
+    async def _fingerprint(self, host: str, port: int) -> Dict:
+        try:
+            service = socket.getservbyport(port, 'tcp')
+        except OSError:
+            service = 'unknown'
+        version = ''
+        try:
+            if port == 5432:
+                service, version = await self._probe_postgres(host, port)
+            else:
+                version = await self._grab_banner(host, port)
+                if version.startswith('HTTP/'):
+                    service = 'https' if port in TLS_PORTS else 'http'
+                    version = next((line.split(':', 1)[1].strip() for line in version.splitlines()
+                                    if line.lower().startswith('server:')), '')
+                elif version.startswith('SSH-'):
+                    service = 'ssh'
+        except (asyncio.TimeoutError, OSError, ssl.SSLError):
+            pass
+        return {'port': port, 'protocol': 'tcp', 'state': 'open', 'service': service,
+                'version': version.splitlines()[0][:100] if version else ''}
+
+    async def _grab_banner(self, host: str, port: int) -> str:
+        context = None
+        if port in TLS_PORTS:
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=context), self.timeout * 4)
+        try:
+            try:
+                # Talkative services (SSH, FTP, SMTP) greet first
+                data = await asyncio.wait_for(reader.read(512), self.timeout)
+            except asyncio.TimeoutError:
+                data = b''
+            if not data and (port in HTTP_PORTS or port in TLS_PORTS):
+                writer.write(f'HEAD / HTTP/1.0\r\nHost: {host}\r\n\r\n'.encode())
+                await writer.drain()
+                data = await asyncio.wait_for(reader.read(2048), self.timeout * 2)
+            return data.decode('latin-1').strip()
+        finally:
+            writer.close()
+
+    async def _probe_postgres(self, host: str, port: int):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), self.timeout * 4)
+        try:
+            # SSLRequest: PostgreSQL answers with a single 'S' or 'N'
+            writer.write((8).to_bytes(4, 'big') + (80877103).to_bytes(4, 'big'))
+            await writer.drain()
+            reply = await asyncio.wait_for(reader.read(1), self.timeout * 2)
+            if reply in (b'S', b'N'):
+                return 'postgresql', 'ssl' if reply == b'S' else 'no-ssl'
+            return 'unknown', ''
+        finally:
+            writer.close()
+
+    async def _hostname(self, host: str) -> str:
+        loop = asyncio.get_running_loop()
+        try:
+            name, _, _ = await asyncio.wait_for(
+                loop.run_in_executor(None, socket.gethostbyaddr, host), self.timeout * 2)
+            return name
+        except (asyncio.TimeoutError, OSError):
+            return ''
+
+    def rotate(self) -> bool:
+        """Advance the ``full_every`` rotation; True when this run is a full scan."""
+        with self._lock:
+            full = self.full_every <= 1 or self.runs % self.full_every == 0
+            self.runs += 1
+        return full
+
+    async def scan(self, target: str, full: Optional[bool] = None) -> Dict:
+        """Scan ``target``; ``full`` forces (or skips) a full port scan instead
+        of following the ``full_every`` rotation."""
+        started = time.monotonic()
+        network = ipaddress.ip_network(target, strict=False)
+        addresses = (str(ip) for ip in (network.hosts() if network.num_addresses > 2 else network))
+        if full is None:
+            full = self.rotate()
+        previous = self.known()
+
+        up = set()
+        needs_scan = set()
+
+        async def sweep(host):
+            known = previous.get(host)
+            known_ports = [p['port'] for p in known['ports']] if known and known.get('state') == 'up' else []
+            if known_ports and not full:
+                states = [await self._connect(host, port) for port in known_ports]
+                if all(states):
+                    up.add(host)
+                    return
+                if any(state is not None for state in states) or await self._is_alive(host):
+                    up.add(host)
+                    needs_scan.add(host)
+                return
+            if await self._is_alive(host):
+                up.add(host)
+                if full or not known or known.get('state') != 'up':
+                    needs_scan.add(host)
+
+        await _bounded(addresses, sweep, self.concurrency)
+
+        open_ports: Dict[str, List[int]] = {host: [] for host in needs_scan}
+
+        async def scan_port(pair):
+            host, port = pair
+            if await self._connect(host, port):
+                open_ports[host].append(port)
+
+        await _bounded(((h, p) for h in sorted(needs_scan) for p in self.ports),
+                       scan_port, self.concurrency)
+
+        # Fingerprint only ports we have not already identified
+        to_fingerprint = []
+        results: Dict[str, Dict] = {}
+        for host in up:
+            known = previous.get(host) or {}
+            known_ports = {p['port']: p for p in known.get('ports', [])} if known.get('state') == 'up' else {}
+            if host not in needs_scan:
+                results[host] = known
+                continue
+            ports = []
+            for port in sorted(open_ports[host]):
+                if port in known_ports:
+                    ports.append(known_ports[port])
+                else:
+                    to_fingerprint.append((host, port))
+            results[host] = {'host': host, 'state': 'up', 'hostname': known.get('hostname', ''),
+                             'ports': ports}
+
+        async def fingerprint(pair):
+            host, port = pair
+            results[host]['ports'].append(await self._fingerprint(host, port))
+
+        await _bounded(to_fingerprint, fingerprint, self.concurrency)
+
+        async def resolve(host):
+            results[host]['hostname'] = await self._hostname(host)
+
+        await _bounded([h for h in needs_scan if not results[h]['hostname']], resolve, self.concurrency)
+
+        changed = []
+        for host in sorted(up, key=ipaddress.ip_address):
+            result = results[host]
+            result['ports'].sort(key=lambda p: p['port'])
+            before = previous.get(host)
+            if (not before or before.get('state') != 'up'
+                    or [p['port'] for p in before['ports']] != [p['port'] for p in result['ports']]):
+                changed.append(result)
+        for host, before in previous.items():
+            if before.get('state') == 'up' and host not in up and ipaddress.ip_address(host) in network:
+                down = {'host': host, 'state': 'down', 'hostname': before.get('hostname', ''), 'ports': []}
+                results[host] = down
+                changed.append(down)
+
+        diffs = [diff_host(previous.get(host['host']), host) for host in changed]
+        with self._lock:
+            self.previous.update(results)
+
+        return {
+            'target': target,
+            'full': full,
+            'hosts': [results[h] for h in sorted(up, key=ipaddress.ip_address)],
+            'changed': changed,
+            'diffs': diffs,
+            'scanned_hosts': network.num_addresses,
+            'port_scanned_hosts': len(needs_scan),
+            'fingerprinted_ports': len(to_fingerprint),
+            'duration': round(time.monotonic() - started, 3),
+        }
+
+    def run(self, target: str, timeout: Optional[float] = None, full: Optional[bool] = None) -> Dict:
+        return asyncio.run(asyncio.wait_for(self.scan(target, full), timeout))
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Built-in TCP-connect network scanner')
+    parser.add_argument('target', nargs='?', default='172.20.0.0/16')
+    parser.add_argument('--store', action='store_true', help='store results in the netmon database')
+    args = parser.parse_args()
+
+    if args.store:
+        from app import app, run_builtin_scan
+        with app.app_context():
+            run_builtin_scan(args.target)
+        return
+
+    import json
+    print(json.dumps(Scanner().run(args.target), indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
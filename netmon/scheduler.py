@@ -0,0 +1,390 @@
+import contextlib
+import logging
+import os
+import random
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, ContextManager, Dict, Iterator, List, Optional
+
+KILL_GRACE = 10.0  # seconds a job gets to wind down after its processes are killed;
+                   # a run still going after that is abandoned
+MAX_LINE_BYTES = 64 * 1024  # longer output lines are truncated when streaming
+STDERR_TAIL_LINES = 50      # stderr lines kept from a streamed command
+
+_current = threading.local()
+
+
+class JobTimeout(Exception):
+    pass
+
+
+class JobSkipped(Exception):
+    """Raised by a job that decided not to run (e.g. rate limited)."""
+
+
+class JobContext:
+    """Per-run state handed to a job through a thread-local.
+
+    Subprocesses started with :func:`run_command` or :func:`stream_command`
+    are registered here so the
+    scheduler can kill them when the run exceeds its ``max_runtime``.
+    """
+
+    def __init__(self, name: str, deadline: float):
+        self.name = name
+        self.deadline = deadline
+        self.cancelled = threading.Event()
+        self._processes: List[subprocess.Popen] = []
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def register(self, process: subprocess.Popen) -> None:
+        with self._lock:
+            self._processes.append(process)
+        if self.cancelled.is_set():
+            process.kill()
+
+    def unregister(self, process: subprocess.Popen) -> None:
+        with self._lock:
+            if process in self._processes:
+                self._processes.remove(process)
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            try:
+                process.kill()
+            except OSError:
+                pass
+
+
+def current_context() -> Optional[JobContext]:
+    return getattr(_current, 'context', None)
+
+
+def remaining(default: Optional[float] = None) -> Optional[float]:
+    """Seconds left before the running job's deadline, or ``default``."""
+    context = current_context()
+    return context.remaining() if context else default
+
+
+def run_command(args: List[str], **kwargs) -> subprocess.CompletedProcess:
+    """``subprocess.run`` that the scheduler can kill on timeout.
+
+    Outside a scheduled job this is a plain ``subprocess.run``.
+    """
+    context = current_context()
+    if context is None:
+        return subprocess.run(args, **kwargs)
+
+    kwargs.setdefault('stdout', subprocess.PIPE)
+    kwargs.setdefault('stderr', subprocess.PIPE)
+    if kwargs.pop('capture_output', False):
+        kwargs['stdout'] = kwargs['stderr'] = subprocess.PIPE
+    timeout = kwargs.pop('timeout', None)
+    timeout = context.remaining() if timeout is None else min(timeout, context.remaining())
+    with subprocess.Popen(args, **kwargs) as process:
+        context.register(process)
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise
+        finally:
+            context.unregister(process)
+    if context.cancelled.is_set():
+        raise JobTimeout(f'{context.name} exceeded its maximum runtime')
+    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+
+class StreamingCommand:
+    """A running command whose stdout is consumed line by line.
+
+    Use as a context manager and iterate over it. Memory stays bounded
+    however much the command prints: lines are truncated at ``max_line``
+    bytes and only the last ``stderr_lines`` lines of stderr are kept (read
+    on a side thread so a chatty stderr cannot block the command). Leaving
+    the block kills the command if it is still running. Like
+    :func:`run_command`, the scheduler can kill it when the job overruns.
+    """
+
+    def __init__(self, args: List[str], timeout: Optional[float] = None,
+                 max_line: int = MAX_LINE_BYTES, stderr_lines: int = STDERR_TAIL_LINES, **kwargs):
+        self.args = args
+        self.context = current_context()
+        if self.context is not None:
+            timeout = self.context.remaining() if timeout is None else min(timeout, self.context.remaining())
+        self.timeout = timeout
+        self.max_line = max_line
+        self.kwargs = kwargs
+        self.process: Optional[subprocess.Popen] = None
+        self.timed_out = False
+        self.truncated_lines = 0
+        self._stderr = deque(maxlen=stderr_lines)
+        self._stderr_thread: Optional[threading.Thread] = None
+        self._timer: Optional[threading.Timer] = None
+
+    def __enter__(self) -> 'StreamingCommand':
+        # Own process group, so a timeout also kills anything the command forked
+        self.process = subprocess.Popen(self.args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                        start_new_session=True, **self.kwargs)
+        if self.context is not None:
+            self.context.register(self.process)
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_thread.start()
+        if self.timeout is not None:
+            self._timer = threading.Timer(self.timeout, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def __iter__(self) -> Iterator[str]:
+        stdout = self.process.stdout
+        skipping = False
+        while True:
+            chunk = stdout.readline(self.max_line)
+            if not chunk:
+                return
+            complete = chunk.endswith(b'\n')
+            if skipping:
+                # Rest of an over-long line
+                skipping = not complete
+                continue
+            if not complete and len(chunk) >= self.max_line:
+                skipping = True
+                self.truncated_lines += 1
+            yield chunk.decode('utf-8', 'replace').rstrip('\r\n')
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        if self.process.poll() is None and exc_type is not None:
+            self._kill()
+        try:
+            self.process.stdout.close()
+            self.process.wait()
+            self._stderr_thread.join()
+        finally:
+            if self.context is not None:
+                self.context.unregister(self.process)
+        if exc_type is not None:
+            return
+        if self.context is not None and self.context.cancelled.is_set():
+            raise JobTimeout(f'{self.context.name} exceeded its maximum runtime')
+        if self.timed_out:
+            raise subprocess.TimeoutExpired(self.args, self.timeout, stderr=self.stderr)
+
+    def _expire(self) -> None:
+        self.timed_out = True
+        self._kill()
+
+    def _kill(self) -> None:
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    def _drain_stderr(self) -> None:
+        for line in iter(lambda: self.process.stderr.readline(self.max_line), b''):
+            self._stderr.append(line.decode('utf-8', 'replace').rstrip('\r\n'))
+        self.process.stderr.close()
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self.process.returncode if self.process else None
+
+    @property
+    def stderr(self) -> str:
+        return '\n'.join(self._stderr)
+
+
+def stream_command(args: List[str], **kwargs) -> StreamingCommand:
+    """Run ``args`` and iterate over its output as it is produced.
+
+    ``with stream_command(['nmap', ...]) as command: for line in command: ...``
+    """
+    return StreamingCommand(args, **kwargs)
+
+
+class Job:
+    def __init__(self, name: str, func: Callable[[], None], interval: float,
+                 max_runtime: Optional[float] = None, jitter: float = 0.0,
+                 run_on_start: bool = False):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.max_runtime = max_runtime or interval
+        self.jitter = jitter
+        self.run_on_start = run_on_start
+
+        self.running = False
+        self.last_started: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+        self.last_outcome: Optional[str] = None
+        self.next_run: Optional[float] = None
+        self.lag: Optional[float] = None  # how late the last scheduled run started
+        self.last_run: Optional[float] = None  # monotonic start of the last run
+        self.triggered = False
+        self.wakeup = threading.Event()
+        # The thread of a run that overran and did not stop when told to
+        self.abandoned: Optional[threading.Thread] = None
+
+    def set_interval(self, interval: float) -> None:
+        """Change the interval; the next run is re-planned from the last one."""
+        if interval != self.interval:
+            self.interval = interval
+            self.wakeup.set()
+
+
+class JobScheduler:
+    """Runs every job on its own worker thread.
+
+    Runs are anchored to a fixed-rate slot grid so they do not drift; slots
+    missed while a run overran are skipped and recorded rather than queued.
+    A job never overlaps itself, and a run that exceeds ``max_runtime`` has
+    its subprocesses killed and is recorded as a timeout. A run stuck in
+    Python code cannot be killed: it is left behind on its daemon thread,
+    and the job's runs are skipped until that thread ends. Each run is
+    reported to ``on_finish`` with its duration and outcome.
+    """
+
+    def __init__(self, context_factory: Callable[[], ContextManager] = contextlib.nullcontext,
+                 on_finish: Optional[Callable[[Dict], None]] = None):
+        self.context_factory = context_factory
+        self.on_finish = on_finish
+        self.jobs: Dict[str, Job] = {}
+        self.started = False
+        self._threads: List[threading.Thread] = []
+
+    def add(self, job: Job) -> Job:
+        self.jobs[job.name] = job
+        return job
+
+    def start(self) -> None:
+        self.started = True
+        for job in self.jobs.values():
+            thread = threading.Thread(target=self._worker, args=(job,), name=f'job-{job.name}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def trigger(self, name: str) -> bool:
+        """Run a job now; False if it is already running."""
+        job = self.jobs[name]
+        if job.running:
+            return False
+        job.triggered = True
+        job.wakeup.set()
+        return True
+
+    def status(self) -> List[Dict]:
+        now = time.monotonic()
+        return [{
+            'name': job.name,
+            'interval': job.interval,
+            'max_runtime': job.max_runtime,
+            'running': job.running,
+            'last_started': job.last_started.isoformat() if job.last_started else None,
+            'last_duration': job.last_duration,
+            'last_outcome': job.last_outcome,
+            'lag': round(job.lag, 3) if job.lag is not None else None,
+            'next_run_in': round(max(0.0, job.next_run - now), 1) if job.next_run else None
+        } for job in self.jobs.values()]
+
+    def _worker(self, job: Job) -> None:
+        slot = time.monotonic() + (0 if job.run_on_start else job.interval)
+        while True:
+            job.next_run = slot + random.uniform(0, job.jitter)
+            job.wakeup.wait(max(0.0, job.next_run - time.monotonic()))
+            job.wakeup.clear()
+            triggered, job.triggered = job.triggered, False
+            if not triggered and time.monotonic() < job.next_run:
+                # Woken by an interval change: re-plan from the last run
+                slot = (job.last_run or time.monotonic()) + job.interval
+                continue
+            if not triggered:
+                job.lag = max(0.0, time.monotonic() - job.next_run)
+            self._run(job, 'manual' if triggered else 'scheduled')
+            if not triggered:
+                slot += job.interval
+
+            missed = 0
+            while slot <= time.monotonic():
+                slot += job.interval
+                missed += 1
+            if missed and not triggered:
+                self._record(job, datetime.utcnow(), 0.0, 'skipped', f'{missed} slot(s) missed while running')
+
+    def _run(self, job: Job, reason: str) -> None:
+        started_at = datetime.utcnow()
+        started = time.monotonic()
+        if job.abandoned is not None:
+            if job.abandoned.is_alive():
+                self._record(job, started_at, 0.0, 'skipped', 'an abandoned run has not stopped yet')
+                return
+            job.abandoned = None
+        context = JobContext(job.name, started + job.max_runtime)
+        errors: List[BaseException] = []
+
+        def target():
+            _current.context = context
+            try:
+                with self.context_factory():
+                    job.func()
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                _current.context = None
+
+        job.running = True
+        job.last_started = started_at
+        job.last_run = started
+        runner = threading.Thread(target=target, name=f'run-{job.name}', daemon=True)
+        runner.start()
+        runner.join(job.max_runtime)
+        outcome = 'success'
+        if runner.is_alive():
+            outcome = 'timeout'
+            context.cancel()
+            logging.warning(f'Job {job.name} exceeded {job.max_runtime:g}s, killing it')
+            runner.join(KILL_GRACE)
+            if runner.is_alive():
+                logging.error(f'Job {job.name} did not stop {KILL_GRACE:g}s after its timeout, abandoning it')
+                job.abandoned = runner
+                errors.insert(0, JobTimeout(f'{job.name} exceeded its maximum runtime and did not stop; '
+                                            f'abandoned'))
+        if errors and outcome == 'success':
+            if isinstance(errors[0], JobSkipped):
+                outcome = 'skipped'
+            elif isinstance(errors[0], (JobTimeout, subprocess.TimeoutExpired)):
+                outcome = 'timeout'
+            else:
+                outcome = 'error'
+        job.running = False
+        duration = time.monotonic() - started
+        detail = str(errors[0]) if errors else reason
+        self._record(job, started_at, duration, outcome, detail)
+
+    def _record(self, job: Job, started_at: datetime, duration: float, outcome: str, detail: str) -> None:
+        if outcome != 'skipped':
+            job.last_duration = round(duration, 3)
+            job.last_outcome = outcome
+        if self.on_finish is not None:
+            try:
+                self.on_finish({
+                    'job': job.name,
+                    'started_at': started_at,
+                    'duration': duration,
+                    'outcome': outcome,
+                    'detail': detail
+                })
+            except Exception:
+                logging.exception('Recording job run failed')
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""Check plan discovered from the Traefik dynamic configuration and Pi-hole's
+local DNS records.
+
+Every router with a ``Host()`` rule gets an HTTP(S) check, a TLS expiry
+check if it terminates TLS and a DNS check against Pi-hole (expecting the
+address from ``custom.list`` when there is a record for the name). Every
+``loadBalancer`` server gets a backend check. Names that only have a
+Pi-hole record get a DNS check too. Run this file to print the plan.
+"""
+import glob
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+from probe_engine import Check
+from probe_context import ProbeContext
+
+TRAEFIK_DYNAMIC_DIR = os.getenv('NETMON_TRAEFIK_DYNAMIC_DIR', '/etc/traefik/dynamic')
+PIHOLE_CUSTOM_LIST = os.getenv('NETMON_PIHOLE_CUSTOM_LIST', '/etc/pihole/custom.list')
+DNS_SERVER = os.getenv('NETMON_DISCOVERY_NAMESERVER', '172.20.0.20')  # Pihole IP
+TLS_EXPIRY_DAYS = int(os.getenv('NETMON_TLS_EXPIRY_DAYS', '14'))
+
+CONFIG_PATTERNS = ('*.yml', '*.yaml', '*.toml')
+HOST_RULE = re.compile(r'\bHost\(([^)]*)\)')
+QUOTED = re.compile(r'`([^`]+)`|"([^"]+)"')
+
+
+class CheckSpec(NamedTuple):
+    service: str
+    test_name: str
+    kind: str                       # http, https, tls_expiry, dns, backend
+    target: str                     # host name, or the backend's URL / host:port
+    expected: Optional[str] = None  # address a DNS check should get
+
+
+class Router(NamedTuple):
+    name: str
+    hosts: List[str]
+    service: str
+    tls: bool
+
+
+class Fragment(NamedTuple):
+    """What one config file contributes to the plan."""
+    routers: List[Router]
+    services: Dict[str, List[str]]  # service name -> server URLs / addresses
+    records: Dict[str, str]         # domain -> address
+
+
+class CheckPlan(NamedTuple):
+    version: int
+    checks: List[CheckSpec]
+    files: List[str]
+
+
+def _load(path: str) -> Dict:
+    if path.endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            import tomli as tomllib
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    import yaml
+    with open(path) as f:
+        return yaml.safe_load(f) or {}
+
+
+def rule_hosts(rule: str) -> List[str]:
+    """Host names matched by ``Host()`` in a router rule (not HostSNI or HostRegexp)."""
+    hosts = []
+    for args in HOST_RULE.findall(rule):
+        hosts += [a or b for a, b in QUOTED.findall(args)]
+    return hosts
+
+
+def _server_target(server: Dict) -> Optional[str]:
+    target = os.path.expandvars(str(server.get('url') or server.get('address') or ''))
+    # An unset ${VARIABLE} leaves nothing to check
+    return target if target and '$' not in target else None
+
+
+def parse_traefik(path: str) -> Fragment:
+    config = _load(path)
+    routers, services = [], {}
+    for protocol in ('http', 'tcp', 'udp'):
+        section = config.get(protocol) or {}
+        for name, router in (section.get('routers') or {}).items():
+            # Routers without Host() still count as users of their service
+            hosts = rule_hosts(router.get('rule', '')) if protocol == 'http' else []
+            tls = 'tls' in router or 'websecure' in (router.get('entryPoints') or [])
+            routers.append(Router(name, hosts, router.get('service', name), tls))
+        for name, service in (section.get('services') or {}).items():
+            servers = ((service or {}).get('loadBalancer') or {}).get('servers') or []
+            targets = [_server_target(server) for server in servers]
+            services[name] = [target for target in targets if target]
+    return Fragment(routers, services, {})
+
+
+def parse_custom_list(path: str) -> Fragment:
+    records = {}
+    with open(path) as f:
+        for line in f:
+            fields = line.split('#', 1)[0].split()
+            if len(fields) >= 2:
+                for domain in fields[1:]:
+                    records[domain.lower()] = fields[0]
+    return Fragment([], {}, records)
+
+
+def lookup(records: Dict[str, str], host: str) -> Optional[str]:
+    """Pi-hole's answer for ``host``, trying wildcard records as well."""
+    host = host.lower()
+    if host in records:
+        return records[host]
+    labels = host.split('.')
+    for i in range(1, len(labels)):
+        address = records.get('*.' + '.'.join(labels[i:]))
+        if address:
+            return address
+    return None
+
+
+def compile_plan(fragments: List[Fragment]) -> List[CheckSpec]:
+    routers = [router for fragment in fragments for router in fragment.routers]
+    services, records = {}, {}
+    for fragment in fragments:
+        services.update(fragment.services)
+        records.update(fragment.records)
+
+    specs, seen = [], set()
+
+    def add(service: str, kind: str, target: str, expected: Optional[str] = None) -> None:
+        if (kind, target) not in seen:
+            seen.add((kind, target))
+            specs.append(CheckSpec(service, f'{kind}:{target}'[:50], kind, target, expected))
+
+    for router in routers:
+        for host in router.hosts:
+            add(router.name, 'https' if router.tls else 'http', host)
+            if router.tls:
+                add(router.name, 'tls_expiry', host)
+            add(router.name, 'dns', host, lookup(records, host))
+    # Only services some router sends traffic to; name@file is the same
+    # service, name@internal and name@docker are not defined in these files
+    used = {router.service[:-len('@file')] if router.service.endswith('@file') else router.service
+            for router in routers}
+    for name, targets in services.items():
+        if name in used:
+            for target in targets:
+                add(name, 'backend', target)
+    for domain, address in records.items():
+        if not domain.startswith('*.'):
+            add('pihole', 'dns', domain, address)
+    return specs
+
+
+class Discovery:
+    """Keeps the check plan in step with the config files.
+
+    Each file is parsed again only when its modification time or size
+    changed, and the plan is recompiled only when a file changed, appeared
+    or went away. A file that fails to parse keeps its last good version.
+    """
+
+    def __init__(self, traefik_dir: str = TRAEFIK_DYNAMIC_DIR, custom_list: str = PIHOLE_CUSTOM_LIST):
+        self.traefik_dir = traefik_dir
+        self.custom_list = custom_list
+        self._files: Dict[str, Tuple[Tuple[int, int], Fragment]] = {}
+        self._plan = CheckPlan(0, [], [])
+        self._lock = threading.Lock()
+
+    def paths(self) -> List[str]:
+        paths = sorted(path for pattern in CONFIG_PATTERNS
+                       for path in glob.glob(os.path.join(self.traefik_dir, pattern)))
+        if os.path.isfile(self.custom_list):
+            paths.append(self.custom_list)
+        return paths
+
+    def plan(self) -> CheckPlan:
+        with self._lock:
+            paths = self.paths()
+            changed = set(self._files) - set(paths)
+            for path in changed:
+                del self._files[path]
+            for path in paths:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                stamp = (stat.st_mtime_ns, stat.st_size)
+                cached = self._files.get(path)
+                if cached is not None and cached[0] == stamp:
+                    continue
+                changed.add(path)
+                try:
+                    parse = parse_custom_list if path == self.custom_list else parse_traefik
+                    fragment = parse(path)
+                except Exception as e:
+                    logging.warning(f"Could not read {path}, keeping its last good version: {e}")
+                    fragment = cached[1] if cached else Fragment([], {}, {})
+                self._files[path] = (stamp, fragment)
+            if changed:
+                self._plan = CheckPlan(self._plan.version + 1,
+                                       compile_plan([self._files[path][1] for path in sorted(self._files)]),
+                                       sorted(self._files))
+                logging.info(f"Check plan v{self._plan.version}: {len(self._plan.checks)} checks "
+                             f"from {len(self._plan.files)} files")
+            return self._plan
+
+
+def _cert_expiry(cert: Dict) -> datetime:
+    return datetime.strptime(cert['notAfter'], '%b %d %H:%M:%S %Y %Z')
+
+
+def build_check(spec: CheckSpec, context: ProbeContext, nameserver: str = DNS_SERVER,
+                expiry_days: int = TLS_EXPIRY_DAYS) -> Check:
+    """Turn a planned check into one the probe engine can run."""
+    def web():
+        response = context.get(f'{spec.kind}://{spec.target}/', allow_redirects=False)
+        # Traefik answers 404 when no router matches the host
+        status = response.status_code < 500 and response.status_code != 404
+        return status, f'HTTP {response.status_code}'
+
+    def tls_expiry():
+        cert = context.tls_handshake(spec.target, 443)
+        days = (_cert_expiry(cert) - datetime.utcnow()).days
+        return days >= expiry_days, f'Certificate expires in {days} days'
+
+    def dns():
+        answers = sorted(str(answer) for answer in context.resolve(nameserver, spec.target))
+        status = bool(answers) and (spec.expected is None or spec.expected in answers)
+        message = ', '.join(answers)
+        if not status and spec.expected:
+            message = f'expected {spec.expected}, got {message or "nothing"}'
+        return status, message
+
+    def backend():
+        if '://' in spec.target:
+            response = context.get(spec.target, allow_redirects=False)
+            return response.status_code < 500, f'HTTP {response.status_code}'
+        parts = urlsplit(f'//{spec.target}')
+        context.connect(parts.hostname, parts.port)
+        return True, 'Accepting connections'
+
+    funcs = {'http': web, 'https': web, 'tls_expiry': tls_expiry, 'dns': dns, 'backend': backend}
+    return Check(spec.service, spec.test_name, context.timed(funcs[spec.kind]))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    plan = Discovery().plan()
+    print(json.dumps({'files': plan.files, 'checks': [spec._asdict() for spec in plan.checks]}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
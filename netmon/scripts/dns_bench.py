@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""DNS load and latency benchmark for Bind9 and Pi-hole.
+
+Sends A queries over UDP at a rate that ramps up in steps and reports, per
+step and overall, the answers per second, latency percentiles, timeouts and
+the highest rate the resolver kept up with. Queries are drawn from the local
+names Pi-hole serves (custom.list), the Traefik routers' host names and,
+when available, the Bind9 zone files. A share of them asks for a name made
+up for the run, which no cache can hold.
+
+The first query for a name in a run counts as cold, later ones as warm, so
+the two latencies show what the resolver's cache is worth.
+
+    python3 dns_bench.py                      # bind9 and pihole, 50 -> 1000 qps
+    python3 dns_bench.py --server 127.0.0.1:5353 --qps 100:5000:8 --step-duration 5
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from discovery import Discovery
+
+DNS_SERVERS = {'bind9': '172.20.0.10', 'pihole': '172.20.0.20'}
+BIND_ZONE_DIR = os.getenv('NETMON_BIND_ZONE_DIR', '/etc/bind')
+# Used when no config file is readable; the names the service checks ask for
+DEFAULT_NAMES = ['www.terrerov.com', 'traefik.terrerov.com', 'db.terrerov.com', 'monitor.terrerov.com']
+
+DEFAULT_QPS = (50.0, 1000.0, 5)   # first step, last step, number of steps
+DEFAULT_STEP_DURATION = 5.0
+DEFAULT_MAX_INFLIGHT = 256
+DEFAULT_TIMEOUT = 2.0
+DEFAULT_MISS_RATIO = 0.1
+# A step is sustained when at most this share of its queries went unanswered
+# (timed out, failed or not sent for lack of in-flight slots)
+SUSTAINED_LOSS = 0.01
+TICK = 0.005
+
+RECORD_TYPES = {'A', 'AAAA', 'CNAME', 'MX', 'TXT', 'SRV'}
+FAILED_RCODES = {2: 'SERVFAIL', 4: 'NOTIMP', 5: 'REFUSED'}  # NXDOMAIN is a valid answer
+
+
+def zone_names(path: str) -> List[str]:
+    """Owner names of the address-like records in a zone file."""
+    # db.terrerov.com holds terrerov.com unless it says otherwise
+    name = os.path.basename(path)
+    origin = name[3:] if name.startswith('db.') else None
+    names, owner = set(), None
+    with open(path) as f:
+        for line in f:
+            line = line.split(';', 1)[0].rstrip()
+            if not line.strip():
+                continue
+            fields = line.split()
+            if fields[0] == '$ORIGIN':
+                origin = fields[1].rstrip('.')
+                continue
+            if fields[0].startswith('$'):
+                continue
+            if not line[0].isspace():
+                owner = fields[0]
+            if owner is None or not RECORD_TYPES & {field.upper() for field in fields}:
+                continue
+            if owner == '@':
+                fqdn = origin
+            elif owner.endswith('.'):
+                fqdn = owner.rstrip('.')
+            else:
+                fqdn = f'{owner}.{origin}' if origin else None
+            if fqdn and '*' not in fqdn:
+                names.add(fqdn.lower())
+    return sorted(names)
+
+
+def query_names(discovery: Optional[Discovery] = None, zone_dir: str = BIND_ZONE_DIR) -> List[str]:
+    """Every name Pi-hole, Traefik or Bind9 is configured to answer for."""
+    names = {spec.target.lower() for spec in (discovery or Discovery()).plan().checks if spec.kind == 'dns'}
+    for path in glob.glob(os.path.join(zone_dir, 'db.*')):
+        try:
+            names.update(zone_names(path))
+        except (OSError, UnicodeDecodeError):
+            continue
+    return sorted(names) or list(DEFAULT_NAMES)
+
+
+def qps_ramp(first: float, last: float, steps: int) -> List[float]:
+    if steps <= 1:
+        return [float(last)]
+    return [round(first + (last - first) * i / (steps - 1), 1) for i in range(steps)]
+
+
+def parse_server(server: str) -> Tuple[str, int]:
+    if server.count(':') == 1:
+        host, port = server.split(':')
+        return host, int(port)
+    return server, 53
+
+
+def percentiles(prefix: str, seconds: List[float]) -> Dict[str, Optional[float]]:
+    ordered = sorted(seconds)
+    return {f'{prefix}p{q}_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))] * 1000, 2)
+            if ordered else None for q in (50, 90, 99)}
+
+
+class QueryMix:
+    """Picks the name of every query: one of ``names``, or with probability
+    ``miss_ratio`` a label made up for this run under one of their zones."""
+
+    def __init__(self, names: List[str], miss_ratio: float = DEFAULT_MISS_RATIO, seed: Optional[int] = None):
+        import dns.message
+        self._make_query = dns.message.make_query
+        self.names = list(names)
+        self.miss_ratio = miss_ratio
+        self.rng = random.Random(seed)
+        self.zones = sorted({name.split('.', 1)[1] if name.count('.') > 1 else name for name in self.names})
+        # Wire format per name, with the query id patched in per query
+        self._templates = {name: self._make_query(name, 'A').to_wire() for name in self.names}
+        self._asked = set()
+        self._misses = 0
+
+    def next(self) -> Tuple[bytes, bool]:
+        """Query in wire format (its id is replaced when sent) and whether it is cold."""
+        if self.rng.random() < self.miss_ratio:
+            self._misses += 1
+            name = f'bench-{self._misses}-{self.rng.getrandbits(32):08x}.{self.rng.choice(self.zones)}'
+            return self._make_query(name, 'A').to_wire(), True
+        name = self.rng.choice(self.names)
+        cold = name not in self._asked
+        self._asked.add(name)
+        return self._templates[name], cold
+
+
+class Step:
+    def __init__(self, qps: float, duration: float):
+        self.qps = qps
+        self.duration = duration
+        self.sent = self.answered = self.timeouts = self.throttled = 0
+        self.failed: Dict[str, int] = {}
+        self.latencies: List[float] = []
+        self.cold: List[float] = []
+        self.warm: List[float] = []
+
+    def report(self) -> Dict:
+        planned = self.sent + self.throttled
+        lost = self.timeouts + self.throttled + sum(self.failed.values())
+        return dict({
+            'target_qps': self.qps,
+            'sent': self.sent,
+            'answered': self.answered,
+            'answers_per_s': round(self.answered / self.duration, 1),
+            'timeouts': self.timeouts,
+            'failed': dict(self.failed),
+            'throttled': self.throttled,
+            'loss': round(lost / planned, 4) if planned else 0.0,
+        }, **percentiles('', self.latencies), **percentiles('cold_', self.cold), **percentiles('warm_', self.warm))
+
+
+class _Client(asyncio.DatagramProtocol):
+    # One UDP socket; answers are matched to queries by id
+    def __init__(self, loop: asyncio.AbstractEventLoop, timeout: float):
+        self.loop = loop
+        self.timeout = timeout
+        self.transport = None
+        self.pending: Dict[int, Tuple[float, bool, Step]] = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        if len(data) < 4:
+            return
+        query = self.pending.pop(int.from_bytes(data[:2], 'big'), None)
+        if query is None:
+            return  # a late answer to a query that already timed out
+        sent_at, cold, step = query
+        elapsed = self.loop.time() - sent_at
+        if elapsed > self.timeout:
+            # expire() had not come round to it yet
+            step.timeouts += 1
+            return
+        rcode = data[3] & 0x0F
+        if rcode in FAILED_RCODES:
+            step.failed[FAILED_RCODES[rcode]] = step.failed.get(FAILED_RCODES[rcode], 0) + 1
+            return
+        step.answered += 1
+        step.latencies.append(elapsed)
+        (step.cold if cold else step.warm).append(elapsed)
+
+    def expire(self, now: float) -> None:
+        for query_id in [i for i, (sent_at, _, _) in self.pending.items() if now - sent_at > self.timeout]:
+            self.pending.pop(query_id)[2].timeouts += 1
+
+
+async def _load(server: Tuple[str, int], mix: QueryMix, steps: List[Step], max_inflight: int,
+                timeout: float) -> None:
+    loop = asyncio.get_running_loop()
+    transport, client = await loop.create_datagram_endpoint(lambda: _Client(loop, timeout), remote_addr=server)
+    next_id = 0
+    try:
+        for step in steps:
+            started = loop.time()
+            while True:
+                now = loop.time()
+                elapsed = now - started
+                if elapsed >= step.duration:
+                    break
+                client.expire(now)
+                # Open loop: queries are due on schedule whatever the answers do
+                due = int(min(elapsed + TICK, step.duration) * step.qps) - step.sent - step.throttled
+                for _ in range(due):
+                    if len(client.pending) >= max_inflight:
+                        step.throttled += 1
+                        continue
+                    while next_id in client.pending:
+                        next_id = (next_id + 1) & 0xFFFF
+                    template, cold = mix.next()
+                    client.pending[next_id] = (loop.time(), cold, step)
+                    transport.sendto(next_id.to_bytes(2, 'big') + template[2:])
+                    step.sent += 1
+                    next_id = (next_id + 1) & 0xFFFF
+                await asyncio.sleep(TICK)
+        # Give the last queries their chance to be answered
+        deadline = loop.time() + timeout
+        while client.pending and loop.time() < deadline:
+            await asyncio.sleep(TICK)
+        client.expire(float('inf'))
+    finally:
+        transport.close()
+
+
+def run(server: str, names: List[str], qps: Optional[List[float]] = None, step_duration: float = DEFAULT_STEP_DURATION,
+        max_inflight: int = DEFAULT_MAX_INFLIGHT, timeout: float = DEFAULT_TIMEOUT,
+        miss_ratio: float = DEFAULT_MISS_RATIO, seed: Optional[int] = None) -> Dict:
+    """Load ``server`` (``host[:port]``) one step per rate in ``qps``."""
+    steps = [Step(rate, step_duration) for rate in (qps or qps_ramp(*DEFAULT_QPS))]
+    mix = QueryMix(names, miss_ratio, seed)
+    asyncio.run(_load(parse_server(server), mix, steps, max_inflight, timeout))
+
+    reports = [step.report() for step in steps]
+    sustained = [report['answers_per_s'] for report in reports if report['loss'] <= SUSTAINED_LOSS]
+    total = Step(0, sum(step.duration for step in steps))
+    for step in steps:
+        total.latencies += step.latencies
+        total.cold += step.cold
+        total.warm += step.warm
+    return dict({
+        'server': server,
+        'names': len(names),
+        'sent': sum(step.sent for step in steps),
+        'answered': sum(step.answered for step in steps),
+        'timeouts': sum(step.timeouts for step in steps),
+        'failed': sum(sum(step.failed.values()) for step in steps),
+        'throttled': sum(step.throttled for step in steps),
+        'sustained_qps': max(sustained) if sustained else 0.0,
+        'peak_answers_per_s': max(report['answers_per_s'] for report in reports),
+    }, **percentiles('', total.latencies), **percentiles('cold_', total.cold),
+        **percentiles('warm_', total.warm), steps=reports)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='DNS load and latency benchmark')
+    parser.add_argument('--server', action='append',
+                        help='host[:port] to load, repeatable (default: bind9 and pihole)')
+    parser.add_argument('--qps', default=':'.join(f'{value:g}' for value in DEFAULT_QPS),
+                        help='ramp as FIRST:LAST:STEPS, or a single rate (default %(default)s)')
+    parser.add_argument('--step-duration', type=float, default=DEFAULT_STEP_DURATION)
+    parser.add_argument('--max-inflight', type=int, default=DEFAULT_MAX_INFLIGHT)
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument('--miss-ratio', type=float, default=DEFAULT_MISS_RATIO,
+                        help='share of queries for made-up names no cache holds (default %(default)s)')
+    parser.add_argument('--names', help='comma separated names to ask for instead of the configured ones')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    parts = [float(part) for part in args.qps.split(':')]
+    if len(parts) == 1:
+        qps = parts
+    elif len(parts) == 3:
+        qps = qps_ramp(parts[0], parts[1], int(parts[2]))
+    else:
+        parser.error('--qps takes FIRST:LAST:STEPS or a single rate')
+    if not 0 < args.max_inflight <= 0xFFFF:
+        parser.error('--max-inflight must be between 1 and 65535')
+    servers = {server: server for server in args.server} if args.server else DNS_SERVERS
+    names = args.names.split(',') if args.names else query_names()
+    results = {label: run(server, names, qps, args.step_duration, args.max_inflight, args.timeout,
+                          args.miss_ratio, args.seed) for label, server in servers.items()}
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
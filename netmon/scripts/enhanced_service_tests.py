@@ -1,32 +1,23 @@
 #!/usr/bin/env python3
-import subprocess
-import requests
 import socket
-import ssl
-import dns.resolver
-import psycopg2
-import json
 import logging
-import docker
 from datetime import datetime
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Set, Tuple, Optional
 from enum import Enum
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('test.log'),
-        logging.StreamHandler()
-    ]
-)
+from probe_engine import Check, ProbeEngine, ProbeOutcome, DEFAULT_CHECK_TIMEOUT, DEFAULT_SWEEP_TIMEOUT
+from probe_context import ProbeContext
+from remediation import RemediationEngine
+# HTTP goes through ProbeContext's sessions; only their errors are needed here
+from requests import exceptions as http_errors
 
 class ErrorSeverity(Enum):
     LOW = "low"
     MODERATE = "moderate"
     CRITICAL = "critical"
 
+# (error_type, message, severity) returned by a failing check
+Failure = Tuple[str, str, ErrorSeverity]
+
 class TestError:
     def __init__(self, service: str, error_type: str, message: str, severity: ErrorSeverity):
         self.service = service
@@ -34,79 +25,69 @@ class TestError:
         self.message = message
         self.severity = severity
         self.timestamp = datetime.utcnow()
+        self.resolved = False
 
-class AutoResolver:
-    def __init__(self):
-        self.docker_client = docker.from_env()
-        self.resolution_attempts = {}
-
-    def can_auto_resolve(self, error: TestError) -> bool:
-        # Define which errors can be auto-resolved
-        auto_resolvable = {
-            'connection_error': [ErrorSeverity.MODERATE],
-            'timeout_error': [ErrorSeverity.MODERATE],
-            'service_unavailable': [ErrorSeverity.MODERATE],
-        }
-        return error.error_type in auto_resolvable and error.severity in auto_resolvable[error.error_type]
+# Errors a container restart can fix, by the severities it is tried for.
+# A critical connection error also restarts the services depending on it.
+AUTO_RESOLVABLE = {
+    'connection_error': [ErrorSeverity.MODERATE, ErrorSeverity.CRITICAL],
+    'timeout_error': [ErrorSeverity.MODERATE],
+    'service_unavailable': [ErrorSeverity.MODERATE],
+}
 
-    def restart_container(self, service_name: str) -> bool:
-        try:
-            container = self.docker_client.containers.get(f'terrerov_net_{service_name}_1')
-            container.restart()
-            logging.info(f"Successfully restarted container for service: {service_name}")
-            return True
-        except Exception as e:
-            logging.error(f"Failed to restart container {service_name}: {str(e)}")
-            return False
-
-    def restart_dependent_services(self, service_name: str) -> bool:
-        # Define service dependencies
-        dependencies = {
-            'traefik': ['nginx'],
-            'bind9': ['pihole'],
-            'postgresql': []
-        }
-        
-        success = True
-        if service_name in dependencies:
-            for dep in dependencies[service_name]:
-                if not self.restart_container(dep):
-                    success = False
-        return success
-
-    def resolve(self, error: TestError) -> bool:
-        if not self.can_auto_resolve(error):
-            return False
-
-        service_key = f"{error.service}_{error.error_type}"
-        attempt_count = self.resolution_attempts.get(service_key, 0)
-        
-        if attempt_count >= 3:  # Limit resolution attempts
-            logging.warning(f"Maximum auto-resolution attempts reached for {error.service}")
-            return False
-
-        self.resolution_attempts[service_key] = attempt_count + 1
-        
-        # Try to restart the affected service
-        if self.restart_container(error.service):
-            if error.severity == ErrorSeverity.CRITICAL:
-                # For critical errors, also restart dependent services
-                self.restart_dependent_services(error.service)
-            return True
-        return False
+# Probe service name -> compose service name, where they differ
+COMPOSE_SERVICES = {
+    'postgresql': 'postgres',
+}
+
+def can_auto_resolve(error: TestError) -> bool:
+    return error.error_type in AUTO_RESOLVABLE and error.severity in AUTO_RESOLVABLE[error.error_type]
 
 class ServiceTester:
-    def __init__(self):
+    def __init__(self, check_timeout: float = DEFAULT_CHECK_TIMEOUT,
+                 sweep_timeout: float = DEFAULT_SWEEP_TIMEOUT):
         self.results = []
         self.errors = []
-        self.resolver = dns.resolver.Resolver()
-        self.resolver.nameservers = ['172.20.0.10']  # Bind9 server IP
-        self.auto_resolver = AutoResolver()
+        self.check_timeout = check_timeout
+        self.engine = ProbeEngine(check_timeout=check_timeout, sweep_timeout=sweep_timeout)
+        # Connections, resolvers and TLS sessions persist across runs
+        self.context = ProbeContext(check_timeout)
+        self._remediation: Optional[RemediationEngine] = None
+        # service -> test name -> error, waiting for remediation after the sweep
+        self.pending: Dict[str, Dict[str, TestError]] = {}
+        self.cascade: Set[str] = set()
+
+    @property
+    def remediation(self) -> RemediationEngine:
+        # Built on first failure: a clean run never touches Docker or the compose file
+        if self._remediation is None:
+            self._remediation = RemediationEngine()
+        return self._remediation
 
-    def log_error(self, service: str, error_type: str, message: str, severity: ErrorSeverity) -> None:
+    def remediation_warning(self) -> Optional[str]:
+        # Only known once a failure has built the engine
+        if self._remediation is not None and self._remediation.graph.error:
+            return f"Remediation ran without service dependencies: {self._remediation.graph.error}"
+        return None
+
+    def log_result(self, service: str, test_name: str, status: bool, message: str,
+                   timing: Optional[Dict] = None) -> None:
+        result = {
+            'timestamp': datetime.utcnow().isoformat(),
+            'service': service,
+            'test_name': test_name,
+            'status': 'PASS' if status else 'FAIL',
+            'message': message
+        }
+        if timing:
+            result.update(timing)
+        self.results.append(result)
+
+    def log_error(self, service: str, error_type: str, message: str, severity: ErrorSeverity) -> TestError:
         error = TestError(service, error_type, message, severity)
         self.errors.append(error)
         logging.error(f"{service} - {error_type}: {message} (Severity: {severity.value})")
+        return error
 
     def generate_troubleshooting_guide(self, error: TestError) -> str:
         guides = {
@@ -192,106 +173,200 @@ class ServiceTester:
             return guides[error.service][error.error_type]
         return "No specific troubleshooting guide available for this error."
 
-    def handle_test_failure(self, service: str, error_type: str, message: str, severity: ErrorSeverity) -> None:
-        self.log_error(service, error_type, message, severity)
-        error = TestError(service, error_type, message, severity)
+    def handle_test_failure(self, service: str, error_type: str, message: str, severity: ErrorSeverity,
+                            test_name: Optional[str] = None) -> bool:
+        error = self.log_error(service, error_type, message, severity)
 
-        # Attempt automatic resolution
-        if self.auto_resolver.can_auto_resolve(error):
-            logging.info(f"Attempting automatic resolution for {service} {error_type}")
-            if self.auto_resolver.resolve(error):
-                logging.info(f"Automatic resolution successful for {service}")
-                # Rerun the test to verify the fix
-                return True
-            else:
-                logging.warning(f"Automatic resolution failed for {service}")
-
-        # Generate troubleshooting guide
-        guide = self.generate_troubleshooting_guide(error)
-        logging.info(f"Troubleshooting guide for {service} {error_type}:\n{guide}")
+        # Restarts are batched: remediate() handles every failure of the sweep at once
+        if test_name is not None and can_auto_resolve(error):
+            logging.info(f"Queueing automatic resolution for {service} {error_type}")
+            self.pending.setdefault(service, {})[test_name] = error
+            if severity == ErrorSeverity.CRITICAL:
+                self.cascade.add(service)
+            return True
+
+        self.log_guide(error)
         return False
 
-    def test_traefik(self) -> None:
-        # Test HTTP to HTTPS redirect
+    def log_guide(self, error: TestError) -> None:
+        guide = self.generate_troubleshooting_guide(error)
+        logging.info(f"Troubleshooting guide for {error.service} {error.error_type}:\n{guide}")
+
+    def remediate(self) -> None:
+        """Restart every service with a resolvable failure in one go, then
+        re-run only the checks that failed on the services that came back."""
+        pending, self.pending = self.pending, {}
+        cascade, self.cascade = self.cascade, set()
+        if not pending:
+            return
+        compose = {service: COMPOSE_SERVICES.get(service, service) for service in pending}
+        outcomes = self.remediation.remediate(compose.values(), cascade=[compose[s] for s in cascade])
+
+        recovered = {service for service, name in compose.items() if outcomes[name].ok}
+        checks = [check for check in self.checks()
+                  if check.service in recovered and check.test_name in pending[check.service]]
+        for outcome in self.engine.run(checks):
+            if self.handle_outcome(outcome, verify=True):
+                pending[outcome.check.service][outcome.check.test_name].resolved = True
+
+        for service, errors in pending.items():
+            for error in errors.values():
+                if error.resolved:
+                    logging.info(f"Automatic resolution successful for {service} {error.error_type}")
+                else:
+                    logging.warning(f"Automatic resolution failed for {service} {error.error_type}: "
+                                    f"{outcomes[compose[service]].outcome}")
+                    self.log_guide(error)
+
+    def check_http_redirect(self) -> Optional[Failure]:
         try:
-            response = requests.get('http://www.terrerov.com', allow_redirects=False)
+            response = self.context.get('http://www.terrerov.com', allow_redirects=False)
             if not (response.status_code == 301 and 'https://' in response.headers.get('Location', '')):
-                self.handle_test_failure('traefik', 'redirect_error', 'HTTP to HTTPS redirect not working', ErrorSeverity.MODERATE)
-        except requests.exceptions.ConnectionError as e:
-            self.handle_test_failure('traefik', 'connection_error', str(e), ErrorSeverity.CRITICAL)
+                return 'redirect_error', 'HTTP to HTTPS redirect not working', ErrorSeverity.MODERATE
+        except http_errors.ConnectionError as e:
+            return 'connection_error', str(e), ErrorSeverity.CRITICAL
+        return None
 
-        # Test HTTPS access and SSL
+    def check_https_access(self) -> Optional[Failure]:
         try:
-            response = requests.get('https://www.terrerov.com', verify=True)
+            response = self.context.get('https://www.terrerov.com', verify=True)
             if response.status_code != 200:
-                self.handle_test_failure('traefik', 'https_error', 'HTTPS access failed', ErrorSeverity.CRITICAL)
-        except requests.exceptions.SSLError as e:
-            self.handle_test_failure('traefik', 'ssl_error', str(e), ErrorSeverity.CRITICAL)
-        except requests.exceptions.ConnectionError as e:
-            self.handle_test_failure('traefik', 'connection_error', str(e), ErrorSeverity.CRITICAL)
+                return 'https_error', 'HTTPS access failed', ErrorSeverity.CRITICAL
+        except http_errors.SSLError as e:
+            return 'ssl_error', str(e), ErrorSeverity.CRITICAL
+        except http_errors.ConnectionError as e:
+            return 'connection_error', str(e), ErrorSeverity.CRITICAL
+        return None
 
-    def test_bind9(self) -> None:
+    def check_internal_resolution(self) -> Optional[Failure]:
         try:
-            answers = self.resolver.resolve('traefik.terrerov.com', 'A')
+            answers = self.context.resolve('172.20.0.10', 'traefik.terrerov.com')  # Bind9 server IP
             if not (len(answers) > 0 and str(answers[0]).startswith('172.20.')):
-                self.handle_test_failure('bind9', 'resolution_error', 'Internal DNS resolution failed', ErrorSeverity.CRITICAL)
+                return 'resolution_error', 'Internal DNS resolution failed', ErrorSeverity.CRITICAL
         except Exception as e:
-            self.handle_test_failure('bind9', 'resolution_error', str(e), ErrorSeverity.CRITICAL)
+            return 'resolution_error', str(e), ErrorSeverity.CRITICAL
+        return None
 
-    def test_nginx(self) -> None:
+    def check_nginx_access(self) -> Optional[Failure]:
         try:
-            response = requests.get('http://nginx.terrerov.com:8080')
+            response = self.context.get('http://nginx.terrerov.com:8080')
             if response.status_code != 200:
-                self.handle_test_failure('nginx', 'service_unavailable', 'Nginx service not responding correctly', ErrorSeverity.MODERATE)
-        except requests.exceptions.ConnectionError as e:
-            self.handle_test_failure('nginx', 'connection_error', str(e), ErrorSeverity.MODERATE)
+                return 'service_unavailable', 'Nginx service not responding correctly', ErrorSeverity.MODERATE
+        except http_errors.ConnectionError as e:
+            return 'connection_error', str(e), ErrorSeverity.MODERATE
+        return None
 
-    def test_pihole(self) -> None:
+    def check_external_resolution(self) -> Optional[Failure]:
         try:
-            resolver = dns.resolver.Resolver()
-            resolver.nameservers = ['172.20.0.20']
-            answers = resolver.resolve('google.com', 'A')
+            answers = self.context.resolve('172.20.0.20', 'google.com')  # Pihole IP
             if not len(answers) > 0:
-                self.handle_test_failure('pihole', 'dns_error', 'External DNS resolution failed', ErrorSeverity.CRITICAL)
+                return 'dns_error', 'External DNS resolution failed', ErrorSeverity.CRITICAL
         except Exception as e:
-            self.handle_test_failure('pihole', 'dns_error', str(e), ErrorSeverity.CRITICAL)
+            return 'dns_error', str(e), ErrorSeverity.CRITICAL
+        return None
 
-    def test_postgresql(self) -> None:
+    def check_postgresql_connection(self) -> Optional[Failure]:
+        import psycopg2
         try:
-            conn = psycopg2.connect(
+            row = self.context.pg_query(
+                'SELECT 1',
                 host='db.terrerov.com',
                 database='postgres',
                 user='postgres',
                 password='your_password'
             )
-            with conn.cursor() as cur:
-                cur.execute('SELECT 1')
-                if cur.fetchone()[0] != 1:
-                    self.handle_test_failure('postgresql', 'query_error', 'Database query failed', ErrorSeverity.MODERATE)
-            conn.close()
+            if row is None or row[0] != 1:
+                return 'query_error', 'Database query failed', ErrorSeverity.MODERATE
         except psycopg2.Error as e:
-            self.handle_test_failure('postgresql', 'connection_error', str(e), ErrorSeverity.MODERATE)
+            return 'connection_error', str(e), ErrorSeverity.MODERATE
+        return None
+
+    def checks(self) -> List[Check]:
+        timed = self.context.timed
+        return [
+            Check('traefik', 'http_redirect', timed(self.check_http_redirect)),
+            Check('traefik', 'https_access', timed(self.check_https_access)),
+            Check('bind9', 'internal_resolution', timed(self.check_internal_resolution)),
+            Check('nginx', 'internal_access', timed(self.check_nginx_access)),
+            Check('pihole', 'external_resolution', timed(self.check_external_resolution)),
+            Check('postgresql', 'connection', timed(self.check_postgresql_connection)),
+        ]
+
+    def handle_outcome(self, outcome: ProbeOutcome, verify: bool = False) -> bool:
+        """Log the outcome; failures are handled unless this is a re-check
+        after remediation. Returns whether the check passed."""
+        service, test_name = outcome.check.service, outcome.check.test_name
+        if verify:
+            test_name = f'{test_name}_recheck'
+        if outcome.timed_out or isinstance(outcome.error, (http_errors.Timeout, socket.timeout)):
+            failure = ('timeout_error', outcome.message, ErrorSeverity.MODERATE)
+            self.log_result(service, test_name, False, outcome.message,
+                            {'total_ms': round(outcome.duration * 1000, 2)})
+        elif outcome.error is not None:
+            failure = ('unexpected_error', str(outcome.error), ErrorSeverity.MODERATE)
+            self.log_result(service, test_name, False, outcome.message,
+                            {'total_ms': round(outcome.duration * 1000, 2)})
+        else:
+            failure, timing = outcome.value
+            self.log_result(service, test_name, failure is None, failure[1] if failure else 'OK', timing)
+        if failure is not None and not verify:
+            self.handle_test_failure(service, *failure, test_name=test_name)
+        return failure is None
+
+    def run_service(self, service: str) -> None:
+        checks = [check for check in self.checks() if check.service == service]
+        for outcome in self.engine.run(checks):
+            self.handle_outcome(outcome)
+        self.remediate()
+
+    def test_traefik(self) -> None:
+        self.run_service('traefik')
+
+    def test_bind9(self) -> None:
+        self.run_service('bind9')
+
+    def test_nginx(self) -> None:
+        self.run_service('nginx')
+
+    def test_pihole(self) -> None:
+        self.run_service('pihole')
+
+    def test_postgresql(self) -> None:
+        self.run_service('postgresql')
 
     def run_all_tests(self) -> Tuple[List[Dict], List[TestError]]:
-        self.test_traefik()
-        self.test_bind9()
-        self.test_nginx()
-        self.test_pihole()
-        self.test_postgresql()
+        # Probe everything in parallel first, then remediate all failures in one pass
+        for outcome in self.engine.run(self.checks()):
+            self.handle_outcome(outcome)
+        self.remediate()
         return self.results, self.errors
 
 def main():
+    # Configured here, not on import, so importing the tester creates no log file
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('test.log'),
+            logging.StreamHandler()
+        ]
+    )
     tester = ServiceTester()
     results, errors = tester.run_all_tests()
 
     # Log final results
     logging.info("\nTest Results Summary:")
     logging.info(f"Total Errors: {len(errors)}")
-    
+    warning = tester.remediation_warning()
+    if warning:
+        logging.error(warning)
+
     if errors:
         logging.error("\nDetected Errors:")
         for error in errors:
-            logging.error(f"{error.service} - {error.error_type} ({error.severity.value}): {error.message}")
+            logging.error(f"{error.service} - {error.error_type} ({error.severity.value}): {error.message}"
+                          + (" [resolved]" if error.resolved else ""))
+    if any(not error.resolved for error in errors):
         exit(1)
     else:
         logging.info("All tests passed successfully!")
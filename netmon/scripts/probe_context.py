@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+import socket
+import ssl
+import threading
+import time
+from functools import wraps
+from http.cookiejar import DefaultCookiePolicy
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+if TYPE_CHECKING:
+    # dnspython and psycopg2 are imported on first use; most runs need only one of them
+    import dns.resolver
+    import psycopg2.pool
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_PG_POOL_SIZE = 2
+
+PHASES = ('dns_ms', 'connect_ms', 'tls_ms', 'ttfb_ms')
+
+# Per-thread timing of the check currently running on that thread
+_local = threading.local()
+
+
+def _add_timing(dns: float = 0.0, connect: float = 0.0, tls: float = 0.0, ttfb: float = 0.0,
+                connections: int = 0) -> None:
+    timing = getattr(_local, 'timing', None)
+    if timing is not None:
+        timing['dns_ms'] += dns * 1000
+        timing['connect_ms'] += connect * 1000
+        timing['tls_ms'] += tls * 1000
+        timing['ttfb_ms'] += ttfb * 1000
+        timing['connections'] += connections
+
+
+def _add_phase(name: str, seconds: float) -> None:
+    phases = getattr(_local, 'phases', None)
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+
+
+def _resolve(host: str, port: int) -> str:
+    """First address for ``host``; resolved here so the lookup can be timed
+    apart from the TCP connect."""
+    return socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][4][0]
+
+
+class _TimedConnection:
+    # Splits connection setup into DNS lookup, TCP connect and TLS handshake
+    def _new_conn(self):
+        started = time.perf_counter()
+        host = self._dns_host
+        try:
+            address = _resolve(host, self.port)
+        except socket.gaierror:
+            address = host  # let urllib3 raise its own resolution error
+        resolved = time.perf_counter()
+        self._dns_host = address
+        try:
+            sock = super()._new_conn()
+        finally:
+            self._dns_host = host
+        _add_phase('dns', resolved - started)
+        _add_phase('connect', time.perf_counter() - resolved)
+        return sock
+
+    def connect(self):
+        phases = getattr(_local, 'phases', None) or {}
+        before = phases.get('dns', 0.0) + phases.get('connect', 0.0)
+        started = time.perf_counter()
+        super().connect()
+        elapsed = time.perf_counter() - started
+        if isinstance(self, HTTPSConnection):
+            setup = phases.get('dns', 0.0) + phases.get('connect', 0.0) - before
+            _add_phase('tls', max(0.0, elapsed - setup))
+
+
+class TimedHTTPConnection(_TimedConnection, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnection, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
+
+
+class ProbeContext:
+    """Long-lived connections shared by every probe of a tester.
+
+    HTTP checks go through one keep-alive session, DNS checks reuse one
+    resolver per nameserver, PostgreSQL checks borrow from a small pool and
+    raw TLS checks resume the previous session. Each check wrapped with
+    :meth:`timed` reports its time split into phases: name lookup, TCP
+    connect, TLS handshake and time to first byte (the service's own
+    latency), plus the total. Phases a reused connection skips stay at 0.
+    """
+
+    def __init__(self, timeout: float, pool_size: int = DEFAULT_POOL_SIZE,
+                 pg_pool_size: int = DEFAULT_PG_POOL_SIZE):
+        self.timeout = timeout
+        self.pg_pool_size = pg_pool_size
+        self.session = requests.Session()
+        # Probes must not carry state (e.g. login cookies) from one run to the next
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = TimedAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.ssl_context = ssl.create_default_context()
+        self._resolvers: Dict[Tuple[str, ...], 'dns.resolver.Resolver'] = {}
+        self._pg_pools: Dict[Tuple, 'psycopg2.pool.ThreadedConnectionPool'] = {}
+        self._pg_connections = set()
+        self._tls_sessions: Dict[Tuple[str, int], ssl.SSLSession] = {}
+        self._lock = threading.Lock()
+
+    def timed(self, func: Callable[[], Any]) -> Callable[[], Tuple[Any, Dict]]:
+        """Wrap a check so it returns ``(result, timing)``."""
+        @wraps(func)
+        def wrapper():
+            _local.timing = dict.fromkeys(PHASES, 0.0)
+            _local.timing['connections'] = 0
+            started = time.perf_counter()
+            try:
+                result = func()
+                timing = {key: round(value, 2) if isinstance(value, float) else value
+                          for key, value in _local.timing.items()}
+                timing['total_ms'] = round((time.perf_counter() - started) * 1000, 2)
+                return result, timing
+            finally:
+                _local.timing = None
+        return wrapper
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        _local.phases = phases = {}
+        response = None
+        try:
+            response = self.session.request(method, url, **kwargs)
+            return response
+        finally:
+            _local.phases = None
+            setup = sum(phases.values())
+            ttfb = 0.0
+            if response is not None:
+                # elapsed runs from sending the request to parsed headers,
+                # including any connection setup, for every redirect hop
+                elapsed = sum(r.elapsed.total_seconds() for r in response.history + [response])
+                ttfb = max(0.0, elapsed - setup)
+            _add_timing(dns=phases.get('dns', 0.0), connect=phases.get('connect', 0.0),
+                        tls=phases.get('tls', 0.0), ttfb=ttfb,
+                        connections=1 if 'connect' in phases else 0)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def resolver(self, *nameservers: str) -> 'dns.resolver.Resolver':
+        import dns.resolver
+        with self._lock:
+            resolver = self._resolvers.get(nameservers)
+            if resolver is None:
+                # configure=False: don't re-read /etc/resolv.conf; no cache,
+                # every probe has to reach the server
+                resolver = dns.resolver.Resolver(configure=False)
+                resolver.nameservers = list(nameservers)
+                self._resolvers[nameservers] = resolver
+            return resolver
+
+    def resolve(self, nameserver: str, name: str, rdtype: str = 'A') -> 'dns.resolver.Answer':
+        started = time.perf_counter()
+        try:
+            return self.resolver(nameserver).resolve(name, rdtype, lifetime=self.timeout)
+        finally:
+            # For a DNS probe the answer time is the service latency
+            _add_timing(ttfb=time.perf_counter() - started)
+
+    def _pg_pool(self, params: Dict) -> 'psycopg2.pool.ThreadedConnectionPool':
+        import psycopg2.pool
+        key = tuple(sorted(params.items()))
+        with self._lock:
+            pool = self._pg_pools.get(key)
+            if pool is None:
+                pool = psycopg2.pool.ThreadedConnectionPool(
+                    0, self.pg_pool_size, connect_timeout=max(1, int(self.timeout)), **params)
+                self._pg_pools[key] = pool
+            return pool
+
+    def pg_query(self, query: str, **params) -> Optional[tuple]:
+        """Run ``query`` on a pooled connection and return the first row.
+
+        A pooled connection that went stale (server restarted) is discarded
+        and the query retried once on a fresh one.
+        """
+        import psycopg2
+        pool = self._pg_pool(params)
+        for attempt in range(2):
+            started = time.perf_counter()
+            conn = pool.getconn()
+            connected = time.perf_counter()
+            new = id(conn) not in self._pg_connections
+            if new:
+                self._pg_connections.add(id(conn))
+                _add_timing(connect=connected - started, connections=1)
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(query)
+                    row = cur.fetchone()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                self._pg_connections.discard(id(conn))
+                pool.putconn(conn, close=True)
+                if attempt or new:
+                    raise
+                continue
+            finally:
+                _add_timing(ttfb=time.perf_counter() - connected)
+            pool.putconn(conn)
+            return row
+        return None
+
+    def tls_handshake(self, host: str, port: int = 443) -> Dict:
+        """Complete a TLS handshake and return the peer certificate.
+
+        The session from the previous handshake to the same endpoint is
+        offered for resumption, which skips the full key exchange.
+        """
+        key = (host, port)
+        started = time.perf_counter()
+        address = _resolve(host, port)
+        resolved = time.perf_counter()
+        with socket.create_connection((address, port), timeout=self.timeout) as sock:
+            connected = time.perf_counter()
+            with self.ssl_context.wrap_socket(sock, server_hostname=host,
+                                              session=self._tls_sessions.get(key)) as ssock:
+                _add_timing(dns=resolved - started, connect=connected - resolved,
+                            tls=time.perf_counter() - connected, connections=1)
+                cert = ssock.getpeercert()
+                if ssock.session is not None:
+                    self._tls_sessions[key] = ssock.session
+                return cert
+
+    def connect(self, host: str, port: int) -> None:
+        """Open (and close) a TCP connection, for backends that speak no HTTP."""
+        started = time.perf_counter()
+        address = _resolve(host, port)
+        resolved = time.perf_counter()
+        with socket.create_connection((address, port), timeout=self.timeout):
+            _add_timing(dns=resolved - started, connect=time.perf_counter() - resolved, connections=1)
+
+    def close(self) -> None:
+        self.session.close()
+        with self._lock:
+            for pool in self._pg_pools.values():
+                pool.closeall()
+            self._pg_pools.clear()
+            self._pg_connections.clear()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, List, NamedTuple, Optional
+
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_CHECK_TIMEOUT = 10.0  # seconds a single check may run
+DEFAULT_SWEEP_TIMEOUT = 30.0  # seconds the whole sweep may run
+
+
+class Check(NamedTuple):
+    service: str
+    test_name: str
+    func: Callable[[], Any]
+
+
+class ProbeOutcome(NamedTuple):
+    check: Check
+    value: Any = None
+    error: Optional[BaseException] = None
+    timed_out: bool = False
+    message: str = ''
+    duration: float = 0.0
+
+
+class ProbeEngine:
+    """Runs checks concurrently on a bounded thread pool.
+
+    Every check gets its own deadline and the sweep as a whole has one too.
+    Checks that overrun are reported as timed out and left to finish in the
+    background, so a hung backend never holds up the rest of the sweep.
+    Outcomes are returned in the same order as the checks were given.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS,
+                 check_timeout: float = DEFAULT_CHECK_TIMEOUT,
+                 sweep_timeout: float = DEFAULT_SWEEP_TIMEOUT):
+        self.max_workers = max_workers
+        self.check_timeout = check_timeout
+        self.sweep_timeout = sweep_timeout
+
+    def run(self, checks: List[Check]) -> List[ProbeOutcome]:
+        if not checks:
+            return []
+
+        started = {}
+        finished = {}
+
+        def call(index: int, check: Check) -> Any:
+            started[index] = time.monotonic()
+            try:
+                return check.func()
+            finally:
+                finished[index] = time.monotonic()
+
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(checks)),
+                                      thread_name_prefix='probe')
+        futures = {executor.submit(call, i, check): i for i, check in enumerate(checks)}
+        outcomes: List[Optional[ProbeOutcome]] = [None] * len(checks)
+        pending = set(futures)
+        sweep_deadline = time.monotonic() + self.sweep_timeout
+
+        try:
+            while pending:
+                now = time.monotonic()
+                deadlines = [started[futures[f]] + self.check_timeout
+                             for f in pending if futures[f] in started]
+                next_deadline = min(deadlines + [sweep_deadline])
+                done, _ = wait(pending, timeout=max(0.0, next_deadline - now),
+                               return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    index = futures[future]
+                    duration = finished.get(index, 0.0) - started.get(index, 0.0)
+                    error = future.exception()
+                    outcomes[index] = ProbeOutcome(
+                        checks[index],
+                        value=None if error else future.result(),
+                        error=error,
+                        message=f'Error: {error}' if error else '',
+                        duration=duration,
+                    )
+                pending -= done
+
+                now = time.monotonic()
+                for future in list(pending):
+                    index = futures[future]
+                    start = started.get(index)
+                    if start is not None and now - start >= self.check_timeout:
+                        outcomes[index] = ProbeOutcome(
+                            checks[index], timed_out=True, duration=now - start,
+                            message=f'Error: timed out after {self.check_timeout:g}s')
+                        pending.discard(future)
+
+                if pending and now >= sweep_deadline:
+                    for future in pending:
+                        index = futures[future]
+                        future.cancel()
+                        start = started.get(index, now)
+                        outcomes[index] = ProbeOutcome(
+                            checks[index], timed_out=True, duration=now - start,
+                            message=f'Error: sweep deadline of {self.sweep_timeout:g}s exceeded')
+                    pending.clear()
+        finally:
+            executor.shutdown(wait=False)
+
+        return outcomes
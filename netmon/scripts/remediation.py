@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set
+
+COMPOSE_FILE = os.getenv('NETMON_COMPOSE_FILE', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'docker-compose.yml'))
+COMPOSE_PROJECT = os.getenv('NETMON_COMPOSE_PROJECT')
+SERVICE_LABEL = 'com.docker.compose.service'
+PROJECT_LABEL = 'com.docker.compose.project'
+
+DEFAULT_HEALTH_TIMEOUT = 60.0   # seconds a restarted container has to become healthy
+DEFAULT_POLL_INTERVAL = 1.0     # first health poll; doubles up to MAX_POLL_INTERVAL
+MAX_POLL_INTERVAL = 5.0
+DEFAULT_BUDGET = 3              # restarts allowed per service...
+DEFAULT_WINDOW = 3600.0         # ...within this many seconds
+DEFAULT_MAX_WORKERS = 8
+
+
+class ServiceGraph:
+    """Dependencies between compose services (``depends_on``)."""
+
+    def __init__(self, dependencies: Optional[Dict[str, Iterable[str]]] = None, error: Optional[str] = None):
+        self.dependencies: Dict[str, Set[str]] = {name: set(deps) for name, deps in (dependencies or {}).items()}
+        # Why the dependencies could not be loaded; restarts then ignore them
+        self.error = error
+
+    @classmethod
+    def from_compose(cls, path: str = COMPOSE_FILE) -> 'ServiceGraph':
+        import yaml
+        try:
+            with open(path) as f:
+                compose = yaml.safe_load(f) or {}
+        except OSError as e:
+            error = f"compose file not readable ({e}), set NETMON_COMPOSE_FILE"
+            logging.error(f"No service dependencies: {error}")
+            return cls(error=error)
+        dependencies = {}
+        for name, service in (compose.get('services') or {}).items():
+            # depends_on is either a list or a mapping of name -> condition
+            depends_on = (service or {}).get('depends_on') or []
+            dependencies[name] = set(depends_on)
+        return cls(dependencies)
+
+    def dependents(self, service: str) -> Set[str]:
+        """Every service that depends on ``service``, directly or not."""
+        found: Set[str] = set()
+        stack = [service]
+        while stack:
+            current = stack.pop()
+            for name, deps in self.dependencies.items():
+                if current in deps and name not in found:
+                    found.add(name)
+                    stack.append(name)
+        return found
+
+    def waves(self, services: Iterable[str]) -> List[List[str]]:
+        """Split ``services`` into batches that can restart in parallel.
+
+        A service comes after every one of its (transitive) dependencies
+        that is also in the set; services on a cycle end up in the last wave.
+        """
+        remaining = set(services)
+        waves = []
+        while remaining:
+            wave = sorted(name for name in remaining
+                          if not self.ancestors(name) & remaining)
+            if not wave:
+                wave = sorted(remaining)
+            waves.append(wave)
+            remaining -= set(wave)
+        return waves
+
+    def ancestors(self, service: str) -> Set[str]:
+        """Every service ``service`` depends on, directly or not."""
+        found: Set[str] = set()
+        stack = list(self.dependencies.get(service, ()))
+        while stack:
+            current = stack.pop()
+            if current not in found and current != service:
+                found.add(current)
+                stack.extend(self.dependencies.get(current, ()))
+        return found
+
+
+class CircuitBreaker:
+    """Allows at most ``budget`` restarts of one service per ``window`` seconds.
+
+    Attempts age out of the window, so a service that flapped an hour ago
+    gets its budget back instead of being locked out forever.
+    """
+
+    def __init__(self, budget: int = DEFAULT_BUDGET, window: float = DEFAULT_WINDOW,
+                 clock: Callable[[], float] = time.monotonic):
+        self.budget = budget
+        self.window = window
+        self.clock = clock
+        self.attempts: deque = deque()
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float) -> None:
+        while self.attempts and now - self.attempts[0] >= self.window:
+            self.attempts.popleft()
+
+    @property
+    def open(self) -> bool:
+        with self._lock:
+            self._prune(self.clock())
+            return len(self.attempts) >= self.budget
+
+    def acquire(self) -> bool:
+        """Use one attempt from the budget; False while the breaker is open."""
+        with self._lock:
+            now = self.clock()
+            self._prune(now)
+            if len(self.attempts) >= self.budget:
+                return False
+            self.attempts.append(now)
+            return True
+
+    def retry_in(self) -> float:
+        with self._lock:
+            now = self.clock()
+            self._prune(now)
+            if len(self.attempts) < self.budget:
+                return 0.0
+            return self.window - (now - self.attempts[0])
+
+
+class Remediation(NamedTuple):
+    service: str
+    outcome: str  # healthy, unhealthy, failed, missing, blocked or open
+    duration: float = 0.0
+    message: str = ''
+
+    @property
+    def ok(self) -> bool:
+        return self.outcome == 'healthy'
+
+
+class RemediationEngine:
+    """Restarts failing compose services in dependency order.
+
+    Services are found by their compose label, not a guessed container name.
+    Everything that has to restart is split into waves by the dependency
+    graph; each wave restarts in parallel and waits (with bounded polling)
+    for its containers to become healthy before the next wave starts. A
+    service whose dependency did not come back is not restarted. Each
+    service has its own circuit breaker so a crash-looping container is
+    left alone once its restart budget is spent.
+
+    ``docker_client`` only needs ``containers.list(all=..., filters=...)``
+    returning objects with ``restart()``, ``reload()`` and ``attrs``, so a
+    fake can stand in for Docker.
+    """
+
+    def __init__(self, docker_client: Any = None, graph: Optional[ServiceGraph] = None,
+                 project: Optional[str] = COMPOSE_PROJECT,
+                 health_timeout: float = DEFAULT_HEALTH_TIMEOUT,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 budget: int = DEFAULT_BUDGET, window: float = DEFAULT_WINDOW,
+                 max_workers: int = DEFAULT_MAX_WORKERS,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self._docker_client = docker_client
+        self.graph = graph if graph is not None else ServiceGraph.from_compose()
+        self.project = project
+        self.health_timeout = health_timeout
+        self.poll_interval = poll_interval
+        self.budget = budget
+        self.window = window
+        self.max_workers = max_workers
+        self.clock = clock
+        self.sleep = sleep
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def docker_client(self) -> Any:
+        if self._docker_client is None:
+            import docker
+            self._docker_client = docker.from_env()
+        return self._docker_client
+
+    def breaker(self, service: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self.breakers.get(service)
+            if breaker is None:
+                breaker = self.breakers[service] = CircuitBreaker(self.budget, self.window, self.clock)
+            return breaker
+
+    def find_containers(self, service: str) -> List[Any]:
+        labels = [f'{SERVICE_LABEL}={service}']
+        if self.project:
+            labels.append(f'{PROJECT_LABEL}={self.project}')
+        return self.docker_client.containers.list(all=True, filters={'label': labels})
+
+    @staticmethod
+    def health(container: Any) -> str:
+        state = container.attrs.get('State') or {}
+        health = state.get('Health')
+        if health:
+            return health.get('Status', 'starting')
+        # Without a healthcheck, running is the best we know
+        return 'healthy' if state.get('Status') == 'running' else state.get('Status', 'unknown')
+
+    def wait_healthy(self, containers: List[Any], deadline: float) -> bool:
+        interval = self.poll_interval
+        while True:
+            statuses = []
+            for container in containers:
+                container.reload()
+                statuses.append(self.health(container))
+            if all(status == 'healthy' for status in statuses):
+                return True
+            if any(status in ('unhealthy', 'exited', 'dead') for status in statuses):
+                return False
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                return False
+            self.sleep(min(interval, remaining))
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+    def restart(self, service: str) -> Remediation:
+        started = self.clock()
+        breaker = self.breaker(service)
+        if not breaker.acquire():
+            return Remediation(service, 'open', 0.0,
+                               f'restart budget spent, retry in {breaker.retry_in():.0f}s')
+        try:
+            containers = self.find_containers(service)
+            if not containers:
+                return Remediation(service, 'missing', self.clock() - started, 'no container found')
+            for container in containers:
+                container.restart()
+            healthy = self.wait_healthy(containers, started + self.health_timeout)
+        except Exception as e:
+            return Remediation(service, 'failed', self.clock() - started, str(e))
+        outcome = 'healthy' if healthy else 'unhealthy'
+        return Remediation(service, outcome, self.clock() - started,
+                           '' if healthy else 'did not become healthy')
+
+    def remediate(self, services: Iterable[str], cascade: Iterable[str] = ()) -> Dict[str, Remediation]:
+        """Restart ``services`` (plus everything depending on the ones in
+        ``cascade``) wave by wave and report the result per service."""
+        targets = set(services)
+        for service in cascade:
+            targets |= self.graph.dependents(service)
+        if self.graph.error:
+            logging.error(f"Restarting {', '.join(sorted(targets))} without dependency order "
+                          f"or dependents: {self.graph.error}")
+        results: Dict[str, Remediation] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='remediate') as executor:
+            for wave in self.graph.waves(targets):
+                runnable = []
+                for service in wave:
+                    failed = [dep for dep in self.graph.ancestors(service)
+                              if dep in results and not results[dep].ok]
+                    if failed:
+                        results[service] = Remediation(service, 'blocked', 0.0,
+                                                       f'dependency not healthy: {", ".join(sorted(failed))}')
+                    else:
+                        runnable.append(service)
+                for result in executor.map(self.restart, runnable):
+                    results[result.service] = result
+                    log = logging.info if result.ok else logging.warning
+                    log(f"Remediation of {result.service}: {result.outcome} after {result.duration:.1f}s"
+                        + (f" ({result.message})" if result.message else ''))
+        return results
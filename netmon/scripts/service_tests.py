@@ -1,147 +1,173 @@
 #!/usr/bin/env python3
 import subprocess
-import requests
-import socket
-import ssl
-import dns.resolver
-import psycopg2
 import json
+import sys
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
+from probe_engine import Check, ProbeEngine, DEFAULT_CHECK_TIMEOUT, DEFAULT_SWEEP_TIMEOUT
+from probe_context import ProbeContext
+from discovery import CheckPlan, Discovery, build_check
 
 class ServiceTester:
-    def __init__(self):
+    def __init__(self, check_timeout: float = DEFAULT_CHECK_TIMEOUT,
+                 sweep_timeout: float = DEFAULT_SWEEP_TIMEOUT):
         self.results = []
-        self.resolver = dns.resolver.Resolver()
-        self.resolver.nameservers = ['172.20.0.10']  # Bind9 server IP
-
-    def log_result(self, service: str, test_name: str, status: bool, message: str) -> None:
-        self.results.append({
+        self.check_timeout = check_timeout
+        self.engine = ProbeEngine(check_timeout=check_timeout, sweep_timeout=sweep_timeout)
+        # Connections, resolvers and TLS sessions persist across runs
+        self.context = ProbeContext(check_timeout)
+        self.discovery = Discovery()
+        self._discovered: Tuple[Optional[CheckPlan], List[Check]] = (None, [])
+
+    def log_result(self, service: str, test_name: str, status: bool, message: str,
+                   timing: Optional[Dict] = None) -> None:
+        result = {
             'timestamp': datetime.utcnow().isoformat(),
             'service': service,
             'test_name': test_name,
             'status': 'PASS' if status else 'FAIL',
             'message': message
-        })
-
-    def test_traefik(self) -> None:
-        # Test HTTP to HTTPS redirect
+        }
+        if timing:
+            result.update(timing)
+        self.results.append(result)
+
+    def check_http_redirect(self) -> Tuple[bool, str]:
+        response = self.context.get('http://www.terrerov.com', allow_redirects=False)
+        status = response.status_code == 301 and 'https://' in response.headers.get('Location', '')
+        return status, 'HTTP to HTTPS redirect working' if status else 'Redirect not configured correctly'
+
+    def check_https_access(self) -> Tuple[bool, str]:
+        response = self.context.get('https://www.terrerov.com', verify=True)
+        status = response.status_code == 200
+        return status, 'HTTPS access working' if status else 'HTTPS access failed'
+
+    def check_dashboard_auth(self) -> Tuple[bool, str]:
+        response = self.context.get('https://traefik.terrerov.com', auth=('admin', 'your_password'))
+        status = response.status_code == 200
+        return status, 'Dashboard authentication working' if status else 'Dashboard auth failed'
+
+    def check_ssl_cert(self) -> Tuple[bool, str]:
+        cert = self.context.tls_handshake('www.terrerov.com', 443)
+        status = bool(cert) and datetime.strptime(cert['notAfter'], '%b %d %H:%M:%S %Y %Z') > datetime.now()
+        return status, 'SSL certificate valid' if status else 'SSL certificate invalid or expired'
+
+    def check_internal_resolution(self) -> Tuple[bool, str]:
+        answers = self.context.resolve('172.20.0.10', 'traefik.terrerov.com')  # Bind9 server IP
+        status = len(answers) > 0 and str(answers[0]).startswith('172.20.')
+        return status, 'Internal DNS resolution working' if status else 'Internal DNS resolution failed'
+
+    def check_reverse_dns(self) -> Tuple[bool, str]:
+        ip = '172.20.0.10'
+        result = subprocess.run(['dig', '-x', ip, '@172.20.0.10', f'+time={max(1, int(self.check_timeout))}'],
+                                capture_output=True, text=True, timeout=self.check_timeout)
+        status = 'terrerov.com' in result.stdout
+        return status, 'Reverse DNS working' if status else 'Reverse DNS failed'
+
+    def check_nginx_access(self) -> Tuple[bool, str]:
+        response = self.context.get('http://nginx.terrerov.com:8080')
+        status = response.status_code == 200
+        return status, 'Internal Nginx access working' if status else 'Internal Nginx access failed'
+
+    def check_external_resolution(self) -> Tuple[bool, str]:
+        answers = self.context.resolve('172.20.0.20', 'google.com')  # Pihole IP
+        status = len(answers) > 0
+        return status, 'External DNS resolution working' if status else 'External DNS resolution failed'
+
+    def check_pihole_admin(self) -> Tuple[bool, str]:
+        response = self.context.get('http://172.20.0.20/admin/')
+        status = response.status_code == 200
+        return status, 'Admin interface accessible' if status else 'Admin interface not accessible'
+
+    def check_postgresql_connection(self) -> Tuple[bool, str]:
+        row = self.context.pg_query(
+            'SELECT 1',
+            host='db.terrerov.com',
+            database='postgres',
+            user='postgres',
+            password='your_password'
+        )
+        status = row is not None and row[0] == 1
+        return status, 'Database connection working' if status else 'Database connection failed'
+
+    def checks(self) -> List[Check]:
+        timed = self.context.timed
+        return [
+            Check('traefik', 'http_redirect', timed(self.check_http_redirect)),
+            Check('traefik', 'https_access', timed(self.check_https_access)),
+            Check('traefik', 'dashboard_auth', timed(self.check_dashboard_auth)),
+            Check('traefik', 'ssl_cert', timed(self.check_ssl_cert)),
+            Check('bind9', 'internal_resolution', timed(self.check_internal_resolution)),
+            Check('bind9', 'reverse_dns', timed(self.check_reverse_dns)),
+            Check('nginx', 'internal_access', timed(self.check_nginx_access)),
+            Check('pihole', 'external_resolution', timed(self.check_external_resolution)),
+            Check('pihole', 'admin_interface', timed(self.check_pihole_admin)),
+            Check('postgresql', 'connection', timed(self.check_postgresql_connection)),
+        ] + self.discovered_checks()
+
+    def discovered_checks(self) -> List[Check]:
+        # Compiled once per version of the plan, which only changes with the config files
+        plan = self.discovery.plan()
+        if self._discovered[0] is not plan:
+            self._discovered = (plan, [build_check(spec, self.context) for spec in plan.checks])
+        return self._discovered[1]
+
+    def run_check(self, check: Check) -> None:
         try:
-            response = requests.get('http://www.terrerov.com', allow_redirects=False)
-            status = response.status_code == 301 and 'https://' in response.headers.get('Location', '')
-            self.log_result('traefik', 'http_redirect', status, 
-                           'HTTP to HTTPS redirect working' if status else 'Redirect not configured correctly')
+            (status, message), timing = check.func()
+            self.log_result(check.service, check.test_name, status, message, timing)
         except Exception as e:
-            self.log_result('traefik', 'http_redirect', False, f'Error: {str(e)}')
+            self.log_result(check.service, check.test_name, False, f'Error: {str(e)}')
 
-        # Test HTTPS access
-        try:
-            response = requests.get('https://www.terrerov.com', verify=True)
-            status = response.status_code == 200
-            self.log_result('traefik', 'https_access', status,
-                           'HTTPS access working' if status else 'HTTPS access failed')
-        except Exception as e:
-            self.log_result('traefik', 'https_access', False, f'Error: {str(e)}')
+    def run_service(self, service: str) -> None:
+        for check in self.checks():
+            if check.service == service:
+                self.run_check(check)
 
-        # Test Traefik Dashboard auth
-        try:
-            response = requests.get('https://traefik.terrerov.com', auth=('admin', 'your_password'))
-            status = response.status_code == 200
-            self.log_result('traefik', 'dashboard_auth', status,
-                           'Dashboard authentication working' if status else 'Dashboard auth failed')
-        except Exception as e:
-            self.log_result('traefik', 'dashboard_auth', False, f'Error: {str(e)}')
-
-        # Test SSL certificate
-        try:
-            context = ssl.create_default_context()
-            with socket.create_connection(('www.terrerov.com', 443)) as sock:
-                with context.wrap_socket(sock, server_hostname='www.terrerov.com') as ssock:
-                    cert = ssock.getpeercert()
-                    status = cert and datetime.strptime(cert['notAfter'], '%b %d %H:%M:%S %Y %Z') > datetime.now()
-                    self.log_result('traefik', 'ssl_cert', status,
-                                   'SSL certificate valid' if status else 'SSL certificate invalid or expired')
-        except Exception as e:
-            self.log_result('traefik', 'ssl_cert', False, f'Error: {str(e)}')
+    def test_traefik(self) -> None:
+        self.run_service('traefik')
 
     def test_bind9(self) -> None:
-        # Test internal DNS resolution
-        try:
-            answers = self.resolver.resolve('traefik.terrerov.com', 'A')
-            status = len(answers) > 0 and str(answers[0]).startswith('172.20.')
-            self.log_result('bind9', 'internal_resolution', status,
-                           'Internal DNS resolution working' if status else 'Internal DNS resolution failed')
-        except Exception as e:
-            self.log_result('bind9', 'internal_resolution', False, f'Error: {str(e)}')
-
-        # Test reverse DNS
-        try:
-            ip = '172.20.0.10'
-            result = subprocess.run(['dig', '-x', ip, '@172.20.0.10'], capture_output=True, text=True)
-            status = 'terrerov.com' in result.stdout
-            self.log_result('bind9', 'reverse_dns', status,
-                           'Reverse DNS working' if status else 'Reverse DNS failed')
-        except Exception as e:
-            self.log_result('bind9', 'reverse_dns', False, f'Error: {str(e)}')
+        self.run_service('bind9')
 
     def test_nginx(self) -> None:
-        # Test internal Nginx access
-        try:
-            response = requests.get('http://nginx.terrerov.com:8080')
-            status = response.status_code == 200
-            self.log_result('nginx', 'internal_access', status,
-                           'Internal Nginx access working' if status else 'Internal Nginx access failed')
-        except Exception as e:
-            self.log_result('nginx', 'internal_access', False, f'Error: {str(e)}')
+        self.run_service('nginx')
 
     def test_pihole(self) -> None:
-        # Test external DNS resolution through Pihole
-        try:
-            resolver = dns.resolver.Resolver()
-            resolver.nameservers = ['172.20.0.20']  # Pihole IP
-            answers = resolver.resolve('google.com', 'A')
-            status = len(answers) > 0
-            self.log_result('pihole', 'external_resolution', status,
-                           'External DNS resolution working' if status else 'External DNS resolution failed')
-        except Exception as e:
-            self.log_result('pihole', 'external_resolution', False, f'Error: {str(e)}')
-
-        # Test Pihole admin interface
-        try:
-            response = requests.get('http://172.20.0.20/admin/')
-            status = response.status_code == 200
-            self.log_result('pihole', 'admin_interface', status,
-                           'Admin interface accessible' if status else 'Admin interface not accessible')
-        except Exception as e:
-            self.log_result('pihole', 'admin_interface', False, f'Error: {str(e)}')
+        self.run_service('pihole')
 
     def test_postgresql(self) -> None:
-        # Test PostgreSQL connection
-        try:
-            conn = psycopg2.connect(
-                host='db.terrerov.com',
-                database='postgres',
-                user='postgres',
-                password='your_password'
-            )
-            with conn.cursor() as cur:
-                cur.execute('SELECT 1')
-                status = cur.fetchone()[0] == 1
-            conn.close()
-            self.log_result('postgresql', 'connection', status,
-                           'Database connection working' if status else 'Database connection failed')
-        except Exception as e:
-            self.log_result('postgresql', 'connection', False, f'Error: {str(e)}')
-
-    def run_all_tests(self) -> List[Dict]:
-        self.test_traefik()
-        self.test_bind9()
-        self.test_nginx()
-        self.test_pihole()
-        self.test_postgresql()
+        self.run_service('postgresql')
+
+    def benchmark_dns(self, servers: Optional[Dict[str, str]] = None, **options) -> Dict[str, Dict]:
+        """Load each resolver (Bind9 and Pi-hole by default) in turn with the
+        names the configs list; ``options`` go to :func:`dns_bench.run`."""
+        import dns_bench
+        names = dns_bench.query_names(self.discovery)
+        return {service: dns_bench.run(server, names, **options)
+                for service, server in (servers or dns_bench.DNS_SERVERS).items()}
+
+    def run_all_tests(self, services: Optional[Iterable[str]] = None) -> List[Dict]:
+        # Fan every check out in parallel; a hung backend only costs its own deadline
+        checks = self.checks()
+        if services is not None:
+            services = set(services)
+            checks = [check for check in checks if check.service in services]
+        for outcome in self.engine.run(checks):
+            check = outcome.check
+            if outcome.timed_out or outcome.error is not None:
+                self.log_result(check.service, check.test_name, False, outcome.message,
+                                {'total_ms': round(outcome.duration * 1000, 2)})
+            else:
+                (status, message), timing = outcome.value
+                self.log_result(check.service, check.test_name, status, message, timing)
         return self.results
 
 def main():
+    if sys.argv[1:2] == ['--dns-bench']:
+        # Load test instead of the checks: service_tests.py --dns-bench --help
+        import dns_bench
+        sys.exit(dns_bench.main(sys.argv[2:]))
     tester = ServiceTester()
     results = tester.run_all_tests()
     print(json.dumps(results, indent=2))
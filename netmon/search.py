@@ -0,0 +1,186 @@
+import html
+import logging
+import os
+import re
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+# snippet() marks matches with these; they are swapped for <mark> once the
+# text around them has been HTML-escaped
+MATCH_START, MATCH_END = '\x02', '\x03'
+SNIPPET_TOKENS = 16
+# Matches ranked per source and query, newest first (see search())
+CANDIDATES = int(os.getenv('NETMON_SEARCH_CANDIDATES', '2000'))
+TERM_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+
+class Source(NamedTuple):
+    table: str
+    type_column: str
+    columns: Sequence[str]    # indexed text, in the order of ``weights``
+    weights: Sequence[float]  # bm25 weight per column: a hit there counts this much
+
+    @property
+    def index(self) -> str:
+        return f'{self.table}_fts'
+
+
+SOURCES = {
+    'error_log': Source('error_log', 'error_type', ('error_type', 'description', 'ai_analysis'), (4.0, 2.0, 1.0)),
+    'network_scan': Source('network_scan', 'scan_type', ('scan_type', 'target', 'result'), (2.0, 4.0, 1.0)),
+}
+
+
+class SearchError(ValueError):
+    pass
+
+
+class SearchUnavailable(SearchError):
+    # The database has no full-text index (see ensure_index)
+    pass
+
+
+def _triggers(source: Source) -> List[str]:
+    # The index keeps no copy of the text (external content); these keep
+    # it in step with the table on every insert, update and delete
+    columns = ', '.join(source.columns)
+    new = ', '.join(f'new.{column}' for column in source.columns)
+    old = ', '.join(f'old.{column}' for column in source.columns)
+    insert = f'INSERT INTO {source.index}(rowid, {columns}) VALUES (new.id, {new});'
+    delete = f"INSERT INTO {source.index}({source.index}, rowid, {columns}) VALUES ('delete', old.id, {old});"
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS {source.table}_fts_insert AFTER INSERT ON {source.table} '
+        f'BEGIN {insert} END',
+        f'CREATE TRIGGER IF NOT EXISTS {source.table}_fts_delete AFTER DELETE ON {source.table} '
+        f'BEGIN {delete} END',
+        f'CREATE TRIGGER IF NOT EXISTS {source.table}_fts_update AFTER UPDATE OF {columns} ON {source.table} '
+        f'BEGIN {delete} {insert} END',
+    ]
+
+
+def ensure_index(engine) -> bool:
+    """Create the full-text index (and fill it from existing rows) if it is
+    missing. Returns False where it cannot exist: not SQLite, or an SQLite
+    built without FTS5."""
+    if engine.dialect.name != 'sqlite':
+        return False
+    try:
+        with engine.begin() as conn:
+            for source in SOURCES.values():
+                exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                      {'name': source.index}).first()
+                if exists is None:
+                    conn.exec_driver_sql(
+                        f"CREATE VIRTUAL TABLE {source.index} USING fts5({', '.join(source.columns)}, "
+                        f"content='{source.table}', content_rowid='id')")
+                    conn.exec_driver_sql(f"INSERT INTO {source.index}({source.index}) VALUES ('rebuild')")
+                for trigger in _triggers(source):
+                    conn.exec_driver_sql(trigger)
+    except OperationalError as e:
+        logging.warning(f'Full-text search is unavailable: {e}')
+        return False
+    return True
+
+
+def match_expression(query: str) -> str:
+    """FTS5 query for what a user typed: every word must match, "quoted
+    phrases" match as a whole, a trailing * matches a prefix and OR between
+    two terms makes either one enough. Anything else is taken literally, so
+    172.20.0.5 or error_type need no escaping."""
+    terms = []
+    for phrase, word in TERM_RE.findall(query):
+        if word == 'OR':
+            if terms and terms[-1] != 'OR':
+                terms.append('OR')
+            continue
+        term = phrase if phrase else word.rstrip('*')
+        if term.strip():
+            prefix = '*' if not phrase and word.endswith('*') else ''
+            terms.append('"' + term.replace('"', '""') + '"' + prefix)
+    if terms and terms[-1] == 'OR':
+        terms.pop()
+    return ' '.join(terms)
+
+
+def highlight(snippet: str) -> str:
+    return html.escape(snippet).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+def _bound(value: datetime) -> str:
+    # Timestamps are stored as naive UTC text in this format, so they compare as strings
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(sep=' ')
+
+
+def _timestamp(value) -> str:
+    return value.isoformat() if isinstance(value, datetime) else datetime.fromisoformat(value).isoformat()
+
+
+def search(session, query: str, sources: Optional[Sequence[str]] = None, type: Optional[str] = None,
+           start: Optional[datetime] = None, end: Optional[datetime] = None,
+           limit: int = 20, offset: int = 0, candidates: int = CANDIDATES) -> Tuple[List[Dict], bool]:
+    """Best matches first, across ``sources`` (all by default), optionally
+    only of one error/scan type and within ``[start, end)``.
+
+    Only the newest ``candidates`` matches of each source are ranked: bm25
+    over every match of a common word reads most of the index, while
+    walking matches newest first stops early. Also returns whether older
+    matches were left out that way (a narrower time range reaches them).
+    """
+    expression = match_expression(query)
+    if not expression:
+        raise SearchError('empty search query')
+    results, truncated = [], False
+    for name in sources or SOURCES:
+        source = SOURCES[name]
+        where = [f'{source.index} MATCH :query']
+        params = {'query': expression}
+        if type:
+            where.append(f't.{source.type_column} = :type')
+            params['type'] = type
+        bounds = []
+        if start is not None:
+            bounds.append('t.timestamp >= :start')
+            params['start'] = _bound(start)
+        if end is not None:
+            bounds.append('t.timestamp < :end')
+            params['end'] = _bound(end)
+        try:
+            if bounds:
+                # The ids in the time range bound the index scan; the
+                # timestamps still decide, as ids need not follow them
+                params['low'], params['high'] = session.execute(text(
+                    f"SELECT min(id), max(id) FROM {source.table} t WHERE {' AND '.join(bounds)}"), params).one()
+                if params['low'] is None:
+                    continue
+                where += bounds + [f'{source.index}.rowid BETWEEN :low AND :high']
+            joined = f"FROM {source.index} JOIN {source.table} t ON t.id = {source.index}.rowid " \
+                     f"WHERE {' AND '.join(where)}"
+            floor = session.execute(text(f"SELECT {source.index}.rowid {joined} "
+                                         f"ORDER BY {source.index}.rowid DESC LIMIT 1 OFFSET :skip"),
+                                    dict(params, skip=candidates - 1)).scalar()
+            if floor is not None:
+                truncated = True
+                joined += f' AND {source.index}.rowid >= :floor'
+                params['floor'] = floor
+            weights = ', '.join(str(weight) for weight in source.weights)
+            rows = session.execute(text(
+                f"SELECT t.id, t.timestamp, t.{source.type_column} AS type, "
+                f"bm25({source.index}, {weights}) AS score, "
+                f"snippet({source.index}, -1, '{MATCH_START}', '{MATCH_END}', '…', {SNIPPET_TOKENS}) AS snippet "
+                f"{joined} ORDER BY score LIMIT :limit"), dict(params, limit=limit + offset)).all()
+        except OperationalError as e:
+            if 'no such table' in str(e) or 'no such module' in str(e):
+                raise SearchUnavailable('full-text search needs SQLite with FTS5') from e
+            if 'fts5' in str(e):
+                raise SearchError(str(e.orig)) from e
+            raise
+        results += [{'source': name, 'id': row.id, 'timestamp': _timestamp(row.timestamp), 'type': row.type,
+                     # bm25 is lower for better matches; flipped so higher is better
+                     'score': -row.score, 'snippet': highlight(row.snippet)} for row in rows]
+    results.sort(key=lambda result: -result['score'])
+    return results[offset:offset + limit], truncated
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Production entry point for netmon.
+
+Runs the app on a gevent (default) or eventlet server instead of the
+Werkzeug development server. With NETMON_WORKERS > 1 the primary process
+starts extra server processes on the following ports; Socket.IO emits are
+shared through NETMON_MESSAGE_QUEUE and only the primary runs the job
+scheduler.
+
+The agent coordinator (leases and units) only exists in the primary's
+memory, so the agent API answers 503 on the other workers: point agents
+at the primary's port (NETMON_PORT), as the Traefik config does for
+/api/agents. Probe latency is recorded and persisted there too; the
+current minute and raw samples under /api/probes are only in the
+primary's memory, so Traefik sends those to it as well.
+
+Every worker still has its own WriteQueue, so N workers means N writers.
+Writes made by a worker's requests (ingest, logged errors)
+stay in that process; on SQLite the writers take turns on the database
+lock and wait up to busy_timeout for it, so extra workers add request
+capacity but not write throughput.
+"""
+import os
+
+SERVER = os.getenv('NETMON_SERVER', 'gevent')
+
+# Monkey patching has to happen before anything else imports socket/threading
+if SERVER == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+elif SERVER == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+
+os.environ['NETMON_ASYNC_MODE'] = SERVER if SERVER in ('gevent', 'eventlet') else 'threading'
+
+import atexit
+import subprocess
+import sys
+
+HOST = os.getenv('NETMON_HOST', '0.0.0.0')
+PORT = int(os.getenv('NETMON_PORT', '5000'))
+WORKERS = max(1, int(os.getenv('NETMON_WORKERS', '1')))
+WORKER_INDEX = int(os.getenv('NETMON_WORKER_INDEX', '0'))
+# Off for API-only instances (and benchmarks): no scheduled jobs at all
+RUN_JOBS = os.getenv('NETMON_RUN_JOBS', 'true').lower() not in ('0', 'false', 'no')
+
+
+def spawn_workers():
+    workers = [subprocess.Popen([sys.executable, os.path.abspath(__file__)],
+                                env=dict(os.environ, NETMON_WORKER_INDEX=str(index)))
+               for index in range(1, WORKERS)]
+
+    def stop():
+        for worker in workers:
+            worker.terminate()
+
+    atexit.register(stop)
+    return workers
+
+
+def main():
+    if WORKERS > 1 and not os.getenv('NETMON_MESSAGE_QUEUE'):
+        sys.exit('NETMON_WORKERS > 1 requires NETMON_MESSAGE_QUEUE so events reach every worker')
+
+    from app import app, socketio, bootstrap, start_services
+
+    primary = WORKER_INDEX == 0
+    if primary:
+        with app.app_context():
+            bootstrap()
+        spawn_workers()
+
+    start_services(run_scheduler=primary and RUN_JOBS)
+    options = {'allow_unsafe_werkzeug': True} if SERVER not in ('gevent', 'eventlet') else {}
+    socketio.run(app, host=HOST, port=PORT + WORKER_INDEX, **options)
+
+
+if __name__ == '__main__':
+    main()
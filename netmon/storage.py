@@ -0,0 +1,144 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from cooperative import run_blocking
+
+BUSY_TIMEOUT_MS = 5000
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-16000',
+    'PRAGMA foreign_keys=ON',
+)
+
+
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma in PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def ensure_indexes(db) -> None:
+    """Create any index declared on the models that an older database lacks.
+
+    ``db.create_all()`` only creates missing tables, so indexes added to
+    existing tables have to be created explicitly.
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+
+WriteFunc = Callable[[Any], Any]
+Callback = Callable[[Any], None]
+BatchObserver = Callable[[int, float, bool], None]
+
+
+class WriteQueue:
+    """Funnels every insert through a single writer thread.
+
+    Callers submit a function that adds rows to the session; the writer
+    batches whatever is queued into one transaction, commits, then runs each
+    item's ``on_commit`` callback with the function's return value. A batch
+    that fails is replayed item by item so one bad row cannot drop the rest.
+    ``on_batch`` is told the size, duration and success of every commit.
+
+    The queue is per process: with several server workers (serve.py) each
+    has its own writer, and SQLite's lock is what serialises them.
+    """
+
+    def __init__(self, app, db, max_batch: int = 200, flush_interval: float = 0.2,
+                 on_batch: Optional[BatchObserver] = None):
+        self.app = app
+        self.db = db
+        self.on_batch = on_batch
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._queue: 'queue.Queue[Tuple[WriteFunc, Optional[Callback], Future]]' = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+            self._thread.start()
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, func: WriteFunc, on_commit: Optional[Callback] = None) -> Future:
+        future: Future = Future()
+        item = (func, on_commit, future)
+        if self._thread is None:
+            # No writer running (CLI tools, one-off scripts): write inline
+            self._write([item])
+        else:
+            self._queue.put(item)
+        return future
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.max_batch:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+            self._write(batch)
+
+    def _commit(self, batch) -> List[Any]:
+        with self.app.app_context():
+            session = self.db.session()
+            # Rows stay readable by the callbacks after this context closes
+            session.expire_on_commit = False
+            try:
+                results = [func(session) for func, _, _ in batch]
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            return results
+
+    def _write(self, batch) -> None:
+        started = time.perf_counter()
+        try:
+            # SQLite work goes to a native thread under gevent/eventlet
+            results = run_blocking(self._commit, batch)
+        except Exception as e:
+            self._observe(len(batch), started, False)
+            if len(batch) == 1:
+                logging.exception('Database write failed')
+                batch[0][2].set_exception(e)
+                return
+            for item in batch:
+                self._write([item])
+            return
+        self._observe(len(batch), started, True)
+
+        for (_, on_commit, future), result in zip(batch, results):
+            if on_commit is not None:
+                try:
+                    on_commit(result)
+                except Exception:
+                    logging.exception('Write callback failed')
+            future.set_result(result)
+
+    def _observe(self, size: int, started: float, ok: bool) -> None:
+        if self.on_batch is not None:
+            try:
+                self.on_batch(size, time.perf_counter() - started, ok)
+            except Exception:
+                logging.exception('Write observer failed')
@@ -0,0 +1,78 @@
+import os
+from typing import Dict, List
+from urllib.parse import urlparse
+
+from scheduler import run_command
+
+WEB_URL = os.getenv('NETMON_WEB_CHECK_URL', 'https://www.terrerov.com')
+DNS_NAME = os.getenv('NETMON_DNS_CHECK_NAME', 'www.terrerov.com')
+DNS_SERVER = os.getenv('NETMON_DNS_CHECK_SERVER', '8.8.8.8')
+DB_HOST = os.getenv('NETMON_DB_CHECK_HOST', 'postgres')
+
+# Host behind each check, for targeted scans when the check fails
+HOSTS = {
+    'dns_test': DNS_SERVER,
+    'web_test': urlparse(WEB_URL).hostname,
+    'db_test': DB_HOST,
+}
+# What each check looks at, as named in change events
+TARGETS = {
+    'dns_test': f'{DNS_NAME}@{DNS_SERVER}',
+    'web_test': WEB_URL,
+    'db_test': DB_HOST,
+}
+
+
+def _result(scan_type: str, result: str) -> Dict:
+    # Failures reach the error log as check_failed change events
+    return {'scan_type': scan_type, 'result': result}
+
+
+def _output(completed) -> str:
+    return ((completed.stdout or '') + (completed.stderr or '')).strip()
+
+
+def check_dns() -> Dict:
+    try:
+        completed = run_command(['nslookup', '-timeout=5', DNS_NAME, DNS_SERVER],
+                                capture_output=True, text=True, timeout=30)
+    except Exception as e:
+        return _result('dns_test', f'failed: connection error - {str(e)}')
+    output = _output(completed)
+    if completed.returncode != 0:
+        return _result('dns_test', f'failed: connection error - {output}')
+    if 'NXDOMAIN' in output or 'SERVFAIL' in output:
+        return _result('dns_test', f'failed: domain not found - {output}')
+    return _result('dns_test', f'success: {output}')
+
+
+def check_web() -> Dict:
+    try:
+        completed = run_command(['curl', '-s', '-m', '10', '--connect-timeout', '5', '-L', '-I', WEB_URL],
+                                capture_output=True, text=True, timeout=30)
+    except Exception as e:
+        return _result('web_test', f'failed: connection error - {str(e)}')
+    status_line = next(iter((completed.stdout or '').splitlines()), '').strip()
+    if completed.returncode != 0 and not status_line:
+        output = _output(completed) or f'curl exited with {completed.returncode}'
+        return _result('web_test', f'failed: connection error - {output}')
+    if any(code in status_line for code in ('200', '301', '302')):
+        return _result('web_test', f'success: {status_line}')
+    return _result('web_test', f'failed: unexpected response - {status_line}')
+
+
+def check_db() -> Dict:
+    try:
+        completed = run_command(['pg_isready', '-h', DB_HOST, '-t', '5'],
+                                capture_output=True, text=True, timeout=30,
+                                env=dict(os.environ, PGCONNECT_TIMEOUT='5'))
+    except Exception as e:
+        return _result('db_test', f'failed: {str(e)}')
+    if completed.returncode == 0:
+        return _result('db_test', 'success')
+    output = _output(completed)
+    return _result('db_test', f'failed: {output}')
+
+
+def run_all() -> List[Dict]:
+    return [check_dns(), check_web(), check_db()]
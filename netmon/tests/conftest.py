@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+NETMON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The app, the agent and the probe scripts import their siblings by name
+for path in (os.path.join(NETMON_DIR, 'benchmarks'), os.path.join(NETMON_DIR, 'scripts'), NETMON_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# app.py binds its database when imported; never the one in instance/
+os.environ['NETMON_DATABASE_URI'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='netmon-tests-'), 'netmon.db')}"
+
+
+@pytest.fixture(scope='session')
+def netmon_app():
+    """The app module with its schema created and its writer running."""
+    import app
+    with app.app.app_context():
+        app.bootstrap()
+    app.writer.start()
+    return app
@@ -0,0 +1,55 @@
+import pytest
+
+from adaptive import AdaptiveCadence, Cooldown, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_and_reports_the_wait():
+    clock = FakeClock()
+    bucket = TokenBucket(2, refill=100, clock=clock)
+    assert bucket.take() and bucket.take()
+    assert not bucket.take()
+    assert bucket.wait_time() == 100
+
+    clock.now += 40
+    assert not bucket.take()
+    assert bucket.wait_time() == pytest.approx(60)
+
+    clock.now += 60
+    assert bucket.wait_time() == 0
+    assert bucket.take()
+    assert not bucket.take()
+
+    # Refills stop at the burst size
+    clock.now += 1000
+    assert bucket.take() and bucket.take()
+    assert not bucket.take()
+
+
+def test_token_bucket_needs_a_refill():
+    for refill in (0, -1):
+        with pytest.raises(ValueError):
+            TokenBucket(2, refill)
+
+
+def test_cooldown_refuses_a_key_within_its_period():
+    cooldown = Cooldown(60)
+    assert cooldown.ready('a', now=0)
+    assert cooldown.ready('b', now=10)
+    assert not cooldown.ready('a', now=59)
+    assert cooldown.ready('a', now=60)
+
+
+def test_cadence_drops_on_failure_and_backs_off_when_calm():
+    cadence = AdaptiveCadence(base=60, minimum=10, maximum=200, backoff=2, calm_runs=2)
+    assert cadence.observe(False) == 10 and cadence.state == 'degraded'
+    assert cadence.observe(True) == 20 and cadence.state == 'recovering'
+    assert [cadence.observe(True) for _ in range(4)] == [40, 60, 120, 200]
+    assert cadence.state == 'backoff'
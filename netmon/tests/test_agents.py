@@ -0,0 +1,116 @@
+"""The app's agent API and coordinator with real agent.py processes."""
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from werkzeug.serving import make_server
+
+from conftest import NETMON_DIR
+
+TOKEN = 'test-token'
+AGENTS = 3
+
+
+@pytest.fixture(scope='module')
+def netmon(netmon_app):
+    app = netmon_app
+    app.AGENT_TOKEN = TOKEN
+    # A /28 becomes four /30 units
+    app.AGENT_SHARD_PREFIX = 30
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield app, f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+def auth(token=TOKEN):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_agent_api_needs_a_token(netmon, monkeypatch):
+    app, _ = netmon
+    client = app.app.test_client()
+    assert client.post('/api/agents/a1/lease', json={}, headers=auth('wrong')).status_code == 401
+    assert client.post('/api/agents/a1/lease', json={}).status_code == 401
+    monkeypatch.setattr(app, 'AGENT_TOKEN', None)
+    assert client.post('/api/agents/a1/lease', json={}, headers=auth()).status_code == 403
+    assert client.post('/api/agents/a1/results', json={'results': []}, headers=auth()).status_code == 403
+
+
+def test_only_the_primary_worker_serves_agents(netmon, monkeypatch):
+    app, _ = netmon
+    client = app.app.test_client()
+    monkeypatch.setattr(app, 'PRIMARY_WORKER', False)
+    assert client.post('/api/agents/a1/lease', json={}, headers=auth()).status_code == 503
+    assert client.post('/api/agents/a1/results', json={'results': []}, headers=auth()).status_code == 503
+
+
+def test_malformed_results_are_rejected_and_requeued(netmon):
+    app, _ = netmon
+    client = app.app.test_client()
+    round_id = app.coordinator.plan('scan', [{'target': '127.0.1.0/30'}, {'target': '127.0.1.4/30'}],
+                                    agent='checker')
+    try:
+        leased = client.post('/api/agents/checker/lease', json={'kinds': ['scan'], 'capacity': 2},
+                             headers=auth()).get_json()['assignments']
+        assert len(leased) == 2
+        assert client.post('/api/agents/checker/results', json={'results': ['nonsense']},
+                           headers=auth()).status_code == 400
+
+        first, second = leased[0]['id'], leased[1]['id']
+        response = client.post('/api/agents/checker/results', headers=auth(), json={'results': [
+            {'unit': first, 'report': {'target': '127.0.1.0/30', 'changed': [{'host': '127.0.1.1'}],
+                                       'diffs': [{}]}},
+            {'unit': second, 'report': {'target': '127.0.1.4/30', 'changed': [], 'diffs': []}},
+        ]})
+        assert response.status_code == 400
+        assert response.get_json()['rejected'] == [first]
+        assert response.get_json()['accepted'] == [second]
+        # The malformed unit is waiting for another attempt, the good one is done
+        assert app.coordinator.get(first).leased_to is None
+        assert app.coordinator.get(second) is None
+    finally:
+        app.coordinator.cancel(round_id)
+
+
+def test_agents_share_a_distributed_scan(netmon):
+    app, url = netmon
+    agents = [subprocess.Popen([sys.executable, 'agent.py', url, '--id', f'agent-{i}', '--kinds', 'scan',
+                                '--batch-interval', '0.2'],
+                               cwd=NETMON_DIR, env=dict(os.environ, NETMON_AGENT_TOKEN=TOKEN),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+              for i in range(AGENTS)]
+    try:
+        deadline = time.monotonic() + 30
+        while sum(1 for agent in app.coordinator.live_agents() if agent.startswith('agent-')) < AGENTS:
+            assert time.monotonic() < deadline, 'agents did not connect'
+            time.sleep(0.2)
+
+        errors = []
+
+        def scan():
+            try:
+                with app.app.app_context():
+                    app.run_distributed_scan('127.0.0.0/28')
+            except Exception as e:
+                errors.append(e)
+
+        scanner = threading.Thread(target=scan, daemon=True)
+        scanner.start()
+        scanner.join(60)
+        assert not scanner.is_alive(), 'the scan round did not finish'
+        assert not errors
+        completed = {agent: state['completed'] for agent, state in app.coordinator.live_agents().items()
+                     if agent.startswith('agent-')}
+        assert sum(completed.values()) == 4
+        # Idle agents are all waiting on a lease when the round is planned
+        assert sum(1 for count in completed.values() if count) >= 2
+        assert not app.coordinator.status()['rounds']
+    finally:
+        # SIGTERM would wait out a held lease request
+        for agent in agents:
+            agent.kill()
+            agent.wait()
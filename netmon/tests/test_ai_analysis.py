@@ -0,0 +1,68 @@
+import threading
+import time
+
+from ai_analysis import FAILURE_PREFIX, AIAnalyzer, fingerprint
+
+
+class BlockingAnalysis:
+    """Answers once ``release`` is set, counting the calls it received."""
+
+    def __init__(self, fail=False):
+        self.calls = 0
+        self.fail = fail
+        self.release = threading.Event()
+
+    def __call__(self, error_type, description):
+        self.calls += 1
+        self.release.wait(5)
+        if self.fail:
+            raise RuntimeError('API down')
+        return f'analysis {self.calls}'
+
+
+def wait_idle(analyzer):
+    deadline = time.monotonic() + 5
+    while analyzer.pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert analyzer.pending() == 0
+
+
+def test_fingerprint_ignores_varying_details():
+    assert fingerprint('timeout', 'No reply from 10.0.0.5:443 after 30.2s') == \
+        fingerprint('timeout', 'no reply from 10.0.0.9:8443  after 5s')
+    assert fingerprint('timeout', 'x') != fingerprint('dns', 'x')
+
+
+def test_duplicates_join_the_request_in_flight_and_then_hit_the_cache():
+    analyze = BlockingAnalysis()
+    analyzer = AIAnalyzer(analyze=analyze, workers=2)
+    results = []
+    analyzer.submit('timeout', 'No reply from 10.0.0.5', results.append)
+    analyzer.submit('timeout', 'No reply from 10.0.0.6', results.append)
+    assert analyzer.pending() == 2
+
+    analyze.release.set()
+    wait_idle(analyzer)
+    assert results == ['analysis 1', 'analysis 1']
+
+    # A cached analysis is answered on the caller's thread
+    analyzer.submit('timeout', 'No reply from 10.0.0.7', results.append)
+    assert results[-1] == 'analysis 1'
+    assert analyze.calls == 1
+
+
+def test_failures_are_remembered_only_for_the_dedup_window():
+    analyze = BlockingAnalysis(fail=True)
+    analyze.release.set()
+    analyzer = AIAnalyzer(analyze=analyze, dedup_window=0.2)
+    results = []
+    analyzer.submit('dns', 'SERVFAIL', results.append)
+    wait_idle(analyzer)
+    analyzer.submit('dns', 'SERVFAIL', results.append)
+    assert results == [f'{FAILURE_PREFIX}API down'] * 2
+    assert analyze.calls == 1
+
+    time.sleep(0.25)
+    analyzer.submit('dns', 'SERVFAIL', results.append)
+    wait_idle(analyzer)
+    assert analyze.calls == 2
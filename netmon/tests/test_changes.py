@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+from changes import ChangeDetector, check_events, check_state
+
+TOKEN = {'Authorization': 'Bearer admin'}
+
+
+def test_detector_records_only_what_was_stored():
+    detector = ChangeDetector(checkpoint_interval=timedelta(hours=1))
+    start = datetime(2026, 1, 1)
+    assert detector.decide('k', {'a': 1}, start) == ('new', None)
+    # Deciding records nothing; a write that never commits leaves no trace
+    assert detector.decide('k', {'a': 1}, start) == ('new', None)
+
+    detector.stored('k', {'a': 1}, start)
+    assert detector.decide('k', {'a': 1}, start + timedelta(minutes=5)) == ('unchanged', {'a': 1})
+    assert detector.decide('k', {'a': 2}, start) == ('changed', {'a': 1})
+    assert detector.decide('k', {'a': 1}, start + timedelta(hours=1)) == ('checkpoint', {'a': 1})
+    assert not detector.due('k', start + timedelta(minutes=59))
+    assert detector.due('k', start + timedelta(hours=1))
+
+
+def test_detector_loads_the_last_stored_state_once():
+    calls = []
+
+    def load(key):
+        calls.append(key)
+        return {'a': 1}, datetime(2026, 1, 1)
+
+    detector = ChangeDetector(checkpoint_interval=timedelta(days=365), load=load)
+    assert detector.decide('k', {'a': 1})[0] == 'unchanged'
+    assert detector.decide('k', {'a': 1})[0] == 'unchanged'
+    assert calls == ['k']
+
+
+def test_check_events_report_failures_once_and_recoveries():
+    failed = check_state('dns_test', 'failed: connection error - timed out')
+    ok = check_state('dns_test', 'success: Name: a\nAddress: 1.2.3.4')
+    assert [event.type for event in check_events('dns', None, failed, 'failed')] == ['check_failed']
+    assert check_events('dns', failed, failed, 'failed') == []
+    assert [event.type for event in check_events('dns', failed, ok, 'success')] == ['check_recovered']
+
+
+def test_running_and_failed_scans_are_no_baseline(netmon_app):
+    app = netmon_app
+    target = '10.9.8.0/24'
+    with app.app.app_context():
+        app.db.session.add_all([
+            app.NetworkScan(scan_type='nmap', target=target, result='3 hosts up, 4 open ports',
+                            timestamp=datetime(2026, 1, 1)),
+            app.NetworkScan(scan_type='nmap', target=target, result='failed: nmap exited with 1'),
+            app.NetworkScan(scan_type='nmap', target=target, result='running'),
+        ])
+        app.db.session.commit()
+        state, stored_at = app.load_result_state(('nmap', target))
+    assert state == {'result': '3 hosts up, 4 open ports'}
+    assert stored_at == datetime(2026, 1, 1)
+
+
+def test_ingested_scans_are_deduplicated_after_commit(netmon_app, monkeypatch):
+    app = netmon_app
+    monkeypatch.setattr(app, 'ADMIN_TOKEN', 'admin')
+    client = app.app.test_client()
+    scan = {'scan_type': 'port_check', 'target': 'ingest-dedup', 'result': 'open'}
+
+    response = client.post('/api/ingest/network_scan', json=[scan, scan], headers=TOKEN)
+    assert response.get_json() == {'queued': 1, 'unchanged': 1}
+    app.writer.submit(lambda session: None).result(5)
+    response = client.post('/api/ingest/network_scan', json=scan, headers=TOKEN)
+    assert response.get_json() == {'queued': 0, 'unchanged': 1}
+    response = client.post('/api/ingest/network_scan', json=dict(scan, result='closed'), headers=TOKEN)
+    assert response.get_json() == {'queued': 1, 'unchanged': 0}
@@ -0,0 +1,99 @@
+import os
+
+from discovery import CheckSpec, Discovery, build_check, lookup, rule_hosts
+from probe_context import ProbeContext
+from standins import HTTPStandIn
+
+DYNAMIC = """
+http:
+  routers:
+    web:
+      rule: "Host(`www.lan`) || Host(`lan`)"
+      entryPoints: [websecure]
+      service: web@file
+    admin:
+      rule: "Host(`admin.lan`) && PathPrefix(`/api`)"
+      service: api@internal
+  services:
+    web:
+      loadBalancer:
+        servers:
+          - url: http://172.20.0.30:80
+    unused:
+      loadBalancer:
+        servers:
+          - url: http://172.20.0.99:80
+"""
+
+CUSTOM_LIST = """
+172.20.0.2 www.lan lan
+172.20.0.3 *.apps.lan  # wildcard
+172.20.0.4 nas.lan
+"""
+
+
+def write(path, text):
+    path.write_text(text)
+    # Make sure the change is seen even within the filesystem's timestamp resolution
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_rule_hosts_and_wildcard_lookup():
+    assert rule_hosts("Host(`a.lan`, `b.lan`) || HostSNI(`c.lan`) || Host(\"d.lan\")") == \
+        ['a.lan', 'b.lan', 'd.lan']
+    records = {'nas.lan': '10.0.0.4', '*.apps.lan': '10.0.0.3'}
+    assert lookup(records, 'NAS.lan') == '10.0.0.4'
+    assert lookup(records, 'grafana.apps.lan') == '10.0.0.3'
+    assert lookup(records, 'apps.lan') is None
+
+
+def test_plan_follows_the_config_files(tmp_path):
+    dynamic = tmp_path / 'netmon.yml'
+    custom_list = tmp_path / 'custom.list'
+    write(dynamic, DYNAMIC)
+    write(custom_list, CUSTOM_LIST)
+    discovery = Discovery(str(tmp_path), str(custom_list))
+
+    plan = discovery.plan()
+    checks = {(spec.kind, spec.target): spec for spec in plan.checks}
+    assert set(checks) == {
+        ('https', 'www.lan'), ('tls_expiry', 'www.lan'), ('dns', 'www.lan'),
+        ('https', 'lan'), ('tls_expiry', 'lan'), ('dns', 'lan'),
+        ('http', 'admin.lan'), ('dns', 'admin.lan'),
+        # Only the service a router uses is checked
+        ('backend', 'http://172.20.0.30:80'),
+        ('dns', 'nas.lan'),
+    }
+    assert checks[('dns', 'www.lan')].expected == '172.20.0.2'
+    assert checks[('dns', 'admin.lan')].expected is None
+    assert plan.files == sorted([str(custom_list), str(dynamic)])
+
+    # Nothing changed: the same plan
+    assert discovery.plan() is plan
+
+    write(dynamic, 'http: [not, a, mapping')
+    broken = discovery.plan()
+    assert broken.version == plan.version + 1
+    # The unreadable file keeps its last good version
+    assert broken.checks == plan.checks
+
+    custom_list.unlink()
+    without_records = discovery.plan()
+    assert ('dns', 'nas.lan') not in {(spec.kind, spec.target) for spec in without_records.checks}
+    assert without_records.files == [str(dynamic)]
+
+
+def test_backend_checks_run_through_the_probe_context():
+    server = HTTPStandIn().start()
+    context = ProbeContext(timeout=2)
+    try:
+        target = f'127.0.0.1:{server.port}'
+        for spec in (CheckSpec('web', 'backend', 'backend', f'http://{target}/'),
+                     CheckSpec('db', 'backend', 'backend', target)):
+            (status, message), timing = build_check(spec, context).func()
+            assert status, message
+            assert timing['total_ms'] > 0
+    finally:
+        context.close()
+        server.stop()
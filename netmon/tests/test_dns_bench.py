@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+import dns_bench
+from standins import DNSStandIn
+
+NAMES = ['www.terrerov.com', 'traefik.terrerov.com', 'db.terrerov.com', 'monitor.terrerov.com']
+
+
+@pytest.fixture
+def server():
+    server = DNSStandIn(delay=0.001, miss_delay=0.02).start()
+    try:
+        yield f'127.0.0.1:{server.port}'
+    finally:
+        server.stop()
+
+
+def test_ramp_is_answered_and_cold_queries_are_slower(server):
+    report = dns_bench.run(server, NAMES, [50, 100], step_duration=1, timeout=1, seed=1)
+
+    assert [step['target_qps'] for step in report['steps']] == [50, 100]
+    assert report['sent'] > 100
+    assert report['answered'] == report['sent']
+    assert report['timeouts'] == report['failed'] == report['throttled'] == 0
+    assert any(step['loss'] == 0 for step in report['steps'])
+    assert report['sustained_qps'] > 0
+    # Every cold query paid the stand-in's miss delay
+    assert report['cold_p50_ms'] >= 20
+    assert report['cold_p50_ms'] > report['warm_p50_ms']
+
+
+def test_qps_ramp():
+    assert dns_bench.qps_ramp(50, 1000, 5) == [50.0, 287.5, 525.0, 762.5, 1000.0]
+    assert dns_bench.qps_ramp(50, 1000, 1) == [1000.0]
+
+
+def test_main_parses_qps(server, capsys):
+    assert dns_bench.main(['--server', server, '--qps', '20:40:2', '--step-duration', '0.5',
+                           '--names', ','.join(NAMES), '--seed', '1']) == 0
+    report = json.loads(capsys.readouterr().out)[server]
+    assert [step['target_qps'] for step in report['steps']] == [20, 40]
+
+    assert dns_bench.main(['--server', server, '--qps', '30', '--step-duration', '0.5',
+                           '--names', NAMES[0]]) == 0
+    report = json.loads(capsys.readouterr().out)[server]
+    assert [step['target_qps'] for step in report['steps']] == [30]
+
+    with pytest.raises(SystemExit):
+        dns_bench.main(['--qps', '20:40'])
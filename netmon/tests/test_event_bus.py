@@ -0,0 +1,55 @@
+import event_bus
+from event_bus import EventBus
+
+
+def make_bus(**kwargs):
+    frames = []
+    bus = EventBus(lambda name, frame: frames.append((name, frame)), **kwargs)
+    return bus, frames
+
+
+def test_events_are_batched_once_started():
+    # The flush loop is never actually run; the test flushes by hand
+    bus, frames = make_bus(start_background_task=lambda run: None)
+    # Before the flush loop runs every event goes out on its own
+    assert bus.publish('new_error', {'id': 1}) == 1
+    assert [frame['to'] for _, frame in frames] == [1]
+
+    bus.start()
+    for i in range(event_bus.MAX_FRAME_EVENTS + 10):
+        bus.publish('change', {'id': i})
+    assert len(frames) == 1
+    bus.flush()
+    assert [name for name, _ in frames] == ['events'] * 3
+    assert [(frame['from'], frame['to']) for _, frame in frames[1:]] == \
+        [(2, event_bus.MAX_FRAME_EVENTS + 1), (event_bus.MAX_FRAME_EVENTS + 2, event_bus.MAX_FRAME_EVENTS + 11)]
+    assert all(frame['epoch'] == bus.epoch for _, frame in frames)
+    bus.flush()
+    assert len(frames) == 3
+
+
+def test_since_replays_only_what_history_still_holds():
+    bus, _ = make_bus(history_size=3)
+    for i in range(5):
+        bus.publish('change', {'id': i})
+    assert bus.since(5) == []
+    assert [item['seq'] for item in bus.since(2)] == [3, 4, 5]
+    # Event 2 has been dropped from history, so the client must reload
+    assert bus.since(1) is None
+
+
+def test_snapshot_resumes_from_a_sequence_in_the_same_epoch(netmon_app):
+    app = netmon_app
+    client = app.app.test_client()
+    seq = app.bus.publish('test_event', {'value': 'resume'})
+
+    resumed = client.get(f'/api/snapshot?since={seq - 1}&epoch={app.bus.epoch}').get_json()
+    assert resumed['seq'] == seq and 'snapshot' not in resumed
+    assert [event['data'] for event in resumed['events']] == [{'value': 'resume'}]
+
+    caught_up = client.get(f'/api/snapshot?since={seq}&epoch={app.bus.epoch}').get_json()
+    assert caught_up['events'] == [] and caught_up['seq'] == seq
+
+    # A sequence from an earlier process means nothing here
+    reloaded = client.get(f'/api/snapshot?since={seq - 1}&epoch=stale').get_json()
+    assert reloaded['epoch'] == app.bus.epoch and 'snapshot' in reloaded
@@ -0,0 +1,10 @@
+import export
+
+
+def test_time_columns_lead_an_index():
+    # chunks() finds the id range of a time window through these indexes
+    from app import db
+    tables = db.metadata.tables
+    for name, column in export.TIME_COLUMNS.items():
+        leading = {index.columns[0].name for index in tables[name].indexes}
+        assert column in leading, f'{name}.{column} has no index of its own'
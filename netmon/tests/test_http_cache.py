@@ -0,0 +1,56 @@
+import json
+
+import http_cache
+
+
+def add_change(app, *targets):
+    rows = [app.ChangeLog(type='host_up', target=target, severity='info', detail=json.dumps({}))
+            for target in targets]
+    app.writer.submit(lambda session: session.add_all(rows)).result(5)
+
+
+def version(app, table):
+    with app.app.app_context():
+        row = app.db.session.get(app.TableVersion, table)
+        return row.version if row else 0
+
+
+def test_unchanged_responses_are_answered_with_304(netmon_app):
+    app = netmon_app
+    client = app.app.test_client()
+    add_change(app, 'cache-1')
+
+    first = client.get('/api/changes')
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and etag.startswith('W/')
+    assert first.headers['Cache-Control'] == 'no-cache'
+    assert client.get('/api/changes', headers={'If-None-Match': etag}).status_code == 304
+    # Another query string is another resource
+    assert client.get('/api/changes?limit=1', headers={'If-None-Match': etag}).status_code == 200
+
+    before = version(app, 'change_log')
+    add_change(app, 'cache-2')
+    assert version(app, 'change_log') == before + 1
+    second = client.get('/api/changes', headers={'If-None-Match': etag})
+    assert second.status_code == 200 and second.headers['ETag'] != etag
+    assert second.get_json()[0]['target'] == 'cache-2'
+
+
+def test_large_responses_are_compressed(netmon_app):
+    app = netmon_app
+    add_change(app, *(f'compress-{i}' for i in range(30)))
+    response = netmon_app.app.test_client().get('/api/changes', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+
+def test_versions_are_bumped_without_an_upsert(netmon_app, monkeypatch):
+    # Databases without ON CONFLICT get an update, then an insert
+    app = netmon_app
+    monkeypatch.setattr(http_cache, 'UPSERT_DIALECTS', {})
+    with app.app.app_context():
+        app.db.session.query(app.TableVersion).filter_by(name='change_log').delete()
+        app.db.session.commit()
+    add_change(app, 'fallback-1')
+    assert version(app, 'change_log') == 1
+    add_change(app, 'fallback-2')
+    assert version(app, 'change_log') == 2
@@ -0,0 +1,49 @@
+import json
+import time
+
+import latency_store
+from latency_store import LatencyStore
+
+
+def test_closed_minutes_are_drained_once():
+    store = LatencyStore(bucket_seconds=60)
+    store.record('nginx', 'access', True, {'ttfb_ms': 10.0}, timestamp=120.0)
+    store.record('nginx', 'access', False, {'ttfb_ms': 30.0}, timestamp=150.0)
+    store.record('nginx', 'access', True, {'ttfb_ms': 20.0}, timestamp=185.0)
+
+    closed = store.drain(now=185.0)
+    assert [(service, test, start, bucket.samples, bucket.failures)
+            for service, test, start, bucket in closed] == [('nginx', 'access', 120.0, 2, 1)]
+    assert store.drain(now=185.0) == []
+    # The open minute is still served from memory
+    assert [(start, bucket.samples) for _, _, start, bucket in store.pending()] == [(180.0, 1)]
+    assert len(store.samples('nginx')['access']) == 3
+
+
+def test_sketch_quantiles_stay_within_the_relative_error():
+    sketch = latency_store.Sketch()
+    for value in range(1, 1001):
+        sketch.add(float(value))
+    assert abs(sketch.quantile(0.5) - 500) <= 500 * 2 * latency_store.RELATIVE_ACCURACY
+    merged = latency_store.Sketch.from_dict(json.loads(json.dumps(sketch.to_dict()))).merge(sketch)
+    assert merged.count == 2000
+
+
+def test_recorded_probes_are_persisted(netmon_app):
+    app = netmon_app
+    app.record_probe_results([
+        {'service': 'persisted', 'test_name': 'check', 'status': 'PASS', 'ttfb_ms': 12.0},
+        {'service': 'persisted', 'test_name': 'check', 'status': 'FAIL', 'ttfb_ms': 40.0},
+    ], vantage='agent-1')
+    # Two minutes on, the minute they went into is closed
+    app.persist_latency(now=time.time() + 120).result(5)
+
+    with app.app.app_context():
+        rows = app.ProbeLatency.query.filter_by(service='persisted').all()
+        assert [(row.test_name, row.samples, row.failures) for row in rows] == [('check@agent-1', 2, 1)]
+        assert set(json.loads(rows[0].sketches)) == {'ttfb_ms'}
+    assert not [key for key in app.latency.pending() if key[0] == 'persisted']
+
+    summary = app.app.test_client().get('/api/probes/latency?service=persisted').get_json()
+    check = summary['services']['persisted']['checks']['check@agent-1']
+    assert (check['samples'], check['failures']) == (2, 1)
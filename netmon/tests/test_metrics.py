@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+
+from metrics import Profiler
+
+
+def busy(n=2000):
+    return sum(i * i for i in range(n))
+
+
+def test_interleaved_spans_on_one_thread_profile_only_the_first():
+    profiler = Profiler()
+    profiler.start()
+    # What two greenlets sharing an OS thread look like: B starts while A
+    # is active and A ends first
+    first, second = profiler.span('a'), profiler.span('b')
+    first.__enter__()
+    second.__enter__()
+    busy()
+    first.__exit__(None, None, None)
+    second.__exit__(None, None, None)
+
+    assert list(profiler.report()) == ['a']
+    # The thread is free again for the next span
+    with profiler.span('c'):
+        busy()
+    assert sorted(profiler.report()) == ['a', 'c']
+
+
+def test_spans_on_separate_threads_are_profiled_separately():
+    profiler = Profiler()
+    profiler.start()
+    started = threading.Barrier(2)
+
+    def run(name):
+        with profiler.span('job', {'job': name}):
+            started.wait(5)
+            busy()
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in ('x', 'y')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert sorted(profiler.report()) == ['job job=x', 'job job=y']
+
+
+def test_report_rejects_unknown_sort_orders():
+    profiler = Profiler()
+    with pytest.raises(ValueError):
+        profiler.report(sort='nonsense')
+
+
+def test_profiling_needs_the_admin_token(netmon_app, monkeypatch):
+    app = netmon_app
+    client = app.app.test_client()
+    monkeypatch.setattr(app, 'ADMIN_TOKEN', None)
+    assert client.get('/api/profiling').status_code == 403
+    monkeypatch.setattr(app, 'ADMIN_TOKEN', 'admin')
+    assert client.get('/api/profiling').status_code == 401
+    response = client.get('/api/profiling', headers={'Authorization': 'Bearer admin'})
+    assert response.status_code == 200 and response.get_json()['enabled'] is False
+    assert client.get('/api/profiling?sort=nonsense', headers={'Authorization': 'Bearer admin'}).status_code == 400
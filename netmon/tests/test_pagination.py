@@ -0,0 +1,49 @@
+def test_keyset_cursors_page_back_and_poll_forward(netmon_app):
+    app = netmon_app
+    client = app.app.test_client()
+
+    def add_runs(count):
+        # Run payloads carry no id, so the detail records it
+        runs = [app.JobRun(job='keyset-test', duration=0.1, outcome='ok') for _ in range(count)]
+
+        def store(session):
+            session.add_all(runs)
+            session.flush()
+            for run in runs:
+                run.detail = str(run.id)
+        app.writer.submit(store).result(5)
+        return [run.id for run in runs]
+
+    def page(query):
+        response = client.get(f'/api/jobs/keyset-test/runs?{query}')
+        assert response.status_code == 200
+        return [int(run['detail']) for run in response.get_json()], response.headers.get('X-Next-Cursor')
+
+    ids = add_runs(5)
+    newest_first = ids[::-1]
+
+    first, cursor = page('limit=2')
+    assert first == newest_first[:2] and cursor == str(first[-1])
+    second, cursor = page(f'limit=2&cursor={cursor}')
+    assert second == newest_first[2:4]
+    last, cursor = page(f'limit=2&cursor={cursor}')
+    # The final page has no cursor to follow
+    assert last == newest_first[4:] and cursor is None
+
+    # Polling from the newest id seen returns only rows added since, oldest first
+    added = add_runs(3)
+    polled, cursor = page(f'since={ids[-1]}&limit=2')
+    assert polled == added[:2] and cursor == str(added[1])
+    polled, cursor = page(f'since={cursor}')
+    assert polled == added[2:] and cursor == str(added[2])
+    # Nothing new: the cursor stays where it was
+    assert page(f'since={cursor}') == ([], cursor)
+
+
+def test_page_size_is_capped(netmon_app):
+    app = netmon_app
+    runs = [app.JobRun(job='keyset-cap', duration=0.1, outcome='ok') for _ in range(app.MAX_PAGE_SIZE + 1)]
+    app.writer.submit(lambda session: session.add_all(runs)).result(5)
+    response = app.app.test_client().get('/api/jobs/keyset-cap/runs?limit=100000')
+    assert len(response.get_json()) == app.MAX_PAGE_SIZE
+    assert response.headers['X-Next-Cursor'] == str(runs[1].id)
@@ -0,0 +1,64 @@
+import pytest
+
+from probe_context import ProbeContext
+from standins import HTTPStandIn, self_signed_cert
+
+
+@pytest.fixture
+def context():
+    context = ProbeContext(timeout=5)
+    try:
+        yield context
+    finally:
+        context.close()
+
+
+def timed_get(context, url, **kwargs):
+    response, timing = context.timed(lambda: context.get(url, **kwargs))()
+    assert response.status_code == 200
+    return timing
+
+
+def test_keep_alive_skips_connection_setup(context):
+    server = HTTPStandIn(delay=0.02).start()
+    try:
+        first = timed_get(context, server.url)
+        second = timed_get(context, server.url)
+    finally:
+        server.stop()
+
+    assert first['connections'] == 1 and first['connect_ms'] > 0
+    assert second['connections'] == 0
+    assert second['dns_ms'] == second['connect_ms'] == second['tls_ms'] == 0
+    # The stand-in's delay is the service's own latency
+    assert first['ttfb_ms'] >= 20 and second['ttfb_ms'] >= 20
+    assert second['total_ms'] >= second['ttfb_ms']
+
+
+def test_tls_handshake_is_timed_apart(context, tmp_path):
+    certfile = self_signed_cert(str(tmp_path))
+    if certfile is None:
+        pytest.skip('openssl is not installed')
+    server = HTTPStandIn(certfile=certfile).start()
+    try:
+        first = timed_get(context, server.url, verify=certfile)
+        second = timed_get(context, server.url, verify=certfile)
+    finally:
+        server.stop()
+
+    assert first['tls_ms'] > 0 and first['connections'] == 1
+    assert second['tls_ms'] == 0 and second['connections'] == 0
+
+
+def test_untimed_requests_and_resolvers_are_reused(context):
+    server = HTTPStandIn().start()
+    try:
+        # Outside timed() nothing is recorded, and nothing breaks
+        assert context.get(server.url).status_code == 200
+    finally:
+        server.stop()
+
+    resolver = context.resolver('172.20.0.10')
+    assert context.resolver('172.20.0.10') is resolver
+    assert resolver.nameservers == ['172.20.0.10']
+    assert context.resolver('172.20.0.11') is not resolver
@@ -0,0 +1,49 @@
+import threading
+import time
+
+from probe_engine import Check, ProbeEngine
+
+
+def test_checks_run_concurrently_and_keep_their_order():
+    barrier = threading.Barrier(3)
+
+    def check(value):
+        def run():
+            # Only returns when all three run at once
+            barrier.wait(2)
+            return value
+        return run
+
+    outcomes = ProbeEngine(max_workers=3).run([Check('s', str(i), check(i)) for i in range(3)])
+    assert [outcome.value for outcome in outcomes] == [0, 1, 2]
+    assert not any(outcome.timed_out or outcome.error for outcome in outcomes)
+
+
+def test_errors_are_reported_per_check():
+    def broken():
+        raise RuntimeError('boom')
+
+    ok, failed = ProbeEngine().run([Check('s', 'ok', lambda: 1), Check('s', 'broken', broken)])
+    assert ok.value == 1 and ok.error is None
+    assert isinstance(failed.error, RuntimeError) and failed.message == 'Error: boom'
+
+
+def test_a_hung_check_times_out_without_holding_up_the_rest():
+    release = threading.Event()
+    started = time.monotonic()
+    hung, quick = ProbeEngine(check_timeout=0.2, sweep_timeout=5).run([
+        Check('s', 'hung', lambda: release.wait(5)), Check('s', 'quick', lambda: 'done')])
+    release.set()
+    assert time.monotonic() - started < 1
+    assert hung.timed_out and 'timed out after 0.2s' in hung.message
+    assert quick.value == 'done'
+
+
+def test_the_sweep_deadline_covers_checks_still_queued():
+    release = threading.Event()
+    started = time.monotonic()
+    outcomes = ProbeEngine(max_workers=1, check_timeout=5, sweep_timeout=0.2).run([
+        Check('s', 'hung', lambda: release.wait(5)), Check('s', 'queued', lambda: 'never')])
+    release.set()
+    assert time.monotonic() - started < 1
+    assert all(outcome.timed_out and 'sweep deadline' in outcome.message for outcome in outcomes)
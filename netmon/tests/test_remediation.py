@@ -0,0 +1,173 @@
+from enhanced_service_tests import ErrorSeverity, ServiceTester
+from probe_engine import Check
+from remediation import CircuitBreaker, RemediationEngine, ServiceGraph
+
+GRAPH = ServiceGraph({'traefik': [], 'nginx': ['traefik'], 'bind9': [], 'pihole': ['bind9']})
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeContainer:
+    """Reports ``statuses`` one per reload() after a restart, then stays on the last."""
+
+    def __init__(self, service, statuses=('starting', 'healthy'), log=None):
+        self.service = service
+        self.statuses = list(statuses)
+        self.log = log if log is not None else []
+        self.attrs = {'State': {'Status': 'running', 'Health': {'Status': 'unhealthy'}}}
+        self.pending = []
+
+    def restart(self):
+        self.log.append(self.service)
+        self.pending = list(self.statuses)
+
+    def reload(self):
+        if self.pending:
+            self.attrs['State']['Health']['Status'] = self.pending.pop(0)
+
+
+class FakeDocker:
+    def __init__(self, containers):
+        self.by_service = {container.service: [container] for container in containers}
+        self.containers = self
+
+    def list(self, all=False, filters=None):
+        service = filters['label'][0].split('=', 1)[1]
+        return self.by_service.get(service, [])
+
+
+def engine(containers, clock=None, **kwargs):
+    clock = clock or FakeClock()
+    return RemediationEngine(FakeDocker(containers), GRAPH, project=None, poll_interval=1.0,
+                             clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_waves_put_dependencies_first():
+    assert GRAPH.waves(['nginx', 'traefik', 'pihole']) == [['pihole', 'traefik'], ['nginx']]
+    assert GRAPH.waves(['nginx', 'pihole']) == [['nginx', 'pihole']]
+    # A cycle still comes out, in one last wave
+    assert ServiceGraph({'a': ['b'], 'b': ['a']}).waves(['a', 'b']) == [['a', 'b']]
+
+
+def test_breaker_budget_ages_out_of_the_window():
+    clock = FakeClock()
+    breaker = CircuitBreaker(budget=2, window=60, clock=clock)
+    assert breaker.acquire()
+    clock.now = 10
+    assert breaker.acquire()
+    assert not breaker.acquire()
+    assert breaker.open
+    assert breaker.retry_in() == 50
+
+    clock.now = 60
+    assert not breaker.open
+    assert breaker.acquire()
+    assert not breaker.acquire()
+
+
+def test_restart_waits_for_health_and_stops_at_the_budget():
+    clock = FakeClock()
+    container = FakeContainer('nginx', ['starting', 'starting', 'healthy'])
+    remediator = engine([container], clock, budget=1)
+
+    result = remediator.restart('nginx')
+    assert result.outcome == 'healthy' and result.ok
+    # Two polls came back starting: slept 1s, then 2s
+    assert result.duration == 3.0
+
+    assert remediator.restart('nginx').outcome == 'open'
+    assert container.log == ['nginx']
+
+
+def test_restart_gives_up_at_the_health_timeout():
+    container = FakeContainer('nginx', ['starting'])
+    result = engine([container], health_timeout=10).restart('nginx')
+    assert result.outcome == 'unhealthy'
+    assert result.duration == 10.0
+
+
+def test_dependents_of_an_unhealthy_service_are_blocked():
+    log = []
+    containers = [FakeContainer('traefik', ['unhealthy'], log), FakeContainer('nginx', log=log),
+                  FakeContainer('bind9', log=log)]
+    results = engine(containers).remediate(['bind9', 'traefik'], cascade=['traefik'])
+
+    assert results['traefik'].outcome == 'unhealthy'
+    assert results['nginx'].outcome == 'blocked'
+    assert 'traefik' in results['nginx'].message
+    assert results['bind9'].ok
+    assert sorted(log) == ['bind9', 'traefik']
+
+
+def fake_check(service, test_name, failures):
+    """A check that fails with ``failures`` in turn, then passes."""
+    failures = list(failures)
+
+    def run():
+        return (failures.pop(0) if failures else None), {'total_ms': 1.0}
+    return Check(service, test_name, run)
+
+
+def make_tester(checks, containers):
+    tester = ServiceTester()
+    tester.checks = lambda: checks
+    tester._remediation = engine(containers)
+    return tester
+
+
+def test_remediate_rechecks_only_what_failed_on_recovered_services():
+    log = []
+    down = ('connection_error', 'refused', ErrorSeverity.MODERATE)
+    calls = []
+    checks = [
+        fake_check('nginx', 'internal_access', [down]),
+        fake_check('postgresql', 'connection', [down, down]),
+        Check('bind9', 'internal_resolution', lambda: calls.append(1) or (None, {})),
+    ]
+    containers = [FakeContainer('nginx', log=log), FakeContainer('postgres', ['unhealthy'], log)]
+    results, errors = make_tester(checks, containers).run_all_tests()
+
+    # The compose name is used for the restart
+    assert sorted(log) == ['nginx', 'postgres']
+    resolved = {error.service: error.resolved for error in errors}
+    assert resolved == {'nginx': True, 'postgresql': False}
+    rechecks = [result['test_name'] for result in results if result['test_name'].endswith('_recheck')]
+    assert rechecks == ['internal_access_recheck']
+    # Passing checks are not run again
+    assert len(calls) == 1
+
+
+def test_critical_connection_error_restarts_dependents():
+    log = []
+    down = ('connection_error', 'refused', ErrorSeverity.CRITICAL)
+    checks = [fake_check('traefik', 'http_redirect', [down])]
+    containers = [FakeContainer('traefik', log=log), FakeContainer('nginx', log=log)]
+    results, errors = make_tester(checks, containers).run_all_tests()
+
+    assert log == ['traefik', 'nginx']
+    assert [error.resolved for error in errors] == [True]
+
+
+def test_a_missing_compose_file_is_reported(tmp_path):
+    graph = ServiceGraph.from_compose(str(tmp_path / 'docker-compose.yml'))
+    assert graph.dependencies == {} and 'NETMON_COMPOSE_FILE' in graph.error
+
+    tester = ServiceTester()
+    assert tester.remediation_warning() is None
+    tester._remediation = RemediationEngine(FakeDocker([]), graph, project=None)
+    assert 'compose file not readable' in tester.remediation_warning()
+
+
+def test_the_shipped_compose_file_has_the_dependencies():
+    graph = ServiceGraph.from_compose()
+    assert graph.error is None
+    assert 'traefik' in graph.ancestors('nginx')
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import retention
+
+
+def sample(download, upload=None, ping=None, jitter=None):
+    return SimpleNamespace(download_speed=download, upload_speed=upload, ping=ping, jitter=jitter)
+
+
+def test_ranges_and_resolutions():
+    assert retention.parse_range('36h') == timedelta(hours=36)
+    assert retention.parse_range('2w') == timedelta(weeks=2)
+    for value in ('', '10', '5m', 'd'):
+        with pytest.raises(ValueError):
+            retention.parse_range(value)
+    assert retention.default_resolution(timedelta(days=2)) == 'raw'
+    assert retention.default_resolution(timedelta(days=30)) == '1h'
+    assert retention.default_resolution(timedelta(days=90)) == '1d'
+
+
+def test_bucket_start():
+    moment = datetime(2026, 3, 4, 15, 42, 7, 123)
+    assert retention.bucket_start(moment, '1h') == datetime(2026, 3, 4, 15)
+    assert retention.bucket_start(moment, '1d') == datetime(2026, 3, 4)
+    with pytest.raises(ValueError):
+        retention.bucket_start(moment, '1w')
+
+
+def test_nearest_rank_percentile():
+    values = list(range(1, 21))
+    assert retention.percentile(values, 95) == 19
+    assert retention.percentile(values, 100) == 20
+    assert retention.percentile([7], 95) == 7
+    assert retention.percentile([], 95) is None
+
+
+def test_aggregate_skips_missing_values():
+    stats = retention.aggregate([sample(10, ping=5), sample(30), sample(20, ping=15)])
+    assert stats['samples'] == 3
+    assert (stats['download_speed_min'], stats['download_speed_max'], stats['download_speed_mean']) == (10, 30, 20)
+    assert stats['download_speed_p95'] == 30
+    assert stats['ping_mean'] == 10
+    assert stats['upload_speed_mean'] is None and stats['upload_speed_p95'] is None
+
+
+def test_rollups_follow_new_samples_and_pruning_keeps_daily(netmon_app):
+    app = netmon_app
+    day = datetime(2020, 5, 1)
+
+    def store(*tests):
+        rows = [app.SpeedTest(timestamp=ts, download_speed=speed, upload_speed=1, ping=1) for ts, speed in tests]
+        app.writer.submit(lambda session: app.store_speed_tests(session, rows)).result(5)
+
+    def rollup(resolution, bucket):
+        with app.app.app_context():
+            return app.SpeedTestRollup.query.filter_by(resolution=resolution, bucket=bucket).first()
+
+    store((day.replace(hour=9, minute=5), 100), (day.replace(hour=9, minute=50), 50))
+    store((day.replace(hour=10, minute=1), 30))
+    hourly = rollup('1h', day.replace(hour=9))
+    assert (hourly.samples, hourly.download_speed_min, hourly.download_speed_mean) == (2, 50, 75)
+    daily = rollup('1d', day)
+    assert (daily.samples, daily.download_speed_max, daily.download_speed_mean) == (3, 100, 60)
+
+    # Past their retention, raw samples and hourly rollups go; daily ones stay
+    app.prune_history()
+    app.writer.submit(lambda session: None).result(5)
+    with app.app.app_context():
+        assert app.SpeedTest.query.filter(app.SpeedTest.timestamp < day + timedelta(days=1)).count() == 0
+    assert rollup('1h', day.replace(hour=9)) is None
+    assert rollup('1d', day).samples == 3
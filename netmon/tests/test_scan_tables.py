@@ -0,0 +1,75 @@
+import gzip
+from datetime import datetime
+
+from scan_parser import diff_host, parse_nmap_text, summarize
+
+NMAP_OUTPUT = """Starting Nmap 7.94
+Nmap scan report for web.lan (10.3.0.5)
+Host is up (0.0010s latency).
+PORT    STATE  SERVICE VERSION
+22/tcp  open   ssh     OpenSSH 9.6
+80/tcp  open   http    nginx 1.25
+443/tcp closed https
+Nmap scan report for 10.3.0.6
+Host seems down.
+"""
+
+
+def host(address, *ports, state='up', service='http', version=''):
+    return {'host': address, 'state': state, 'hostname': '',
+            'ports': [{'port': port, 'protocol': 'tcp', 'state': 'open', 'service': service, 'version': version}
+                      for port in ports]}
+
+
+def test_parse_nmap_text():
+    web, down = parse_nmap_text(NMAP_OUTPUT)
+    assert (web['host'], web['hostname'], web['state']) == ('10.3.0.5', 'web.lan', 'up')
+    assert [(p['port'], p['state'], p['service'], p['version']) for p in web['ports']] == [
+        (22, 'open', 'ssh', 'OpenSSH 9.6'), (80, 'open', 'http', 'nginx 1.25'), (443, 'closed', 'https', '')]
+    assert (down['host'], down['state'], down['ports']) == ('10.3.0.6', 'down', [])
+    assert summarize([web, down]) == '1 hosts up, 2 open ports'
+
+
+def test_diff_host():
+    diff = diff_host(host('10.3.0.5', 22, 80), host('10.3.0.5', 80, 443))
+    assert (diff['opened_ports'], diff['closed_ports']) == ([443], [22])
+    assert diff_host(None, host('10.3.0.5', 80))['previous_state'] is None
+    upgraded = diff_host(host('10.3.0.5', 80, version='1.0'), host('10.3.0.5', 80, version='1.1'))
+    assert upgraded['changed_services'] == [{'port': 80, 'service': 'http', 'version': '1.1'}]
+    assert diff_host(host('10.3.0.5', 80), host('10.3.0.5', state='down'))['closed_ports'] == [80]
+
+
+def store(app, hosts, timestamp, raw=None):
+    scan = app.NetworkScan(scan_type='nmap', target='10.3.0.0/24', result=summarize(hosts), timestamp=timestamp)
+
+    def write(session):
+        session.add(scan)
+        session.flush()
+        app.store_scan_hosts(scan, hosts)
+        if raw is not None:
+            session.add(app.ScanOutput(scan_id=scan.id, data=gzip.compress(raw.encode())))
+        return scan.id
+    return app.writer.submit(write).result(5)
+
+
+def test_host_history_and_port_exposure(netmon_app):
+    app = netmon_app
+    store(app, [host('10.3.0.5', 22, 80), host('10.3.0.7', 80)], datetime(2026, 1, 1))
+    scan_id = store(app, [host('10.3.0.5', 80, 443)], datetime(2026, 1, 2), raw=NMAP_OUTPUT)
+    client = app.app.test_client()
+
+    changes = client.get('/api/hosts/10.3.0.5/changes').get_json()['changes']
+    assert [(c['opened_ports'], c['closed_ports']) for c in changes] == [([443], [22]), ([22, 80], [])]
+    assert changes[0]['scan_id'] == scan_id
+
+    # Only each host's latest snapshot counts
+    def exposed(port):
+        return [row['host'] for row in client.get(f'/api/ports/{port}/hosts').get_json()
+                if row['host'].startswith('10.3.')]
+    assert exposed(80) == ['10.3.0.5', '10.3.0.7']
+    assert exposed(22) == []
+
+    assert client.get(f'/api/network-scans/{scan_id}/raw').get_data(as_text=True) == NMAP_OUTPUT
+    compressed = client.get(f'/api/network-scans/{scan_id}/raw', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.get_data()).decode() == NMAP_OUTPUT
@@ -0,0 +1,60 @@
+import socket
+
+import pytest
+
+from scanner import Scanner, parse_ports
+
+
+@pytest.fixture
+def listener():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(16)
+    yield sock
+    sock.close()
+
+
+def closed_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_parse_ports():
+    assert parse_ports('22, 80-82,443') == [22, 80, 81, 82, 443]
+    assert parse_ports('') == parse_ports(None) != []
+
+
+def test_rescans_only_hosts_whose_ports_changed(listener):
+    port = listener.getsockname()[1]
+    scanner = Scanner(ports=[port, closed_port()], concurrency=8, timeout=0.2, full_every=100)
+
+    first = scanner.run('127.0.0.1/32')
+    assert first['full']
+    [host] = first['hosts']
+    assert host['state'] == 'up' and [p['port'] for p in host['ports']] == [port]
+    assert first['changed'] == [host] and first['fingerprinted_ports'] == 1
+    assert first['diffs'][0]['opened_ports'] == [port]
+
+    # Known ports still answer: no port scan, nothing changed
+    second = scanner.run('127.0.0.1/32')
+    assert not second['full']
+    assert second['changed'] == [] and second['port_scanned_hosts'] == 0
+
+    listener.close()
+    third = scanner.run('127.0.0.1/32')
+    assert third['port_scanned_hosts'] == 1 and third['fingerprinted_ports'] == 0
+    assert third['changed'][0]['ports'] == []
+    assert third['diffs'][0]['closed_ports'] == [port]
+
+
+def test_previous_state_comes_from_storage_or_agents():
+    scanner = Scanner(ports=[closed_port()], timeout=0.2)
+    scanner.load_previous([{'host': '127.0.0.1', 'state': 'up', 'hostname': '', 'ports': []}])
+    scanner.remember([{'host': '10.0.0.1', 'state': 'up', 'hostname': '', 'ports': []}])
+    assert sorted(scanner.known()) == ['10.0.0.1', '127.0.0.1']
+    # The rotation starts with a full scan, then every full_every runs
+    rotation = Scanner(full_every=3)
+    assert [rotation.rotate() for _ in range(4)] == [True, False, False, True]
@@ -0,0 +1,31 @@
+import threading
+import time
+
+import scheduler
+from scheduler import Job, JobScheduler
+
+
+def test_a_run_stuck_in_python_is_abandoned(monkeypatch):
+    monkeypatch.setattr(scheduler, 'KILL_GRACE', 0.1)
+    release = threading.Event()
+    runs = []
+    jobs = JobScheduler(on_finish=runs.append)
+    # Blocks in Python, where killing subprocesses does not reach it
+    job = jobs.add(Job('stuck', lambda: release.wait(10), interval=60, max_runtime=0.2))
+
+    started = time.monotonic()
+    jobs._run(job, 'manual')
+    assert time.monotonic() - started < 2
+    assert runs[-1]['outcome'] == 'timeout'
+    assert 'abandoned' in runs[-1]['detail']
+    assert not job.running
+
+    # The job does not overlap the run it left behind
+    jobs._run(job, 'manual')
+    assert runs[-1]['outcome'] == 'skipped'
+
+    release.set()
+    job.abandoned.join(2)
+    jobs._run(job, 'manual')
+    assert runs[-1]['outcome'] == 'success'
+    assert job.abandoned is None
@@ -0,0 +1,57 @@
+import pytest
+
+import search
+
+
+def test_match_expression():
+    assert search.match_expression('timeout 172.20.0.5') == '"timeout" "172.20.0.5"'
+    assert search.match_expression('"connection refused" dns*') == '"connection refused" "dns"*'
+    assert search.match_expression('OR nginx OR OR traefik OR') == '"nginx" OR "traefik"'
+    # An unmatched quote is just a character
+    assert search.match_expression('say "hi') == '"say" """hi"'
+    assert search.match_expression('  ** ') == ''
+
+
+def test_highlight_escapes_around_the_marks():
+    snippet = f'<b>{search.MATCH_START}timeout{search.MATCH_END}</b>'
+    assert search.highlight(snippet) == '&lt;b&gt;<mark>timeout</mark>&lt;/b&gt;'
+
+
+@pytest.fixture
+def searchable(netmon_app):
+    with netmon_app.app.app_context():
+        if not search.ensure_index(netmon_app.db.engine):
+            pytest.skip('SQLite without FTS5')
+    return netmon_app
+
+
+def test_index_follows_inserts_updates_and_deletes(searchable):
+    app = searchable
+    client = app.app.test_client()
+    rows = [app.ErrorLog(error_type='connection_error', description='quokka gateway refused'),
+            app.ErrorLog(error_type='dns_error', description='nothing here', ai_analysis='maybe a quokka')]
+    app.writer.submit(lambda session: session.add_all(rows)).result(5)
+
+    def found(query, **params):
+        response = client.get('/api/search', query_string=dict(params, q=query, source='error_log'))
+        assert response.status_code == 200
+        return [result['id'] for result in response.get_json()['results']]
+
+    # A match in the description outranks one in the AI analysis
+    assert found('quokka') == [rows[0].id, rows[1].id]
+    assert found('quokka', type='dns_error') == [rows[1].id]
+    body = client.get('/api/search?q=quokka&source=error_log').get_json()
+    assert '<mark>quokka</mark>' in body['results'][0]['snippet']
+
+    def update(session):
+        session.get(app.ErrorLog, rows[0].id).description = 'wombat gateway refused'
+        session.delete(session.get(app.ErrorLog, rows[1].id))
+    app.writer.submit(update).result(5)
+    assert found('quokka') == []
+    assert found('wombat') == [rows[0].id]
+
+
+def test_bad_searches_are_rejected(searchable):
+    client = searchable.app.test_client()
+    assert client.get('/api/search?q=').status_code == 400
+    assert client.get('/api/search?q=x&source=speed_test').status_code == 400
@@ -0,0 +1,83 @@
+import json
+import sqlite3
+import threading
+
+import pytest
+
+from storage import WriteQueue
+
+
+def change(app, target):
+    return app.ChangeLog(type='host_up', target=target, severity='info', detail=json.dumps({}))
+
+
+def committed(app, target):
+    # Through a connection of its own: only committed rows are visible
+    with app.app.app_context():
+        path = app.db.engine.url.database
+    with sqlite3.connect(path) as connection:
+        return connection.execute('SELECT COUNT(*) FROM change_log WHERE target = ?', (target,)).fetchone()[0]
+
+
+@pytest.fixture
+def queue(netmon_app):
+    batches = []
+    writer = WriteQueue(netmon_app.app, netmon_app.db, flush_interval=0.2,
+                        on_batch=lambda size, seconds, ok: batches.append((size, ok)))
+    writer.start()
+    return writer, batches
+
+
+def test_queued_writes_share_one_commit(netmon_app, queue):
+    writer, batches = queue
+    futures = [writer.submit(lambda session, i=i: session.add(change(netmon_app, f'batch-{i}')) or i)
+               for i in range(10)]
+    assert [future.result(5) for future in futures] == list(range(10))
+    assert batches == [(10, True)]
+
+
+def test_a_failing_write_is_replayed_alone(netmon_app, queue):
+    writer, batches = queue
+
+    def broken(session):
+        raise ValueError('bad row')
+
+    good = writer.submit(lambda session: session.add(change(netmon_app, 'replay-1')))
+    bad = writer.submit(broken)
+    other = writer.submit(lambda session: session.add(change(netmon_app, 'replay-2')))
+    good.result(5)
+    other.result(5)
+    with pytest.raises(ValueError):
+        bad.result(5)
+    assert committed(netmon_app, 'replay-1') == committed(netmon_app, 'replay-2') == 1
+    assert batches == [(3, False), (1, True), (1, False), (1, True)]
+
+
+def test_callbacks_run_after_the_commit(netmon_app, queue):
+    writer, _ = queue
+    seen = []
+    done = threading.Event()
+
+    def on_commit(row):
+        seen.append((row.target, committed(netmon_app, row.target)))
+        done.set()
+        raise RuntimeError('a failing callback does not fail the write')
+
+    row = change(netmon_app, 'callback')
+    future = writer.submit(lambda session: session.add(row) or row, on_commit)
+    assert future.result(5) is row and done.wait(5)
+    # The row is still readable after its session closed
+    assert seen == [('callback', 1)] and row.id is not None
+
+
+def test_without_a_writer_thread_writes_inline(netmon_app):
+    writer = WriteQueue(netmon_app.app, netmon_app.db)
+    future = writer.submit(lambda session: session.add(change(netmon_app, 'inline')))
+    assert future.done() and committed(netmon_app, 'inline') == 1
+
+
+def test_sqlite_connections_are_tuned(netmon_app):
+    with netmon_app.app.app_context():
+        with netmon_app.db.engine.connect() as connection:
+            assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+            assert connection.exec_driver_sql('PRAGMA busy_timeout').scalar() == 5000
@@ -0,0 +1,67 @@
+import gzip
+import subprocess
+import sys
+
+import pytest
+
+from scan_parser import GrepableParser
+from scheduler import stream_command
+
+GREPABLE = [
+    '# Nmap 7.94 scan initiated as: nmap -sV -oG - 10.4.0.0/29',
+    'Host: 10.4.0.1 (gw.lan)\tStatus: Up',
+    'Host: 10.4.0.1 (gw.lan)\tPorts: 22/open/tcp//ssh//OpenSSH 9.6|p1/, 80/closed/tcp//http///',
+    'Host: 10.4.0.2 ()\tStatus: Down',
+    'Host: 10.4.0.3 (nas.lan)\tStatus: Up',
+    '# Nmap done at Sat Oct 17 -- 8 IP addresses (2 hosts up) scanned',
+]
+
+
+def test_grepable_hosts_complete_as_their_lines_arrive():
+    parser = GrepableParser()
+    completed = [parser.feed(line) for line in GREPABLE]
+    # A host is done at its Ports line, or when the next host starts
+    assert [[host['host'] for host in hosts] for hosts in completed] == \
+        [[], [], ['10.4.0.1'], [], ['10.4.0.2'], []]
+
+    gateway, down = completed[2][0], completed[4][0]
+    assert gateway['hostname'] == 'gw.lan' and gateway['state'] == 'up'
+    assert gateway['ports'][0] == {'port': 22, 'protocol': 'tcp', 'state': 'open',
+                                   'service': 'ssh', 'version': 'OpenSSH 9.6/p1'}
+    assert gateway['ports'][1]['state'] == 'closed'
+    assert (down['hostname'], down['state']) == ('', 'down')
+
+    rest = parser.finish()
+    assert [(host['host'], host['state'], host['ports']) for host in rest] == [('10.4.0.3', 'up', [])]
+    assert parser.finish() == []
+
+
+def python(code):
+    return [sys.executable, '-c', code]
+
+
+def test_stream_command_bounds_lines_and_stderr():
+    code = ("import sys\n"
+            "print('first'); print('x' * 100); print('last')\n"
+            "for i in range(5): print(f'err {i}', file=sys.stderr)")
+    with stream_command(python(code), max_line=16, stderr_lines=2) as command:
+        lines = list(command)
+    assert lines == ['first', 'x' * 16, 'last']
+    assert command.truncated_lines == 1
+    assert command.stderr == 'err 3\nerr 4'
+    assert command.returncode == 0
+
+
+def test_stream_command_timeout_kills_the_command():
+    with pytest.raises(subprocess.TimeoutExpired):
+        with stream_command(python("import time; print('started', flush=True); time.sleep(30)"),
+                            timeout=0.5) as command:
+            assert list(command) == ['started']
+    assert command.timed_out
+
+
+def test_output_archive_is_gzip_and_truncated(netmon_app):
+    archive = netmon_app.OutputArchive(limit=20)
+    for line in ('0123456789', 'abcdefghij', 'never stored'):
+        archive.add(line)
+    assert gzip.decompress(archive.finish()) == b'0123456789\nabcdefghi\n[output truncated]\n'